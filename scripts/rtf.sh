@@ -3,16 +3,9 @@
 # Change the working directory to the parent directory
 cd "$(dirname "${BASH_SOURCE[0]}")/.."
 
-# Define the directory with the checkpoints
-checkpoints_dir="models"
+# Benchmark all the checkpoints (.pt) in the models directory, results in logs/
+printf "Measuring RTFs of the checkpoints in models/\n"
 
-# Iterate over all .pt (PyTorch checkpoint) files in the directory
-for checkpoint in "$checkpoints_dir"/*.pt; do
-    # Call your test script with the checkpoint file as an argument
-    printf "Measuring RTFs: %s\n" "$checkpoint"
-    
-    # for impulse response measurement uncomment the line below
-    nafx-springrev rtf --checkpoint "$checkpoint" --device cpu
-done
+nafx-springrev benchmark --models_dir models --device cpu
 
-printf "Done!\n"
\ No newline at end of file
+printf "Done!\n"
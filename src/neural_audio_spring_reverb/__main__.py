@@ -15,15 +15,25 @@ def main():
         "action",
         choices=[
             "download",
+            "prepare",
             "train",
+            "sweep",
             "eval",
+            "eval-many",
             "infer",
+            "infer-batch",
             "edit",
             "report",
             "ir",
             "rt60",
+            "distortion",
             "wrap",
-            "rtf"
+            "rtf",
+            "benchmark",
+            "bench-conv",
+            "quantize",
+            "prune",
+            "distill",
         ],
         help="The action to perform, check the doc.",
     )
@@ -43,6 +53,12 @@ def main():
         default="data/raw/",
         help="Where the data will be downloaded to",
     )
+    parser.add_argument(
+        "--cache_dir",
+        type=str,
+        default=None,
+        help="Preprocessed shard cache for egfxset and customset, written by prepare and read by train and eval (default: DATA_DIR/cache)",
+    )
     parser.add_argument(
         "--audio_dir",
         type=str,
@@ -103,6 +119,19 @@ def main():
         help="The number of workers to use for data loading (default: 4)",
     )
 
+    parser.add_argument(
+        "--lazy_load",
+        action="store_true",
+        help="Read springset items from the HDF5 files on demand instead of loading them in memory",
+    )
+
+    parser.add_argument(
+        "--read_ahead",
+        type=int,
+        default=0,
+        help="With --lazy_load, number of consecutive items read at once (default: 0)",
+    )
+
     parser.add_argument(
         "-c",
         "--checkpoint",
@@ -114,7 +143,7 @@ def main():
         "--init",
         type=str,
         default=None,
-        help="Relative path to the YAML file to initialize the model with",
+        help="Relative path to the YAML file to initialize the model with (sweep: configs folder or grid file)",
     )
 
     parser.add_argument(
@@ -122,11 +151,135 @@ def main():
         "--input",
         type=str,
         default=None,
-        help="Relative path to the input audio file",
+        help="Relative path to the input audio file (infer-batch: directory or manifest)",
     )
 
     parser.add_argument("--duration", type=float, default=5.0, help="")
 
+    parser.add_argument(
+        "--distributed",
+        action="store_true",
+        help="Train with DistributedDataParallel on several local processes (gloo backend)",
+    )
+    parser.add_argument(
+        "--world_size",
+        type=int,
+        default=None,
+        help="Number of distributed workers (default: one per GPU, or one per 4 CPU cores)",
+    )
+
+    parser.add_argument(
+        "--calib_batches",
+        type=int,
+        default=16,
+        help="Number of batches used to calibrate quantization and pruning (default: 16)",
+    )
+
+    parser.add_argument(
+        "--prune_ratio",
+        type=float,
+        default=0.25,
+        help="Fraction of the channels removed from every block (default: 0.25)",
+    )
+    parser.add_argument(
+        "--prune_criterion",
+        type=str,
+        default="activation",
+        choices=["activation", "magnitude"],
+        help="Channel ranking used by prune (default: activation)",
+    )
+    parser.add_argument(
+        "--finetune_epochs",
+        type=int,
+        default=10,
+        help="Epochs of fine-tuning after pruning (default: 10)",
+    )
+
+    parser.add_argument(
+        "--jobs",
+        type=int,
+        default=None,
+        help="Number of concurrent sweep runs (default: one per GPU, or one per 4 CPU cores)",
+    )
+
+    parser.add_argument(
+        "--block_sizes",
+        type=int,
+        nargs="+",
+        default=[64, 128, 256, 512, 1024, 2048],
+        help="Streaming block sizes measured by benchmark (default: 64 to 2048)",
+    )
+    parser.add_argument(
+        "--batch_sizes",
+        type=int,
+        nargs="+",
+        default=[1],
+        help="Batch sizes measured by benchmark (default: 1)",
+    )
+    parser.add_argument(
+        "--threads",
+        type=int,
+        nargs="+",
+        default=None,
+        help="CPU thread counts measured by benchmark (default: 1 and all)",
+    )
+    parser.add_argument(
+        "--warmup",
+        type=int,
+        default=10,
+        help="Benchmark calls before the measured ones (default: 10)",
+    )
+    parser.add_argument(
+        "--iterations",
+        type=int,
+        default=200,
+        help="Measured benchmark calls per block size (default: 200)",
+    )
+
+    parser.add_argument(
+        "--bands",
+        type=str,
+        default="octave",
+        choices=["octave", "third"],
+        help="Filterbank of the rt60 folder analysis: octave or third-octave bands (default: octave)",
+    )
+
+    parser.add_argument(
+        "--plot_workers",
+        type=int,
+        default=None,
+        help="Processes rendering the ir plots, 0 to render in this process (default: one per CPU)",
+    )
+
+    parser.add_argument(
+        "--gains",
+        type=float,
+        nargs="+",
+        default=[-24.0, -18.0, -12.0, -6.0, 0.0],
+        help="Input levels of the distortion sweep in dBFS (default: -24 -18 -12 -6 0)",
+    )
+
+    parser.add_argument(
+        "--harmonics",
+        type=int,
+        default=5,
+        help="Highest harmonic of the distortion analysis (default: 5)",
+    )
+
+    parser.add_argument(
+        "--signal_cache_mb",
+        type=int,
+        default=512,
+        help="Size bound of the measurement signal cache in CACHE_DIR/signals (default: 512 MB)",
+    )
+
+    parser.add_argument(
+        "--chunk_size",
+        type=int,
+        default=None,
+        help="Render the input in chunks of this many samples to bound memory (default: None, whole file)",
+    )
+
     args = parser.parse_args()
 
     if args.device == "auto":
@@ -141,18 +294,35 @@ def main():
         from .data.download import download_data
 
         download_data(args)
+    elif args.action == "prepare":
+        from .data.cache import prepare_data
+
+        prepare_data(args)
     elif args.action == "train":
         from .train import train_model
 
         train_model(args)
+    elif args.action == "sweep":
+        from .sweep import run_sweep
+
+        run_sweep(args)
     elif args.action == "eval":
         from .eval import evaluate_model
 
         evaluate_model(args)
+    elif args.action == "eval-many":
+        from .eval import evaluate_many
+
+        evaluate_many(args)
+
     elif args.action == "infer":
         from .inference import make_inference
 
         make_inference(args)
+    elif args.action == "infer-batch":
+        from .inference import make_batch_inference
+
+        make_batch_inference(args)
     elif args.action == "edit":
         from .utils.config_tools import modify_checkpoint
 
@@ -169,15 +339,39 @@ def main():
         from .tools.rt60 import measure_rt60
 
         measure_rt60(args)
+    elif args.action == "distortion":
+        from .tools.distortion import profile_distortion
+
+        profile_distortion(args)
     elif args.action == "wrap":
         from .wrapper import wrap_model
 
         wrap_model(args)
 
-    elif args.action == "rtf":
-        from .rtf import measure_rtf
+    elif args.action in ["benchmark", "rtf"]:
+        from .benchmark import run_benchmark
+
+        run_benchmark(args)
+
+    elif args.action == "bench-conv":
+        from .tools.conv_benchmark import benchmark_conv_modes
+
+        benchmark_conv_modes(args)
+
+    elif args.action == "quantize":
+        from .quantize import quantize_checkpoint
+
+        quantize_checkpoint(args)
+
+    elif args.action == "prune":
+        from .prune import prune_checkpoint
+
+        prune_checkpoint(args)
+
+    elif args.action == "distill":
+        from .distill import distill_model
 
-        measure_rtf(args)
+        distill_model(args)
 
 
 if __name__ == "__main__":
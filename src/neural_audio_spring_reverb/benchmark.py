@@ -0,0 +1,191 @@
+import copy
+import json
+import os
+import platform
+import time
+import numpy as np
+import torch
+
+from datetime import datetime
+from pathlib import Path
+
+from .networks.custom_layers import precompute_film
+from .networks.model_utils import load_model_checkpoint, get_condition
+from .streaming import StreamingProcessor
+from .tools.ir_signals import noise
+from .tools.signal_cache import configure_signal_cache
+
+"""
+Latency and real-time factor benchmark
+======================================
+Each checkpoint is measured for every combination of thread count, batch size and
+block size:
+    - block sizes: the model runs through StreamingProcessor, one call per block, as
+      in a real-time host. The latency of each call is recorded;
+    - "offline": one forward pass over --duration seconds, as `infer`, without the
+      filtering and normalization of the output.
+Every measurement starts with warm-up calls that are not recorded. The results report
+the median, p95 and p99 latency of a call and the real-time factor (median latency
+divided by the duration of the audio processed by the call), and are written to
+`benchmark-TIMESTAMP.json` in the log folder with the versions and the machine, so
+that runs can be compared across releases.
+"""
+
+OFFLINE_REPEATS = 10
+
+
+def list_benchmark_checkpoints(args):
+    if args.checkpoint is not None:
+        return [Path(args.checkpoint)]
+    return sorted(Path(args.models_dir).glob("*.pt"))
+
+
+def timed_calls(fn, x, warmup, iterations):
+    """Wall time in seconds of `iterations` calls of fn(x), after `warmup` calls."""
+    for _ in range(warmup):
+        fn(x)
+    times = []
+    for _ in range(iterations):
+        if x.is_cuda:
+            torch.cuda.synchronize()
+        start = time.perf_counter()
+        fn(x)
+        if x.is_cuda:
+            torch.cuda.synchronize()
+        times.append(time.perf_counter() - start)
+    return times
+
+
+def summarize(times, seconds_per_call):
+    times_ms = np.asarray(times) * 1000.0
+    median = float(np.median(times_ms))
+    return {
+        "iterations": len(times),
+        "median_ms": median,
+        "p95_ms": float(np.percentile(times_ms, 95)),
+        "p99_ms": float(np.percentile(times_ms, 99)),
+        "mean_ms": float(times_ms.mean()),
+        "rtf": median / (seconds_per_call * 1000.0),
+    }
+
+
+def test_signal(config, n_samples, batch_size, device):
+    """Noise from the measurement signal cache, one second longer than needed."""
+    seconds = n_samples // config["sample_rate"] + 1
+    x = torch.from_numpy(noise(config["sample_rate"], float(seconds)))
+    return x[:n_samples].view(1, 1, -1).repeat(batch_size, 1, 1).to(device)
+
+
+def bench_streaming(model, config, block_size, batch_size, device, args):
+    processor = StreamingProcessor(
+        model, config, block_size=block_size, batch_size=batch_size, device=device
+    )
+    x = test_signal(config, block_size, batch_size, device)
+    times = timed_calls(processor.process, x, args.warmup, args.iterations)
+    return summarize(times, block_size / config["sample_rate"])
+
+
+def bench_offline(model, config, batch_size, device, args):
+    n_samples = int(args.duration * config["sample_rate"])
+    x = test_signal(config, n_samples, batch_size, device)
+    c = get_condition(config, batch_size, device)
+    precompute_film(model, c)
+    with torch.no_grad():
+        times = timed_calls(lambda x: model(x, c), x, 1, OFFLINE_REPEATS)
+    return summarize(times, n_samples / config["sample_rate"])
+
+
+def print_results(rows):
+    header = f"{'checkpoint':<44} {'thr':>3} {'batch':>5} {'block':>7} {'median ms':>10} {'p95 ms':>8} {'p99 ms':>8} {'rtf':>8}"
+    print(header)
+    print("-" * len(header))
+    for row in rows:
+        if "error" in row:
+            print(
+                f"{row['checkpoint']:<44} {row['threads']:>3} {row['batch_size']:>5} {row['block_size']:>7}  failed: {row['error']}"
+            )
+            continue
+        print(
+            f"{row['checkpoint']:<44} {row['threads']:>3} {row['batch_size']:>5} {row['block_size']:>7} "
+            f"{row['median_ms']:>10.3f} {row['p95_ms']:>8.3f} {row['p99_ms']:>8.3f} {row['rtf']:>8.4f}"
+        )
+
+
+def run_benchmark(args):
+    """Benchmark -c, or every checkpoint of the models folder, and save the results as JSON."""
+    checkpoints = list_benchmark_checkpoints(args)
+    configure_signal_cache(args)
+    if not checkpoints:
+        raise ValueError(f"No checkpoint found in {args.models_dir}")
+
+    default_threads = torch.get_num_threads()
+    if args.device.type == "cpu":
+        thread_counts = args.threads or sorted({1, default_threads})
+    else:
+        thread_counts = [default_threads]
+    rows = []
+
+    for checkpoint_path in checkpoints:
+        model_args = copy.copy(args)
+        model_args.checkpoint = str(checkpoint_path)
+        model, _, _, config, rf, params = load_model_checkpoint(model_args)
+        # Quantized models only run on the CPU
+        device = torch.device("cpu") if config.get("quantized", False) else args.device
+        model.to(device).eval()
+        print(f"Benchmarking {checkpoint_path.stem} on {device}")
+
+        for threads in thread_counts:
+            torch.set_num_threads(threads)
+            for batch_size in args.batch_sizes:
+                for block_size in args.block_sizes + ["offline"]:
+                    row = {
+                        "checkpoint": checkpoint_path.stem,
+                        "model": config["name"],
+                        "params": params,
+                        "sample_rate": config["sample_rate"],
+                        "device": str(device),
+                        "threads": threads,
+                        "batch_size": batch_size,
+                        "block_size": block_size,
+                    }
+                    try:
+                        if block_size == "offline":
+                            row.update(bench_offline(model, config, batch_size, device, args))
+                        else:
+                            row.update(
+                                bench_streaming(
+                                    model, config, block_size, batch_size, device, args
+                                )
+                            )
+                    except (RuntimeError, ValueError) as e:
+                        row["error"] = repr(e)
+                    rows.append(row)
+        del model
+        torch.cuda.empty_cache()
+
+    torch.set_num_threads(default_threads)
+
+    timestamp = datetime.now().strftime("%Y%m%d-%H%M%S")
+    report = {
+        "timestamp": timestamp,
+        "torch": torch.__version__,
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "processor": platform.processor(),
+        "cpu_count": os.cpu_count(),
+        "cuda": torch.cuda.get_device_name(args.device)
+        if args.device.type == "cuda"
+        else None,
+        "warmup": args.warmup,
+        "iterations": args.iterations,
+        "duration": args.duration,
+        "results": rows,
+    }
+    report_path = Path(args.log_dir) / f"benchmark-{timestamp}.json"
+    report_path.parent.mkdir(parents=True, exist_ok=True)
+    with open(report_path, "w") as f:
+        json.dump(report, f, indent=2)
+
+    print_results(rows)
+    print(f"Results saved to {report_path}")
+    return report
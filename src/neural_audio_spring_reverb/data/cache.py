@@ -0,0 +1,180 @@
+import hashlib
+import json
+import os
+import shutil
+import tempfile
+import numpy as np
+import soundfile
+import torch
+from pathlib import Path
+
+"""
+Preprocessed shard cache
+========================
+The dry/wet pairs of a dataset are decoded once, truncated to `sample_length`,
+transformed and written as aligned float32 arrays into a single memory-mapped
+file (shard.npy, shape [2, total_samples]) with an index of offsets and lengths.
+
+The cache folder name contains a hash of the file list, the sample length and
+the transforms, so any change to them points to a new cache.
+"""
+
+CACHE_VERSION = 1
+
+
+def describe_transform(transform) -> str:
+    """Identify a transform by its qualified name and a hash of its bytecode and constants."""
+    name = f"{getattr(transform, '__module__', '')}.{getattr(transform, '__qualname__', repr(transform))}"
+    code = getattr(transform, "__code__", None)
+    if code is not None:
+        digest = hashlib.sha1(code.co_code + repr(code.co_consts).encode())
+        name = f"{name}:{digest.hexdigest()[:8]}"
+    return name
+
+
+def cache_key(dry_files, wet_files, sample_length, transforms) -> str:
+    spec = {
+        "version": CACHE_VERSION,
+        "files": [[str(d), str(w)] for d, w in zip(dry_files, wet_files)],
+        "sample_length": sample_length,
+        "transforms": [describe_transform(t) for t in transforms or []],
+    }
+    return hashlib.sha1(json.dumps(spec).encode()).hexdigest()[:16]
+
+
+def prepare_cache(dataset, cache_root, name) -> Path:
+    """
+    Write the shard cache of a dataset if it does not exist yet.
+
+    Arguments:
+    ----------
+        dataset: EgfxDataset or CustomDataset, provides `dry_files`, `wet_files`,
+            `sample_length`, `transforms` and `load(audio_file)`.
+        cache_root (str or Path): Folder containing all the caches.
+        name (str): Dataset name, used as prefix of the cache folder.
+
+    Returns:
+    --------
+        Path: The cache folder.
+    """
+    key = cache_key(
+        dataset.dry_files, dataset.wet_files, dataset.sample_length, dataset.transforms
+    )
+    cache_dir = Path(cache_root) / f"{name}-{key}"
+    if (cache_dir / "index.json").is_file():
+        return cache_dir
+
+    print(f"Preparing {name} cache in {cache_dir}")
+    Path(cache_root).mkdir(parents=True, exist_ok=True)
+
+    # Item lengths from the headers, to allocate the shard before decoding
+    lengths = []
+    for dry_file, wet_file in zip(dataset.dry_files, dataset.wet_files):
+        dry_frames = soundfile.info(str(dry_file)).frames
+        wet_frames = soundfile.info(str(wet_file)).frames
+        # Keep dry and wet aligned sample by sample
+        lengths.append(min(dry_frames, wet_frames, dataset.sample_length))
+    offsets = np.concatenate([[0], np.cumsum(lengths)[:-1]]).astype(int).tolist()
+
+    # Write into a temporary folder first, so that concurrent runs never read a partial cache
+    tmp_dir = Path(tempfile.mkdtemp(prefix=f".{name}-", dir=cache_root))
+    shard = np.lib.format.open_memmap(
+        tmp_dir / "shard.npy", mode="w+", dtype=np.float32, shape=(2, sum(lengths))
+    )
+    for dry_file, wet_file, offset, length in zip(
+        dataset.dry_files, dataset.wet_files, offsets, lengths
+    ):
+        dry_tensor = dataset.load(dry_file)
+        wet_tensor = dataset.load(wet_file)
+        if dry_tensor.size(0) != 1 or wet_tensor.size(0) != 1:
+            raise ValueError(f"Only mono files can be cached: {dry_file}, {wet_file}")
+
+        if dataset.transforms:
+            for transform in dataset.transforms:
+                dry_tensor = transform(dry_tensor)
+                wet_tensor = transform(wet_tensor)
+
+        shard[0, offset : offset + length] = dry_tensor[0, :length].numpy()
+        shard[1, offset : offset + length] = wet_tensor[0, :length].numpy()
+    shard.flush()
+    del shard
+
+    index = {
+        "key": key,
+        "sample_length": dataset.sample_length,
+        "transforms": [describe_transform(t) for t in dataset.transforms or []],
+        "files": [[str(d), str(w)] for d, w in zip(dataset.dry_files, dataset.wet_files)],
+        "offsets": [int(o) for o in offsets],
+        "lengths": [int(n) for n in lengths],
+    }
+    with open(tmp_dir / "index.json", "w") as f:
+        json.dump(index, f)
+
+    try:
+        os.replace(tmp_dir, cache_dir)
+    except OSError:
+        # Another process prepared the same cache in the meantime
+        shutil.rmtree(tmp_dir, ignore_errors=True)
+
+    return cache_dir
+
+
+class ShardCache:
+    """Read-only access to a prepared cache, items are zero-copy views of the memory map."""
+
+    def __init__(self, cache_dir):
+        self.cache_dir = Path(cache_dir)
+        with open(self.cache_dir / "index.json", "r") as f:
+            index = json.load(f)
+        self.offsets = index["offsets"]
+        self.lengths = index["lengths"]
+        self._shard = None
+
+    @property
+    def shard(self):
+        # Opened lazily, so that every DataLoader worker maps the file itself
+        if self._shard is None:
+            # Copy-on-write: in-place transforms never touch the file
+            self._shard = np.load(self.cache_dir / "shard.npy", mmap_mode="c")
+        return self._shard
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        state["_shard"] = None
+        return state
+
+    def __len__(self):
+        return len(self.offsets)
+
+    def __getitem__(self, index):
+        start = self.offsets[index]
+        stop = start + self.lengths[index]
+        dry_tensor = torch.from_numpy(self.shard[0:1, start:stop])
+        wet_tensor = torch.from_numpy(self.shard[1:2, start:stop])
+        return dry_tensor, wet_tensor
+
+
+def dataset_cache_dir(args) -> Path:
+    """Cache folder of prepare, train and eval: --cache_dir, or DATA_DIR/cache."""
+    return Path(args.cache_dir or Path(args.data_dir) / "cache")
+
+
+def prepare_data(args):
+    """Prepare the cache of the dataset selected with --dataset."""
+    from .egfxset import EgfxDataset, TRANSFORMS as EGFX_TRANSFORMS
+    from .customset import CustomDataset, TRANSFORMS as CUSTOM_TRANSFORMS
+
+    cache_dir = dataset_cache_dir(args)
+
+    if args.dataset == "egfxset":
+        dataset = EgfxDataset(
+            args.data_dir, transforms=EGFX_TRANSFORMS, cache_dir=cache_dir
+        )
+    elif args.dataset == "customset":
+        dataset = CustomDataset(
+            args.data_dir, transforms=CUSTOM_TRANSFORMS, cache_dir=cache_dir
+        )
+    else:
+        raise ValueError("Dataset not found, options are: egfxset or customset")
+
+    print(f"{len(dataset)} items cached in {dataset.cache.cache_dir}")
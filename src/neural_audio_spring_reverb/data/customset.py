@@ -4,6 +4,8 @@ from torch.utils.data import Dataset, DataLoader
 import torchaudio.functional as F
 from pathlib import Path
 
+from .cache import prepare_cache, ShardCache
+
 
 class CustomDataset(Dataset):
     """
@@ -24,6 +26,9 @@ class CustomDataset(Dataset):
 
     File names should be in the format "dry-<alphanumericID>.wav"
     and "wet-<alphanumericID>.wav".
+
+    If `cache_dir` is given, the pairs are decoded and transformed once into a
+    preprocessed shard cache and then read from it.
     """
 
     def __init__(
@@ -31,6 +36,7 @@ class CustomDataset(Dataset):
         data_dir,
         transforms=None,
         sample_length=48000 * 4,
+        cache_dir=None,
     ):
         self.data_dir = Path(data_dir) / "customset"
         self.input_dir = self.data_dir / "input"
@@ -56,6 +62,10 @@ class CustomDataset(Dataset):
             self.wet_files
         ), "Dry and wet files must be paired with the same length."
 
+        self.cache = None
+        if cache_dir is not None:
+            self.cache = ShardCache(prepare_cache(self, cache_dir, "customset"))
+
     def __len__(self):
         return min(len(self.dry_files), len(self.wet_files))
 
@@ -69,6 +79,9 @@ class CustomDataset(Dataset):
         return audio
 
     def __getitem__(self, idx):
+        if self.cache is not None:
+            return self.cache[idx]
+
         dry_path = self.dry_files[idx]
         wet_path = self.wet_files[idx]
 
@@ -96,19 +109,15 @@ def correct_dc_offset(tensor):
 
 
 def peak_normalize(tensor):
-    tensor /= torch.max(torch.abs(tensor))
+    # Silent items and windows are left as they are
+    tensor /= torch.max(torch.abs(tensor)).clamp_min(1e-8)
     return tensor
 
 
 def custom_collate(batch):
-    # Separate the dry and wet samples
-    dry, wet = zip(*batch)
-
-    # Stack along the time dimension
-    dry_stacked = torch.cat(dry, dim=-1)
-    wet_stacked = torch.cat(wet, dim=-1)
-
-    return dry_stacked.unsqueeze(0), wet_stacked.unsqueeze(0)
+    # Separate the dry and wet samples (and any extra target, e.g. distillation)
+    # and stack them along the time dimension
+    return tuple(torch.cat(items, dim=-1).unsqueeze(0) for items in zip(*batch))
 
 
 TRANSFORMS = [contrast, correct_dc_offset, peak_normalize]
@@ -121,9 +130,11 @@ def load_customset(
     valid_ratio=0.2,
     test_ratio=0.2,
     num_workers=4,
+    cache_dir=None,
+    split_seed=None,
 ):
-    """Load and split the dataset"""
-    dataset = CustomDataset(data_dir=data_dir, transforms=TRANSFORMS)
+    """Load and split the dataset, `split_seed` makes the split reproducible"""
+    dataset = CustomDataset(data_dir=data_dir, transforms=TRANSFORMS, cache_dir=cache_dir)
 
     # Calculate the sizes of train, validation, and test sets
     total_size = len(dataset)
@@ -138,8 +149,11 @@ def load_customset(
     train_size += diff
 
     # Split the dataset into train, validation, and test sets
+    generator = None
+    if split_seed is not None:
+        generator = torch.Generator().manual_seed(split_seed)
     train_data, valid_data, test_data = torch.utils.data.random_split(
-        dataset, [train_size, valid_size, test_size]
+        dataset, [train_size, valid_size, test_size], generator=generator
     )
 
     # Create data loaders for train, validation, and test sets
@@ -6,6 +6,8 @@ from pathlib import Path
 import glob
 import os
 
+from .cache import prepare_cache, ShardCache
+
 
 class EgfxDataset(Dataset):
     """Egfx dataset
@@ -14,13 +16,20 @@ class EgfxDataset(Dataset):
         length (int): Length of the audio samples
         random_seed (int): Random seed for reproducibility
         transforms (list): List of transforms to apply to the audio samples
+        cache_dir (str): Folder of the preprocessed shard cache, if given the items
+            are decoded and transformed once and then read from the cache
 
     Returns:
         torch.utils.data.Dataset: Dataset object containing tuples of dry and wet audio samples
     """
 
     def __init__(
-        self, data_dir, sample_length=48000 * 4, random_seed=42, transforms=None
+        self,
+        data_dir,
+        sample_length=48000 * 4,
+        random_seed=42,
+        transforms=None,
+        cache_dir=None,
     ):
         self.data_dir = Path(data_dir) / "egfxset"
         self.dry_dir = self.data_dir / "Clean"
@@ -52,6 +61,10 @@ class EgfxDataset(Dataset):
         self.sample_length = sample_length
         self.transforms = transforms
 
+        self.cache = None
+        if cache_dir is not None:
+            self.cache = ShardCache(prepare_cache(self, cache_dir, "egfxset"))
+
     def __len__(self):
         return len(self.dry_files)
 
@@ -64,6 +77,9 @@ class EgfxDataset(Dataset):
         return audio
 
     def __getitem__(self, index):
+        if self.cache is not None:
+            return self.cache[index]
+
         dry_file = self.dry_files[index]
         wet_file = self.wet_files[index]
 
@@ -90,7 +106,8 @@ def correct_dc_offset(tensor):
 
 
 def peak_normalize(tensor):
-    tensor /= torch.max(torch.abs(tensor))
+    # Silent items and windows are left as they are
+    tensor /= torch.max(torch.abs(tensor)).clamp_min(1e-8)
     return tensor
 
 
@@ -116,9 +133,11 @@ def load_egfxset(
     test_ratio=0.2,
     num_workers=4,
     transforms=TRANSFORMS,
+    cache_dir=None,
+    split_seed=None,
 ):
-    """Load and split the dataset"""
-    dataset = EgfxDataset(data_dir=data_dir, transforms=transforms)
+    """Load and split the dataset, `split_seed` makes the split reproducible"""
+    dataset = EgfxDataset(data_dir=data_dir, transforms=transforms, cache_dir=cache_dir)
 
     # Calculate the sizes of train, validation, and test sets
     total_size = len(dataset)
@@ -133,8 +152,11 @@ def load_egfxset(
     train_size += diff
 
     # Split the dataset into train, validation, and test sets
+    generator = None
+    if split_seed is not None:
+        generator = torch.Generator().manual_seed(split_seed)
     train_data, valid_data, test_data = torch.utils.data.random_split(
-        dataset, [train_size, valid_size, test_size]
+        dataset, [train_size, valid_size, test_size], generator=generator
     )
 
     # Create data loaders for train, validation, and test sets
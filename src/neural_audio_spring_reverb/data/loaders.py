@@ -0,0 +1,72 @@
+import hashlib
+import json
+
+from torch.utils.data import Subset
+
+from .egfxset import load_egfxset
+from .springset import load_springset
+from .customset import load_customset
+from .cache import dataset_cache_dir
+
+
+def load_loaders(config, args, batch_size=None):
+    """Train, validation and test DataLoaders of the dataset a model was trained on."""
+    if batch_size is None:
+        batch_size = config["batch_size"]
+    # Same split as in training when it was seeded
+    split_seed = config.get("split_seed", None)
+
+    if config["dataset"] == "egfxset":
+        loaders = load_egfxset(
+            args.data_dir,
+            batch_size=batch_size,
+            num_workers=args.num_workers,
+            cache_dir=dataset_cache_dir(args),
+            split_seed=split_seed,
+        )
+    elif config["dataset"] == "springset":
+        loaders = load_springset(
+            args.data_dir,
+            batch_size=batch_size,
+            num_workers=args.num_workers,
+            lazy=args.lazy_load,
+            read_ahead=args.read_ahead,
+            split_seed=split_seed,
+        )
+    elif config["dataset"] == "customset":
+        loaders = load_customset(
+            args.data_dir,
+            batch_size=batch_size,
+            num_workers=args.num_workers,
+            cache_dir=dataset_cache_dir(args),
+            split_seed=split_seed,
+        )
+    else:
+        raise ValueError("Dataset not found, options are: egfxset or springset")
+
+    return loaders
+
+
+def load_test_loader(config, args, batch_size=None):
+    """Test DataLoader of the dataset a model was trained on."""
+    return load_loaders(config, args, batch_size)[2]
+
+
+def test_set_key(loader):
+    """
+    Identity of the items of a loader: a hash of the files behind them in order (the
+    HDF5 files and item indices for springset), so a different split or file list
+    gives a different key.
+    """
+    dataset = loader.dataset
+    indices = list(range(len(dataset)))
+    while isinstance(dataset, Subset):
+        indices = [dataset.indices[i] for i in indices]
+        dataset = dataset.dataset
+
+    if hasattr(dataset, "dry_files"):
+        items = [[str(dataset.dry_files[i]), str(dataset.wet_files[i])] for i in indices]
+        spec = {"items": items, "sample_length": dataset.sample_length}
+    else:
+        spec = {"files": [str(dataset.dry_file), str(dataset.wet_file)], "items": indices}
+    return hashlib.sha1(json.dumps(spec).encode()).hexdigest()[:16]
@@ -0,0 +1,151 @@
+import soundfile
+import torch
+import torchaudio
+from torch.utils.data import Dataset, DataLoader, Subset
+
+
+class SegmentDataset(Dataset):
+    """
+    Random-crop wrapper for the dry-wet datasets.
+
+    Each item is an aligned dry/wet window drawn from a random position of a random file,
+    so the number of items per epoch does not depend on the number of files.
+    The window is `warmup + segment_length` samples long: the first `warmup` samples
+    (usually the receptive field of the model) only prime the model and are not meant to
+    be used in the loss. Items shorter than a window are left out, so no window is
+    zero-padded.
+
+    Args:
+        dataset (Dataset): EgfxDataset, CustomDataset or SpringDataset, or a Subset of one
+            (e.g. from random_split).
+        segment_length (int): Number of samples per window used in the loss.
+        segments_per_epoch (int): Number of windows in one epoch.
+        warmup (int): Number of samples of history prepended to each window.
+        cap_warmup (bool): Lower the warmup to fit in the shortest item that holds a
+            segment, instead of leaving out the items that are too short.
+
+    Returns:
+        torch.utils.data.Dataset: Dataset object containing tuples of dry and wet windows
+    """
+
+    def __init__(self, dataset, segment_length, segments_per_epoch, warmup=0, cap_warmup=False):
+        self.segment_length = segment_length
+        self.segments_per_epoch = segments_per_epoch
+
+        # Resolve the Subset chain to the base dataset and its item indices
+        indices = list(range(len(dataset)))
+        while isinstance(dataset, Subset):
+            indices = [dataset.indices[i] for i in indices]
+            dataset = dataset.dataset
+        self.dataset = dataset
+
+        # Files are read directly, the cache only holds the first sample_length of each
+        self.from_files = hasattr(dataset, "dry_files")
+        if self.from_files:
+            lengths = [
+                min(
+                    soundfile.info(str(dataset.dry_files[i])).frames,
+                    soundfile.info(str(dataset.wet_files[i])).frames,
+                )
+                for i in indices
+            ]
+        else:
+            # In-memory and HDF5 items all have the same length
+            dry_tensor, wet_tensor = dataset[indices[0]]
+            lengths = [min(dry_tensor.size(-1), wet_tensor.size(-1))] * len(indices)
+
+        if cap_warmup:
+            # Items shorter than a segment are left out anyway
+            fits = [length for length in lengths if length >= segment_length]
+            if fits:
+                warmup = min(warmup, min(fits) - segment_length)
+        self.warmup = warmup
+        self.window_length = warmup + segment_length
+
+        keep = [i for i, length in enumerate(lengths) if length >= self.window_length]
+        if not keep:
+            raise ValueError(
+                f"warmup + segment_length ({self.window_length} samples) is longer than every item (longest: {max(lengths)} samples)"
+            )
+        if len(keep) < len(indices):
+            print(
+                f"Leaving out {len(indices) - len(keep)} items shorter than a window of {self.window_length} samples"
+            )
+        self.indices = [indices[i] for i in keep]
+        self.lengths = [lengths[i] for i in keep]
+
+    def __len__(self):
+        return self.segments_per_epoch
+
+    def random_offset(self, length):
+        return int(torch.randint(0, length - self.window_length + 1, (1,)))
+
+    def read(self, position):
+        index = self.indices[position]
+        if not self.from_files:
+            # In-memory and HDF5 items: crop the item returned by the dataset
+            dry_tensor, wet_tensor = self.dataset[index]
+            offset = self.random_offset(self.lengths[position])
+            stop = offset + self.window_length
+            return dry_tensor[..., offset:stop], wet_tensor[..., offset:stop]
+
+        offset = self.random_offset(self.lengths[position])
+        dry_tensor, _ = torchaudio.load(
+            self.dataset.dry_files[index],
+            frame_offset=offset,
+            num_frames=self.window_length,
+            normalize=True,
+        )
+        wet_tensor, _ = torchaudio.load(
+            self.dataset.wet_files[index],
+            frame_offset=offset,
+            num_frames=self.window_length,
+            normalize=True,
+        )
+
+        # Transforms are applied to the window
+        if self.dataset.transforms:
+            for transform in self.dataset.transforms:
+                dry_tensor = transform(dry_tensor)
+                wet_tensor = transform(wet_tensor)
+
+        return dry_tensor, wet_tensor
+
+    def __getitem__(self, idx):
+        # torch RNG: DataLoader workers get different seeds
+        position = int(torch.randint(0, len(self.indices), (1,)))
+        return self.read(position)
+
+
+def make_segment_loader(
+    loader, segment_length, segments_per_epoch=None, warmup=0, cap_warmup=False
+):
+    """
+    Wrap the dataset of a DataLoader with SegmentDataset.
+
+    The batch size, workers and worker init function of the original loader are kept.
+    Windows have the same length, so they are stacked into [batch, 1, samples].
+    """
+    if segments_per_epoch is None:
+        segments_per_epoch = len(loader.dataset)
+
+    dataset = SegmentDataset(
+        loader.dataset,
+        segment_length=segment_length,
+        segments_per_epoch=segments_per_epoch,
+        warmup=warmup,
+        cap_warmup=cap_warmup,
+    )
+    print(
+        f"Sampling {segments_per_epoch} segments of {segment_length} samples per epoch (warm-up: {dataset.warmup})"
+    )
+
+    return DataLoader(
+        dataset,
+        loader.batch_size,
+        num_workers=loader.num_workers,
+        shuffle=False,  # items are random already
+        drop_last=True,
+        worker_init_fn=loader.worker_init_fn,
+        pin_memory=False,
+    )
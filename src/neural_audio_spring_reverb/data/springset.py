@@ -12,6 +12,11 @@ class SpringDataset(torch.utils.data.Dataset):
         split (str, optional): The data split to use (i.e. 'train', 'test', or 'validation').
             If not provided, all data in the root directory will be used.
         transform (callable, optional): Optional transform to apply to the data samples.
+        lazy (bool, optional): If True, the HDF5 files are opened once per DataLoader worker
+            (see `spring_worker_init`) and the items are read on demand, instead of loading
+            the whole split in memory.
+        read_ahead (int, optional): In lazy mode, number of consecutive items read at once
+            and kept in memory, useful for sequential access (e.g. validation and test).
 
     Methods:
     --------
@@ -37,7 +42,7 @@ class SpringDataset(torch.utils.data.Dataset):
     }
     """
 
-    def __init__(self, root_dir, split=None, transforms=None):
+    def __init__(self, root_dir, split=None, transforms=None, lazy=False, read_ahead=0):
         super(SpringDataset, self).__init__()
         self.root_dir = Path(root_dir) / "springset"
         self.split = split
@@ -52,6 +57,11 @@ class SpringDataset(torch.utils.data.Dataset):
         ][0]
         self.dry_data = None
         self.wet_data = None
+        self.lazy = lazy
+        self.read_ahead = read_ahead
+        self.f_dry = None
+        self.f_wet = None
+        self.block_start = None
 
         # Check if the files are not empty
         if self.dry_file.stat().st_size == 0 or self.wet_file.stat().st_size == 0:
@@ -62,10 +72,16 @@ class SpringDataset(torch.utils.data.Dataset):
             f"Using {self.dry_file.name} and {self.wet_file.name} for {self.split} split."
         )
 
-        self.load_data()
+        if self.lazy:
+            # Only read the number of items, the files are opened again in each worker
+            with h5py.File(self.dry_file, "r") as f_dry:
+                n_items = len(f_dry[list(f_dry.keys())[0]])
+        else:
+            self.load_data()
+            n_items = len(self.dry_data)
+
         self.index = {
-            i: (self.dry_file.name, self.wet_file.name, i)
-            for i in range(len(self.dry_data))
+            i: (self.dry_file.name, self.wet_file.name, i) for i in range(n_items)
         }
 
         self.transforms = transforms
@@ -76,7 +92,10 @@ class SpringDataset(torch.utils.data.Dataset):
 
     def __getitem__(self, index):
         # Returns a tuple of numpy arrays
-        x, y = self.dry_data[index], self.wet_data[index]
+        if self.lazy:
+            x, y = self.read_item(index)
+        else:
+            x, y = self.dry_data[index], self.wet_data[index]
         x, y = x.reshape(1, -1), y.reshape(1, -1)
 
         # Convert numpy arrays to tensors
@@ -100,6 +119,43 @@ class SpringDataset(torch.utils.data.Dataset):
             self.dry_data = f_dry[dry_key][:].astype(np.float32)
             self.wet_data = f_wet[wet_key][:].astype(np.float32)
 
+    def open_files(self):
+        """Open the HDF5 files of the split, called once per worker process."""
+        self.f_dry = h5py.File(self.dry_file, "r")
+        self.f_wet = h5py.File(self.wet_file, "r")
+        self.dry_ds = self.f_dry[list(self.f_dry.keys())[0]]
+        self.wet_ds = self.f_wet[list(self.f_wet.keys())[0]]
+        self.block_start = None
+
+    def read_item(self, index):
+        if self.f_dry is None:  # num_workers=0, or no worker_init_fn
+            self.open_files()
+
+        if self.read_ahead <= 1:
+            return (
+                self.dry_ds[index].astype(np.float32),
+                self.wet_ds[index].astype(np.float32),
+            )
+
+        # Read a block of consecutive items around the requested one
+        start = (index // self.read_ahead) * self.read_ahead
+        if self.block_start != start:
+            stop = min(start + self.read_ahead, len(self.index))
+            self.dry_block = self.dry_ds[start:stop].astype(np.float32)
+            self.wet_block = self.wet_ds[start:stop].astype(np.float32)
+            self.block_start = start
+        return self.dry_block[index - start], self.wet_block[index - start]
+
+    def __getstate__(self):
+        # h5py handles can not be pickled, each worker opens its own
+        state = self.__dict__.copy()
+        for key in ["f_dry", "f_wet", "dry_ds", "wet_ds", "dry_block", "wet_block"]:
+            state.pop(key, None)
+        state["f_dry"] = None
+        state["f_wet"] = None
+        state["block_start"] = None
+        return state
+
     def normalize_data(self):
         # Concatenate dry and wet data along the first dimension (assuming the data shape is [n_samples, n_features])
         all_data = np.concatenate([self.dry_data, self.wet_data], axis=0)
@@ -140,7 +196,8 @@ def correct_dc_offset(tensor):
 
 
 def peak_normalize(tensor):
-    tensor /= torch.max(torch.abs(tensor))
+    # Silent items and windows are left as they are
+    tensor /= torch.max(torch.abs(tensor)).clamp_min(1e-8)
 
     return tensor
 
@@ -148,23 +205,73 @@ def peak_normalize(tensor):
 TRANSFORMS = [correct_dc_offset, peak_normalize]
 
 
-def load_springset(datadir, batch_size, train_ratio=0.6, num_workers=4):
-    """Load and split the dataset"""
-    trainset = SpringDataset(root_dir=datadir, split="train", transforms=TRANSFORMS)
+def spring_worker_init(worker_id):
+    """Open the HDF5 files of a lazy SpringDataset once in each DataLoader worker."""
+    dataset = torch.utils.data.get_worker_info().dataset
+    while not isinstance(dataset, SpringDataset):  # random_split, SegmentDataset
+        dataset = dataset.dataset
+    if dataset.lazy:
+        dataset.open_files()
+
+
+def load_springset(
+    datadir,
+    batch_size,
+    train_ratio=0.6,
+    num_workers=4,
+    lazy=False,
+    read_ahead=0,
+    split_seed=None,
+):
+    """Load and split the dataset, `split_seed` makes the train/valid split reproducible"""
+    trainset = SpringDataset(
+        root_dir=datadir,
+        split="train",
+        transforms=TRANSFORMS,
+        lazy=lazy,
+        read_ahead=read_ahead,
+    )
     train_size = int(train_ratio * len(trainset))
     valid_size = len(trainset) - train_size
-    train, valid = torch.utils.data.random_split(trainset, [train_size, valid_size])
+    generator = None
+    if split_seed is not None:
+        generator = torch.Generator().manual_seed(split_seed)
+    train, valid = torch.utils.data.random_split(
+        trainset, [train_size, valid_size], generator=generator
+    )
+
+    worker_init_fn = spring_worker_init if lazy else None
 
     train_loader = torch.utils.data.DataLoader(
-        train, batch_size, num_workers=num_workers, shuffle=True, drop_last=True
+        train,
+        batch_size,
+        num_workers=num_workers,
+        shuffle=True,
+        drop_last=True,
+        worker_init_fn=worker_init_fn,
     )
     valid_loader = torch.utils.data.DataLoader(
-        valid, batch_size, num_workers=num_workers, shuffle=False, drop_last=True
+        valid,
+        batch_size,
+        num_workers=num_workers,
+        shuffle=False,
+        drop_last=True,
+        worker_init_fn=worker_init_fn,
     )
 
-    testset = SpringDataset(root_dir=datadir, split="test", transforms=TRANSFORMS)
+    testset = SpringDataset(
+        root_dir=datadir,
+        split="test",
+        transforms=TRANSFORMS,
+        lazy=lazy,
+        read_ahead=read_ahead,
+    )
     test_loader = torch.utils.data.DataLoader(
-        testset, batch_size, num_workers=num_workers, drop_last=True
+        testset,
+        batch_size,
+        num_workers=num_workers,
+        drop_last=True,
+        worker_init_fn=worker_init_fn,
     )
 
     return train_loader, valid_loader, test_loader
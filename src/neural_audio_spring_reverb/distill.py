@@ -0,0 +1,137 @@
+import copy
+import hashlib
+import os
+import tempfile
+import numpy as np
+import torch
+
+from pathlib import Path
+from torch.utils.data import Dataset, DataLoader, Subset
+
+from .networks.custom_layers import precompute_film
+from .networks.model_utils import load_model_checkpoint, get_condition
+
+"""
+Knowledge distillation
+======================
+A student model (YAML config) is trained on the outputs of a teacher model (checkpoint),
+optionally mixed with the wet signal:
+
+    target = distill_alpha * teacher(dry) + (1 - distill_alpha) * wet
+
+The teacher renders every training item once before the first epoch. The outputs are
+stored as one .npy file per item in the cache folder, named by the index of the item in
+the dataset, so they are reused by the following epochs and runs.
+"""
+
+
+def base_index(dataset, index):
+    """Resolve an index through a chain of Subsets (random_split)."""
+    while isinstance(dataset, Subset):
+        index = dataset.indices[index]
+        dataset = dataset.dataset
+    return index
+
+
+def teacher_cache_dir(args, config, teacher_config):
+    checkpoint = Path(args.teacher).resolve()
+    spec = [
+        str(checkpoint),
+        str(checkpoint.stat().st_mtime_ns),
+        config["dataset"],
+        str(config["sample_rate"]),
+    ]
+    key = hashlib.sha1("|".join(spec).encode()).hexdigest()[:16]
+    cache_root = Path(args.cache_dir or Path(args.data_dir) / "cache")
+    return cache_root / f"teacher-{teacher_config['name']}-{key}"
+
+
+class DistillDataset(Dataset):
+    """Items of a dataset with the cached teacher output: (dry, wet, teacher)."""
+
+    def __init__(self, dataset, cache_dir):
+        self.dataset = dataset
+        self.cache_dir = Path(cache_dir)
+
+    def __len__(self):
+        return len(self.dataset)
+
+    def item_path(self, idx):
+        return self.cache_dir / f"{base_index(self.dataset, idx):06d}.npy"
+
+    def __getitem__(self, idx):
+        dry_tensor, wet_tensor = self.dataset[idx]
+        teacher_tensor = torch.from_numpy(np.load(self.item_path(idx)))
+        return dry_tensor, wet_tensor, teacher_tensor
+
+
+@torch.no_grad()
+def cache_teacher_outputs(teacher, teacher_config, dataset, device):
+    """Render the items of a DistillDataset that are not cached yet."""
+    missing = [i for i in range(len(dataset)) if not dataset.item_path(i).is_file()]
+    if not missing:
+        return
+    print(f"Rendering {len(missing)} teacher outputs to {dataset.cache_dir}")
+    dataset.cache_dir.mkdir(parents=True, exist_ok=True)
+
+    teacher.eval()
+    c = get_condition(teacher_config, 1, device)
+    precompute_film(teacher, c)
+    for idx in missing:
+        dry_tensor, _ = dataset.dataset[idx]
+        pred = teacher(dry_tensor.unsqueeze(0).to(device), c)[0].float().cpu()
+
+        # Written next to the cache and renamed, so a partial file is never read
+        fd, tmp_path = tempfile.mkstemp(suffix=".npy", dir=dataset.cache_dir)
+        with os.fdopen(fd, "wb") as f:
+            np.save(f, pred.numpy())
+        os.replace(tmp_path, dataset.item_path(idx))
+
+
+def make_distill_loader(loader, args, config):
+    """
+    Rebuild the training DataLoader with the teacher outputs of each item.
+
+    The teacher is loaded from `args.teacher` and renders the missing items first.
+    The batch size, workers, collate function and worker init function of the original
+    loader are kept.
+    """
+    teacher_args = copy.copy(args)
+    teacher_args.checkpoint = args.teacher
+    teacher, _, _, teacher_config, _, _ = load_model_checkpoint(teacher_args)
+    if teacher_config["sample_rate"] != config["sample_rate"]:
+        raise ValueError(
+            f"Teacher and student sample rates differ: {teacher_config['sample_rate']} and {config['sample_rate']}"
+        )
+    print(f"Distilling from {teacher_config['name']} ({args.teacher})")
+
+    dataset = DistillDataset(
+        loader.dataset, teacher_cache_dir(args, config, teacher_config)
+    )
+    cache_teacher_outputs(teacher, teacher_config, dataset, args.device)
+    del teacher
+    torch.cuda.empty_cache()
+
+    return DataLoader(
+        dataset,
+        loader.batch_size,
+        num_workers=loader.num_workers,
+        shuffle=True,
+        drop_last=True,
+        collate_fn=loader.collate_fn,
+        worker_init_fn=loader.worker_init_fn,
+        pin_memory=False,
+    )
+
+
+def distill_model(args):
+    """Train the student of --init on the outputs of the teacher checkpoint of -c."""
+    from .train import train_model
+
+    if args.checkpoint is None or args.init is None:
+        raise ValueError(
+            "Distillation needs a teacher checkpoint (-c) and a student configuration (--init)."
+        )
+    args.teacher = args.checkpoint
+    args.checkpoint = None
+    return train_model(args)
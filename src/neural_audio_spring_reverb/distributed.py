@@ -0,0 +1,92 @@
+import os
+import torch
+import torch.distributed as dist
+import torch.multiprocessing as mp
+
+from torch.utils.data import DataLoader
+from torch.utils.data.distributed import DistributedSampler
+
+"""
+Multi-process data-parallel training
+====================================
+Workers are spawned on the local machine and joined in a process group with the
+gloo backend, which also runs on CPU-only machines. Each worker trains a replica of
+the model wrapped in DistributedDataParallel on its own shard of the data.
+"""
+
+
+def is_distributed() -> bool:
+    return dist.is_available() and dist.is_initialized()
+
+
+def get_rank() -> int:
+    return dist.get_rank() if is_distributed() else 0
+
+
+def get_world_size() -> int:
+    return dist.get_world_size() if is_distributed() else 1
+
+
+def default_world_size(device) -> int:
+    if device.type == "cuda":
+        return max(1, torch.cuda.device_count())
+    # One worker per 4 CPU cores, the rest are used for intra-op threads
+    return max(1, (os.cpu_count() or 1) // 4)
+
+
+def distributed_worker(rank, fn, args, world_size):
+    os.environ.setdefault("MASTER_ADDR", "127.0.0.1")
+    os.environ.setdefault("MASTER_PORT", "29500")
+    dist.init_process_group("gloo", rank=rank, world_size=world_size)
+
+    if args.device.type == "cuda":
+        args.device = torch.device(f"cuda:{rank % torch.cuda.device_count()}")
+        torch.cuda.set_device(args.device)
+    else:
+        # Share the cores between the workers instead of oversubscribing them
+        torch.set_num_threads(max(1, (os.cpu_count() or 1) // world_size))
+
+    try:
+        fn(args)
+    finally:
+        dist.destroy_process_group()
+
+
+def launch(fn, args, world_size=None):
+    """Run `fn(args)` in `world_size` processes joined in a gloo process group."""
+    if world_size is None:
+        world_size = default_world_size(args.device)
+    print(f"Launching {world_size} distributed workers (gloo)")
+    mp.spawn(
+        distributed_worker, args=(fn, args, world_size), nprocs=world_size, join=True
+    )
+
+
+def make_distributed_loader(loader, shuffle):
+    """Rebuild a DataLoader so that every worker iterates over its own shard."""
+    sampler = DistributedSampler(
+        loader.dataset,
+        num_replicas=get_world_size(),
+        rank=get_rank(),
+        shuffle=shuffle,
+        drop_last=True,
+    )
+    return DataLoader(
+        loader.dataset,
+        loader.batch_size,
+        sampler=sampler,
+        num_workers=loader.num_workers,
+        drop_last=True,
+        collate_fn=loader.collate_fn,
+        worker_init_fn=loader.worker_init_fn,
+        pin_memory=False,
+    )
+
+
+def all_reduce_mean(value: float, device) -> float:
+    """Average a scalar across the workers (identity when not distributed)."""
+    if not is_distributed():
+        return value
+    tensor = torch.tensor(float(value), dtype=torch.float64, device=device)
+    dist.all_reduce(tensor, op=dist.ReduceOp.SUM)
+    return tensor.item() / get_world_size()
@@ -1,20 +1,21 @@
 # ./src/eval.py
 
 import os
+import csv
+import copy
 import torch
 import torchaudio
 import torchaudio.functional as F
 import wandb
-import auraloss
 from datetime import datetime
 from pathlib import Path
 import time
 
 
-from .data.egfxset import load_egfxset
-from .data.springset import load_springset
-from .data.customset import load_customset
-from .networks.model_utils import load_model_checkpoint
+from .data.loaders import load_test_loader, test_set_key
+from .networks.model_utils import load_checkpoint, load_model_checkpoint, get_condition
+from .networks.custom_layers import precompute_film
+from .utils.metrics import get_metric_engine
 from tqdm import tqdm
 
 
@@ -35,22 +36,9 @@ def evaluate_model(args):
         config=config,
     )
 
-    # Define metrics
-    mae = torch.nn.L1Loss()
-    esr = auraloss.time.ESRLoss()
-    dc = auraloss.time.DCLoss()
-    mrstft = auraloss.freq.MultiResolutionSTFTLoss(
-        fft_sizes=[1024, 2048, 8192],
-        hop_sizes=[256, 512, 2048],
-        win_lengths=[1024, 2048, 8192],
-        scale="mel",
-        n_bins=128,
-        sample_rate=config["sample_rate"],
-        perceptual_weighting=True,
-    )
-
-    criterions = [mae, esr, dc, mrstft]
-    test_results = {"eval/mae": [], "eval/esr": [], "eval/dc": [], "eval/mrstft": []}
+    # All metrics in one pass, target spectra cached for the next evaluations
+    engine = get_metric_engine(config["sample_rate"])
+    engine.reset()
 
     rtf_list = []
 
@@ -58,26 +46,8 @@ def evaluate_model(args):
     # print(f"Sample rate: {config['sample_rate']} Hz")
 
     # Load data
-    if config["dataset"] == "egfxset":
-        _, _, test_loader = load_egfxset(
-            args.data_dir,
-            batch_size=config["batch_size"],
-            num_workers=args.num_workers,
-        )
-    elif config["dataset"] == "springset":
-        _, _, test_loader = load_springset(
-            args.data_dir,
-            batch_size=config["batch_size"],
-            num_workers=args.num_workers,
-        )
-    elif config["dataset"] == "customset":
-        _, _, test_loader = load_customset(
-            args.data_dir,
-            batch_size=config["batch_size"],
-            num_workers=args.num_workers,
-        )
-    else:
-        raise ValueError("Dataset not found, options are: egfxset or springset")
+    test_loader = load_test_loader(config, args)
+    test_key = test_set_key(test_loader)
 
     num_batches = len(test_loader)
     sr_tag = str(int(config["sample_rate"] / 1000)) + "k"
@@ -95,6 +65,7 @@ def evaluate_model(args):
         c = None
 
     model.eval()
+    precompute_film(model, c)
     with torch.no_grad():
         for step, (dry, wet) in enumerate(
             tqdm(test_loader, total=num_batches, desc="Processing batches")
@@ -106,6 +77,8 @@ def evaluate_model(args):
             input = dry.to(args.device)
             target = wet.to(args.device)
             pred = model(input, c)
+            if pred.is_cuda:
+                torch.cuda.synchronize()
 
             # end_time = datetime.now()
             end_time = time.perf_counter()
@@ -115,10 +88,8 @@ def evaluate_model(args):
             rtf = duration / length_in_seconds
             rtf_list.append(rtf)
 
-            # Compute metrics means for current batch
-            for metric, name in zip(criterions, test_results.keys()):
-                batch_score = metric(pred, target).item()
-                test_results[name].append(batch_score)
+            # Accumulated on the device, the test loader is not shuffled
+            engine.update(pred, target, key=(test_key, step))
 
             # Save audios from last batch
             if step == num_batches - 1:
@@ -144,10 +115,116 @@ def evaluate_model(args):
                 save_target = f"{args.audio_dir}/eval/target-{label}.wav"
                 torchaudio.save(save_target, target, config["sample_rate"])
 
-    mean_test_results = {k: sum(v) / len(v) for k, v in test_results.items()}
+    mean_test_results = {f"eval/{k}": v for k, v in engine.compute().items()}
     avg_rtf = sum(rtf_list) / len(rtf_list)
     mean_test_results["eval/rtf"] = avg_rtf
 
     wandb.log(mean_test_results)
 
     wandb.finish()
+
+
+def list_checkpoints(models_dir, dataset=None):
+    """Checkpoints of a folder grouped by (dataset, sample rate)."""
+    groups = {}
+    for checkpoint_path in sorted(Path(models_dir).glob("*.pt")):
+        checkpoint = load_checkpoint(checkpoint_path)
+        config = checkpoint.get("config_state_dict")
+        if config is None:
+            print(f"Skipping {checkpoint_path.name}: no configuration")
+            continue
+        if dataset is not None and config["dataset"] != dataset:
+            continue
+        key = (config["dataset"], config["sample_rate"])
+        groups.setdefault(key, []).append(checkpoint_path)
+    return groups
+
+
+def print_comparison(rows):
+    header = f"{'checkpoint':<48} {'params':>8} {'mae':>8} {'esr':>8} {'dc':>10} {'mrstft':>8} {'rtf':>8}"
+    print(header)
+    print("-" * len(header))
+    for row in rows:
+        print(
+            f"{row['checkpoint']:<48} {row['params']:>8} {row['mae']:>8.4f} {row['esr']:>8.4f} "
+            f"{row['dc']:>10.2e} {row['mrstft']:>8.4f} {row['rtf']:>8.4f}"
+        )
+
+
+def evaluate_many(args):
+    """
+    Evaluate every checkpoint of the models folder with a single pass over each test set.
+
+    The checkpoints are grouped by dataset and sample rate. For each group the test loader
+    is built once and every batch goes through all the models of the group. The comparison
+    table is printed and saved as `eval-many-TIMESTAMP.csv` in the log folder.
+    """
+    groups = list_checkpoints(args.models_dir, args.dataset)
+    if not groups:
+        raise ValueError(f"No checkpoint found in {args.models_dir}")
+
+    rows = []
+    for (dataset, sample_rate), checkpoint_paths in groups.items():
+        print(f"Evaluating {len(checkpoint_paths)} models on {dataset} at {sample_rate} Hz")
+
+        models = []
+        for checkpoint_path in checkpoint_paths:
+            model_args = copy.copy(args)
+            model_args.checkpoint = str(checkpoint_path)
+            model, _, _, config, rf, params = load_model_checkpoint(model_args)
+            # Quantized models only run on the CPU
+            device = torch.device("cpu") if config.get("quantized", False) else args.device
+            model.to(device).eval()
+            precompute_film(model, get_condition(config, config["batch_size"], device))
+            models.append((checkpoint_path.stem, model, config, params, device))
+
+        test_loader = load_test_loader(models[0][2], args)
+        test_key = test_set_key(test_loader)
+        engine = get_metric_engine(sample_rate)
+        rtf_sums = {name: 0.0 for name, *_ in models}
+
+        with torch.no_grad():
+            for step, (dry, wet) in enumerate(
+                tqdm(test_loader, total=len(test_loader), desc="Processing batches")
+            ):
+                length_in_seconds = dry.size(-1) / sample_rate
+                for name, model, config, params, device in models:
+                    input = dry.to(device)
+                    target = wet.to(device)
+                    c = get_condition(config, input.size(0), device)
+
+                    start_time = time.perf_counter()
+                    pred = model(input, c)
+                    if pred.is_cuda:
+                        torch.cuda.synchronize()
+                    rtf_sums[name] += (time.perf_counter() - start_time) / length_in_seconds
+
+                    # Target spectra computed by the first model, reused by the others
+                    engine.update(pred, target, key=(test_key, step), group=name)
+
+        for name, model, config, params, device in models:
+            scores = engine.compute(group=name)
+            engine.reset(group=name)
+            rows.append(
+                {
+                    "checkpoint": name,
+                    "dataset": dataset,
+                    "sample_rate": sample_rate,
+                    "params": params,
+                    **scores,
+                    "rtf": rtf_sums[name] / len(test_loader),
+                }
+            )
+        del models
+        torch.cuda.empty_cache()
+
+    timestamp = datetime.now().strftime("%Y%m%d-%H%M%S")
+    summary_path = Path(args.log_dir) / f"eval-many-{timestamp}.csv"
+    summary_path.parent.mkdir(parents=True, exist_ok=True)
+    with open(summary_path, "w", newline="") as f:
+        writer = csv.DictWriter(f, fieldnames=list(rows[0]))
+        writer.writeheader()
+        writer.writerows(rows)
+
+    print_comparison(rows)
+    print(f"Comparison saved to {summary_path}")
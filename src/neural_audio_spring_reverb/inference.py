@@ -1,3 +1,4 @@
+import soundfile
 import torch
 import torchaudio
 import os
@@ -5,8 +6,65 @@ from random import sample
 from pathlib import Path
 from datetime import datetime
 import time
+import copy
+from concurrent.futures import ThreadPoolExecutor
 
-from .networks.model_utils import load_model_checkpoint
+from .networks.model_utils import load_model_checkpoint, get_condition
+from .networks.custom_layers import precompute_film
+from .streaming import make_streamable
+
+
+def render_chunked(model, input, c, chunk_size, rf=None) -> torch.Tensor:
+    """
+    Render a long signal chunk by chunk to bound the memory of the intermediate activations
+    =======================================================================================
+
+    Convolutional models (rf given): every chunk is prefixed with `rf` samples of history,
+    the warm-up region is discarded from the output (overlap-save), so the result matches a
+    single pass over the whole signal.
+    Recurrent models (rf is None): the chunks are processed in order by a streamable copy
+    of the model that carries the hidden state across chunks.
+
+    Parameters
+    ----------
+    model : torch.nn.Module
+        Model in eval mode
+    input : torch.Tensor
+        Input signal shape: [batch, channels, samples], can live on the CPU
+    c : torch.Tensor or None
+        Condition tensor shape: [batch, cond_dim]
+    chunk_size : int
+        Number of new output samples computed per forward pass
+    rf : int or None
+        Receptive field of the model in samples
+
+    Returns
+    -------
+    torch.Tensor
+        Processed signal on the CPU, same shape as the input signal
+    """
+    device = next(model.parameters()).device
+    num_samples = input.size(-1)
+    pred = torch.zeros(input.shape, dtype=input.dtype)
+
+    if rf is None:
+        model = copy.deepcopy(model)
+        latency = make_streamable(model)
+        # Delay the output by the latency of the model and drop it at the end
+        input = torch.nn.functional.pad(input, (0, latency))
+        pred = torch.nn.functional.pad(pred, (0, latency))
+        for start in range(0, input.size(-1), chunk_size):
+            stop = min(start + chunk_size, input.size(-1))
+            pred[..., start:stop] = model(input[..., start:stop].to(device), c).cpu()
+        return pred[..., latency : latency + num_samples]
+
+    for start in range(0, num_samples, chunk_size):
+        stop = min(start + chunk_size, num_samples)
+        begin = max(0, start - rf)  # history needed by the first output sample
+        chunk_pred = model(input[..., begin:stop].to(device), c)
+        pred[..., start:stop] = chunk_pred[..., start - begin :].cpu()
+
+    return pred
 
 
 def make_inference(args) -> torch.Tensor:
@@ -32,30 +90,33 @@ def make_inference(args) -> torch.Tensor:
     else:
         input = torch.tensor(args.input, dtype=torch.float32)
 
-    # Get the batch size from the model checkpoint parameters
-    batch_size = config["batch_size"]
+    chunk_size = getattr(args, "chunk_size", None)
+    if chunk_size is not None:
+        # Single stream, chunks are moved to the device one at a time
+        batch_size = 1
+        input = input.reshape(batch_size, 1, -1)
+    else:
+        # Get the batch size from the model checkpoint parameters
+        batch_size = config["batch_size"]
 
-    # Reshape the input with the dynamically obtained batch size
-    input = input.reshape(batch_size, 1, -1).to(args.device)
+        # Reshape the input with the dynamically obtained batch size
+        input = input.reshape(batch_size, 1, -1).to(args.device)
 
     # Get the condition tensor
-    if config["cond_dim"] > 0:
-        c_values = [config.get(f"c{i}", 0.0) for i in range(config["cond_dim"])]
-        c = (
-            torch.tensor(c_values, device=args.device, requires_grad=False)
-            .view(1, -1)
-            .repeat(config["batch_size"], 1)
-        )
-    else:
-        c = None
+    c = get_condition(config, batch_size, args.device)
 
     model.eval()
+    # The conditioning is constant: FiLM coefficients are computed once
+    precompute_film(model, c)
     with torch.no_grad():
         # start_time = datetime.now()
         start_time = time.perf_counter()
 
         # Process audio with the pre-trained model
-        pred = model(input, c)
+        if chunk_size is not None:
+            pred = render_chunked(model, input, c, chunk_size, rf)
+        else:
+            pred = model(input, c)
 
         # end_time = datetime.now()
         end_time = time.perf_counter()
@@ -89,3 +150,131 @@ def make_inference(args) -> torch.Tensor:
         pass
 
     return pred
+
+
+def list_batch_inputs(input_path):
+    """
+    List the audio files to process from a directory (all the .wav files in it)
+    or from a manifest (a text file with one path per line, '#' for comments).
+    """
+    input_path = Path(input_path)
+    if input_path.is_dir():
+        files = sorted(input_path.glob("*.wav"))
+    elif input_path.is_file():
+        with open(input_path, "r") as manifest:
+            lines = [line.strip() for line in manifest]
+        files = [Path(line) for line in lines if line and not line.startswith("#")]
+    else:
+        raise FileNotFoundError(f"Input '{input_path}' is not a directory or a manifest")
+
+    if not files:
+        raise ValueError(f"No audio files found in '{input_path}'")
+    return files
+
+
+def load_mono(audio_file, sample_rate):
+    """Decode an audio file as a mono tensor [1, samples] at the given sample rate."""
+    audio, file_sample_rate = torchaudio.load(audio_file)
+    audio = audio.mean(dim=0, keepdim=True)
+    if file_sample_rate != sample_rate:
+        audio = torchaudio.functional.resample(audio, file_sample_rate, sample_rate)
+    return audio
+
+
+def save_processed(pred, audio_file, config, audio_dir):
+    """Normalize, high-pass and save one processed file, as `make_inference` does."""
+    pred /= pred.abs().max()
+    pred = torchaudio.functional.highpass_biquad(pred, config["sample_rate"], 20)
+    pred /= torch.max(torch.abs(pred))
+
+    save_out = f"{audio_dir}/processed/{Path(audio_file).stem}*{config['name']}.wav"
+    torchaudio.save(save_out, pred, sample_rate=config["sample_rate"])
+
+
+def make_batch_inference(args):
+    """
+    Render many files through the same checkpoint
+    =============================================
+
+    The model is loaded once. The files are sorted by length and packed into
+    zero-padded batches of `args.batch_size` files of similar length.
+    Decoding and encoding run on a pool of `args.num_workers` threads:
+    the next batch is decoded and the previous one is written while the model runs.
+
+    Parameters
+    ----------
+    args.input : str
+        Directory of .wav files or manifest with one path per line
+    args.chunk_size : int, optional
+        Render each batch in chunks of this many samples (see `render_chunked`)
+    """
+    model, _, _, config, rf, params = load_model_checkpoint(args)
+    model.eval()
+    precompute_film(model)
+
+    sample_rate = config["sample_rate"]
+    chunk_size = getattr(args, "chunk_size", None)
+
+    files = list_batch_inputs(args.input)
+
+    # Sort by duration so that each batch needs as little padding as possible
+    lengths = [soundfile.info(str(f)).duration for f in files]
+    files = [f for _, f in sorted(zip(lengths, files), key=lambda pair: pair[0])]
+    batches = [
+        files[i : i + args.batch_size] for i in range(0, len(files), args.batch_size)
+    ]
+    print(f"Processing {len(files)} files in {len(batches)} batches")
+
+    os.makedirs(f"{args.audio_dir}/processed", exist_ok=True)
+
+    total_seconds = 0.0
+    start_time = time.perf_counter()
+
+    with ThreadPoolExecutor(max_workers=max(1, args.num_workers)) as pool:
+        next_audios = [pool.submit(load_mono, f, sample_rate) for f in batches[0]]
+        saved = []
+
+        for idx, batch in enumerate(batches):
+            audios = [future.result() for future in next_audios]
+            # Start decoding the next batch before running the model
+            if idx + 1 < len(batches):
+                next_audios = [
+                    pool.submit(load_mono, f, sample_rate) for f in batches[idx + 1]
+                ]
+
+            num_samples = [audio.size(-1) for audio in audios]
+            max_samples = max(num_samples)
+            input = torch.stack(
+                [
+                    torch.nn.functional.pad(audio, (0, max_samples - audio.size(-1)))
+                    for audio in audios
+                ]
+            )  # [batch, 1, samples]
+            c = get_condition(config, len(audios), args.device)
+
+            with torch.no_grad():
+                if chunk_size is not None:
+                    pred = render_chunked(model, input, c, chunk_size, rf)
+                else:
+                    pred = model(input.to(args.device), c).cpu()
+
+            # The zero padding at the end does not affect the output of causal models
+            # (the GRU max pooling looks kernel_size // 2 samples ahead)
+            for audio_file, n, p in zip(batch, num_samples, pred):
+                saved.append(
+                    pool.submit(
+                        save_processed,
+                        p[..., :n].clone(),
+                        audio_file,
+                        config,
+                        args.audio_dir,
+                    )
+                )
+            total_seconds += sum(num_samples) / sample_rate
+
+        for future in saved:
+            future.result()
+
+    duration = time.perf_counter() - start_time
+    print(f"Processed {total_seconds:.1f} s of audio in {duration:.1f} s")
+    print(f"Throughput: {total_seconds / duration:.2f} s of audio per second")
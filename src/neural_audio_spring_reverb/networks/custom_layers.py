@@ -3,6 +3,10 @@ import torch.nn as nn
 import torch.nn.functional as F
 
 from torch import Tensor
+from typing import Optional, Tuple
+
+# Kernel size from which Conv1dCausal runs in the frequency domain by default
+FFT_KERNEL_THRESHOLD = 32
 
 
 class FiLM(nn.Module):
@@ -29,7 +33,19 @@ class FiLM(nn.Module):
         if batch_norm is True:
             self.bn = nn.BatchNorm1d(n_features)
 
+        # Inference: coefficients of the last conditioning vector (see precompute_film)
+        self.cache_coefficients = False
+        self._cond_cache = torch.empty(0)
+        self._scale_cache = torch.empty(0)
+        self._shift_cache = torch.empty(0)
+        self._register_load_state_dict_pre_hook(self._clear_cache_hook)
+
     def forward(self, x: Tensor, cond: Tensor) -> Tensor:
+        if not self.training:
+            # BN and FiLM in a single affine
+            scale, shift = self.coefficients(x, cond)
+            return torch.addcmul(shift, x, scale)
+
         cond = self.adaptor(cond)
         g, b = torch.chunk(cond, 2, dim=-1)
         g = g.unsqueeze(-1)
@@ -41,6 +57,155 @@ class FiLM(nn.Module):
         x = (x * g) + b  # Then apply conditional affine
         return x
 
+    def coefficients(self, x: Tensor, cond: Tensor) -> Tuple[Tensor, Tensor]:
+        """BN and FiLM as a single per-channel affine: forward(x, cond) == x * scale + shift.
+
+        In training the BN statistics are taken from x and the running statistics
+        are updated, as in nn.BatchNorm1d.
+
+        In eval mode with `cache_coefficients` set, the coefficients are computed once
+        per conditioning vector and reused until the vector or the weights change.
+
+        Returns:
+            Tuple[Tensor, Tensor]: scale and shift of shape (batch_size, n_features, 1).
+        """
+        if not self.training and self.cache_coefficients:
+            if self._cond_cache.device == cond.device and torch.equal(
+                self._cond_cache, cond
+            ):
+                return self._scale_cache, self._shift_cache
+            scale, shift = self._compute_coefficients(x, cond)
+            self._cond_cache = cond.detach().clone()
+            self._scale_cache = scale.detach()
+            self._shift_cache = shift.detach()
+            return self._scale_cache, self._shift_cache
+
+        return self._compute_coefficients(x, cond)
+
+    def _compute_coefficients(self, x: Tensor, cond: Tensor) -> Tuple[Tensor, Tensor]:
+        cond = self.adaptor(cond)
+        g, b = torch.chunk(cond, 2, dim=-1)
+        g = g.unsqueeze(-1)
+        b = b.unsqueeze(-1)
+
+        if hasattr(self, "bn"):
+            if self.training:
+                mean, var = self._batch_stats(x)
+            else:
+                mean = self.bn.running_mean
+                var = self.bn.running_var
+                assert mean is not None
+                assert var is not None
+            bn_scale = self.bn.weight * torch.rsqrt(var + self.bn.eps)
+            bn_shift = self.bn.bias - mean * bn_scale
+            b = g * bn_shift.unsqueeze(-1) + b
+            g = g * bn_scale.unsqueeze(-1)
+        return g, b
+
+    def clear_cache(self) -> None:
+        self._cond_cache = torch.empty(0)
+        self._scale_cache = torch.empty(0)
+        self._shift_cache = torch.empty(0)
+
+    def train(self, mode: bool = True):
+        # The weights can change in training
+        self.clear_cache()
+        return super().train(mode)
+
+    def _clear_cache_hook(self, *args, **kwargs) -> None:
+        self.clear_cache()
+
+    @torch.jit.unused
+    def _batch_stats(self, x: Tensor) -> Tuple[Tensor, Tensor]:
+        # Statistics in float32 like BatchNorm under autocast, the running stats are float32
+        x = x.float()
+        mean = x.mean(dim=(0, 2))
+        var = x.var(dim=(0, 2), unbiased=False)
+        if self.bn.track_running_stats:
+            with torch.no_grad():
+                self.bn.num_batches_tracked.add_(1)
+                if self.bn.momentum is None:  # cumulative moving average
+                    momentum = 1.0 / float(self.bn.num_batches_tracked)
+                else:
+                    momentum = self.bn.momentum
+                n = x.numel() / x.size(1)
+                self.bn.running_mean.lerp_(mean, momentum)
+                self.bn.running_var.lerp_(var * n / max(n - 1, 1), momentum)
+        return mean, var
+
+
+def _next_pow2(n: int) -> int:
+    p = 1
+    while p < n:
+        p *= 2
+    return p
+
+
+def fft_conv1d(
+    x: Tensor, weight: Tensor, bias: Optional[Tensor] = None, dilation: int = 1
+) -> Tensor:
+    """Valid 1D cross-correlation computed with FFTs, same result as `F.conv1d`
+    without padding and with stride 1.
+
+    The dilated kernel is split into `dilation` polyphase components, so the FFT size
+    depends on the kernel size only. The correlation is computed by overlap-save over
+    blocks of the input, and the channels are mixed in the frequency domain.
+    Computed in float32, the output has the dtype of the input.
+
+    Parameters:
+        x (Tensor): Input of shape (batch_size, in_ch, samples), already padded.
+        weight (Tensor): Kernel of shape (out_ch, in_ch, kernel_size).
+        bias (Tensor, optional): Bias of shape (out_ch,).
+        dilation (int, optional): Spacing between kernel elements.
+
+    Returns:
+        Tensor: Output of shape (batch_size, out_ch, samples - (kernel_size - 1) * dilation).
+    """
+    dtype = x.dtype
+    x = x.float()
+    weight = weight.float()
+    batch_size = x.size(0)
+    in_ch = x.size(1)
+    n_in = x.size(-1)
+    out_ch = weight.size(0)
+    kernel_size = weight.size(-1)
+    n_out = n_in - (kernel_size - 1) * dilation
+
+    # Polyphase: sample n = m * dilation + r, one undilated correlation per phase r
+    n_phase = (n_in + dilation - 1) // dilation
+    if dilation > 1:
+        x = F.pad(x, (0, n_phase * dilation - n_in))
+        x = x.reshape(batch_size, in_ch, n_phase, dilation).permute(0, 3, 1, 2)
+        x = x.reshape(batch_size * dilation, in_ch, n_phase)
+
+    # Overlap-save: each frame of n_fft inputs gives `step` valid outputs
+    n_valid = n_phase - kernel_size + 1
+    n_fft = min(
+        _next_pow2(max(4 * kernel_size, 64)),
+        _next_pow2(n_valid + kernel_size - 1),
+    )
+    step = n_fft - kernel_size + 1
+    n_frames = (n_valid + step - 1) // step
+    x = F.pad(x, (0, n_frames * step + kernel_size - 1 - n_phase))
+    frames = x.unfold(-1, n_fft, step)  # (batch, in_ch, n_frames, n_fft)
+
+    # Correlation is the convolution with the flipped kernel
+    x_f = torch.fft.rfft(frames, n=n_fft)
+    w_f = torch.fft.rfft(weight.flip(-1), n=n_fft)
+    y_f = torch.einsum("bcnf,ocf->bonf", x_f, w_f)
+    y = torch.fft.irfft(y_f, n=n_fft)[..., kernel_size - 1 :]
+    y = y.reshape(y.size(0), out_ch, n_frames * step)[..., :n_valid]
+
+    # Interleave the phases back
+    if dilation > 1:
+        y = y.reshape(batch_size, dilation, out_ch, n_valid).permute(0, 2, 3, 1)
+        y = y.reshape(batch_size, out_ch, n_valid * dilation)
+    y = y[..., :n_out]
+
+    if bias is not None:
+        y = y + bias.float().view(1, -1, 1)
+    return y.to(dtype)
+
 
 class Conv1dCausal(nn.Module):  # Conv1d with cache
     """Causal 1D convolutional layer
@@ -53,6 +218,8 @@ class Conv1dCausal(nn.Module):  # Conv1d with cache
         stride (int): Stride of the convolution.
         dilation (int, optional): Spacing between kernel elements.
         bias (bool, optional): If True, adds a learnable bias to the output.
+        fft (bool, optional): Compute the convolution with FFTs. If None, used when
+            kernel_size >= FFT_KERNEL_THRESHOLD. The weights are the same in both modes.
 
     Returns:
         Tensor: The output of the causal 1D convolutional layer.
@@ -66,12 +233,18 @@ class Conv1dCausal(nn.Module):  # Conv1d with cache
         stride: int,
         dilation: int = 1,
         bias: bool = True,
+        fft: Optional[bool] = None,
     ) -> None:
         super().__init__()
         self.padding = (
             kernel_size - 1
         ) * dilation  # input_len == output_len when stride=1
         self.in_channels = in_channels
+        self.dilation = dilation
+        self.stride = stride
+        if fft is None:
+            fft = kernel_size >= FFT_KERNEL_THRESHOLD
+        self.use_fft = fft and stride == 1  # strided convolutions stay direct
         self.conv = nn.Conv1d(
             in_channels,
             out_channels,
@@ -84,9 +257,101 @@ class Conv1dCausal(nn.Module):  # Conv1d with cache
 
     def forward(self, x: Tensor) -> Tensor:
         x = F.pad(x, (self.padding, 0))  # standard zero padding
-        x = self.conv(x)
+        if self.use_fft:
+            x = fft_conv1d(x, self.conv.weight, self.conv.bias, self.dilation)
+        else:
+            x = self.conv(x)
+        return x
+
+
+class PaddingCached(nn.Module):
+    """Cached padding for cached convolutions."""
+
+    def __init__(self, n_ch: int, padding: int) -> None:
+        super().__init__()
+        self.n_ch = n_ch
+        self.padding = padding
+        self.register_buffer("pad_buf", torch.zeros((1, n_ch, padding)))
+
+    def forward(self, x: Tensor) -> Tensor:
+        assert x.ndim == 3  # (batch_size, in_ch, samples)
+        if self.padding == 0:  # nothing to cache, x[..., -0:] would keep all of x
+            return x
+        bs = x.size(0)
+        if bs > self.pad_buf.size(0):  # Perform resizing once if batch size is not 1
+            self.pad_buf = self.pad_buf.repeat(bs, 1, 1)
+        x = torch.cat([self.pad_buf, x], dim=-1)  # concat input signal to the cache
+        self.pad_buf = x[..., -self.padding :]  # discard old cache
         return x
 
+    def reset(self) -> None:
+        """Clear the cache, as if the stream started from silence."""
+        self.pad_buf = torch.zeros_like(self.pad_buf)
+
+
+class Conv1dCached(nn.Module):  # Conv1d with cache
+    """Cached causal convolution for streaming."""
+
+    def __init__(self, convcausal: Conv1dCausal) -> None:
+        super().__init__()
+        padding = convcausal.padding  # input_len == output_len when stride=1
+        self.pad = PaddingCached(convcausal.in_channels, convcausal.padding)
+        self.conv = convcausal.conv
+        self.dilation = convcausal.dilation
+        self.use_fft = convcausal.use_fft
+
+    def forward(self, x: Tensor) -> Tensor:
+        x = self.pad(x)  # get (cached input + current input)
+        if self.use_fft:
+            x = fft_conv1d(x, self.conv.weight, self.conv.bias, self.dilation)
+        else:
+            x = self.conv(x)
+        return x
+
+    def reset(self) -> None:
+        self.pad.reset()
+
+
+def set_conv_mode(model: nn.Module, mode: str = "auto") -> None:
+    """Select how the causal convolutions of a model are computed.
+
+    Parameters:
+        model (nn.Module): Model containing Conv1dCausal or Conv1dCached layers.
+        mode (str): "direct" (nn.Conv1d), "fft" (fft_conv1d) or "auto"
+            (fft_conv1d when kernel_size >= FFT_KERNEL_THRESHOLD).
+    """
+    if mode not in ["auto", "direct", "fft"]:
+        raise ValueError(f"Unknown conv mode: {mode}, options are: auto, direct or fft")
+    for module in model.modules():
+        if isinstance(module, (Conv1dCausal, Conv1dCached)):
+            if mode == "auto":
+                use_fft = module.conv.kernel_size[0] >= FFT_KERNEL_THRESHOLD
+            else:
+                use_fft = mode == "fft"
+            module.use_fft = use_fft and module.conv.stride[0] == 1
+
+
+def precompute_film(model: nn.Module, cond: Optional[Tensor] = None) -> None:
+    """Cache the FiLM coefficients of a model for inference.
+
+    BN (with its running statistics) and the FiLM affine of every FiLM layer are folded
+    into one scale and shift per channel, which are reused for as long as the
+    conditioning vector is the same. Leaving eval mode clears the caches.
+
+    Parameters:
+        model (nn.Module): Model in eval mode.
+        cond (Tensor, optional): Conditioning vector of shape (batch_size, cond_dim),
+            the coefficients are computed right away.
+    """
+    for module in model.modules():
+        if isinstance(module, FiLM):
+            module.cache_coefficients = True
+            module.clear_cache()
+            if cond is not None and not module.training:
+                with torch.no_grad():
+                    # x is only used for the BN statistics in training
+                    module.coefficients(cond.new_empty(0), cond)
+
 
 class GatedAF(nn.Module):
     """Gated activation function
@@ -111,6 +376,84 @@ class GatedAF(nn.Module):
         return x
 
 
+class FusedGatedFiLM(torch.autograd.Function):
+    """tanh(a) * sigmoid(b) + res, with [a, b] = x * scale + shift.
+
+    Only x, scale and shift are saved for the backward pass, where the affine and the
+    activations are recomputed, instead of the intermediate [B, 2C, T] tensors of the
+    separate FiLM, GatedAF and residual ops.
+    """
+
+    @staticmethod
+    def forward(ctx, x, scale, shift, res):
+        ctx.save_for_backward(x, scale, shift)
+        ctx.res_shape = res.shape
+        n = x.size(1) // 2
+        z = torch.addcmul(shift, x, scale)
+        out = torch.tanh(z[:, :n])
+        out.mul_(torch.sigmoid_(z[:, n:]))
+        return out.add_(res)
+
+    @staticmethod
+    def backward(ctx, grad):
+        x, scale, shift = ctx.saved_tensors
+        n = x.size(1) // 2
+        z = torch.addcmul(shift, x, scale)
+        t = torch.tanh(z[:, :n])
+        s = torch.sigmoid(z[:, n:])
+        grad_z = torch.cat([grad * s * (1 - t * t), grad * t * s * (1 - s)], dim=1)
+
+        grad_x = grad_scale = grad_shift = grad_res = None
+        if ctx.needs_input_grad[0]:
+            grad_x = grad_z * scale
+        if ctx.needs_input_grad[1]:
+            grad_scale = (grad_z * x).sum_to_size(scale.shape)
+        if ctx.needs_input_grad[2]:
+            grad_shift = grad_z.sum_to_size(shift.shape)
+        if ctx.needs_input_grad[3]:
+            grad_res = grad.sum_to_size(ctx.res_shape)
+        return grad_x, grad_scale, grad_shift, grad_res
+
+
+class FusedGatedAF(nn.Module):
+    """Gated activation function fused with the FiLM affine and the residual connection.
+
+    Computes tanh(a) * sigmoid(b) + res, with [a, b] = x * scale + shift, where scale
+    and shift come from `FiLM.coefficients`. Without autograd, x is modified in place.
+    Scripted with autograd, the ops are not fused (TorchScript cannot run the Function).
+
+    Returns:
+        Tensor: The output of the gated activation function plus the residual.
+    """
+
+    def __init__(self) -> None:
+        super().__init__()
+
+    def forward(self, x: Tensor, scale: Tensor, shift: Tensor, res: Tensor) -> Tensor:
+        needs_grad = (
+            x.requires_grad
+            or scale.requires_grad
+            or shift.requires_grad
+            or res.requires_grad
+        )
+        n = x.size(1) // 2
+        if needs_grad:
+            # TorchScript cannot call the autograd Function, same ops out of place
+            if torch.jit.is_scripting():
+                z = torch.addcmul(shift, x, scale)
+                return torch.tanh(z[:, :n]) * torch.sigmoid(z[:, n:]) + res
+            return self._autograd(x, scale, shift, res)
+
+        x = x.mul_(scale).add_(shift)
+        out = torch.tanh(x[:, :n])
+        out.mul_(torch.sigmoid_(x[:, n:]))
+        return out.add_(res)
+
+    @torch.jit.unused
+    def _autograd(self, x: Tensor, scale: Tensor, shift: Tensor, res: Tensor) -> Tensor:
+        return FusedGatedFiLM.apply(x, scale, shift, res)
+
+
 class TanhAF(nn.Module):
     """Tanh activation function
 
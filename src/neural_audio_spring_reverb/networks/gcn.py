@@ -2,7 +2,7 @@ import torch
 import torch.nn as nn
 
 from torch import Tensor
-from neural_audio_spring_reverb.networks.custom_layers import Conv1dCausal, FiLM, GatedAF, TanhAF
+from neural_audio_spring_reverb.networks.custom_layers import Conv1dCausal, FiLM, FusedGatedAF, TanhAF
 
 
 class GCNBlock(nn.Module):
@@ -44,20 +44,19 @@ class GCNBlock(nn.Module):
 
         self.film = FiLM(cond_dim=cond_dim, n_features=out_ch * 2)
 
-        self.gated_activation = GatedAF()
+        # FiLM, gated activation and residual connection are applied in one pass
+        self.gated_activation = FusedGatedAF()
 
         self.res = nn.Conv1d(
             in_channels=in_ch, out_channels=out_ch, kernel_size=(1,), bias=False
         )
 
     def forward(self, x: Tensor, cond: Tensor) -> Tensor:
-        x_in = x
+        x_res = self.res(x)  # Apply residual convolution
         x = self.conv(x)  # Apply causal convolution
-        if self.film is not None:  # Apply FiLM if conditional input is given
-            x = self.film(x, cond)
-        x = self.gated_activation(x)  # Apply gated activation function
-        x_res = self.res(x_in)  # Apply residual convolution
-        x = x + x_res  # Apply residual connection
+        scale, shift = self.film.coefficients(x, cond)  # FiLM as a per-channel affine
+        # Apply FiLM, gated activation function and residual connection
+        x = self.gated_activation(x, scale, shift, x_res)
         return x
 
 
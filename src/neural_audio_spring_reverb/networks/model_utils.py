@@ -8,6 +8,7 @@ from neural_audio_spring_reverb.networks.wavenet import WaveNet
 from neural_audio_spring_reverb.networks.gru import GRU
 from neural_audio_spring_reverb.networks.lstm import LSTM
 from neural_audio_spring_reverb.networks.gcn import GCN
+from neural_audio_spring_reverb.networks.custom_layers import set_conv_mode
 
 
 def parse_config(config_path):
@@ -19,6 +20,26 @@ def parse_config(config_path):
         return dict(config_dict)
 
 
+def get_condition(config, batch_size, device):
+    """
+    Build the conditioning tensor from the values c0, c1, ... stored in the config.
+
+    Returns:
+        torch.Tensor or None: Tensor of shape [batch_size, cond_dim], None if the
+        model is not conditioned.
+    """
+    if config["cond_dim"] > 0:
+        c_values = [config.get(f"c{i}", 0.0) for i in range(config["cond_dim"])]
+        c = (
+            torch.tensor(c_values, device=device, requires_grad=False)
+            .view(1, -1)
+            .repeat(batch_size, 1)
+        )
+    else:
+        c = None
+    return c
+
+
 def initialize_model(device, config):
     """
     Initialize a model based on the model type specified in the hparams.
@@ -107,6 +128,8 @@ def initialize_model(device, config):
     }
 
     model = model_dict[config["model_type"]](**filtered_hparams).to(device)
+    # Direct or FFT causal convolutions, the weights are the same in both modes
+    set_conv_mode(model, config.get("conv_mode", "auto"))
     print(f"Configuration name: {config['name']}")
 
     # Conditionally compute the receptive field for certain model types
@@ -124,6 +147,17 @@ def initialize_model(device, config):
     return model, rf, params
 
 
+def load_checkpoint(checkpoint_path, map_location="cpu"):
+    """
+    Load the dict of a checkpoint, quantized checkpoints included.
+
+    The packed weights of dynamically quantized layers are script objects, that
+    `torch.load` only accepts once they are allowed explicitly.
+    """
+    with torch.serialization.safe_globals([torch.ScriptObject]):
+        return torch.load(checkpoint_path, map_location=map_location)
+
+
 def load_model_checkpoint(args):
     """
     Load a model checkpoint from a given path.
@@ -153,13 +187,22 @@ def load_model_checkpoint(args):
             Total number of trainable parameters in the model.
     """
 
-    checkpoint = torch.load(args.checkpoint, map_location=args.device)
+    checkpoint = load_checkpoint(args.checkpoint, map_location=args.device)
     model_state_dict = checkpoint.get("model_state_dict")
     optimizer_state_dict = checkpoint.get("optimizer_state_dict", None)
     scheduler_state_dict = checkpoint.get("scheduler_state_dict", None)
     loaded_config = checkpoint["config_state_dict"]
 
     model, rf, params = initialize_model(args.device, loaded_config)
+    if loaded_config.get("quantized", False):
+        # int8 modules, CPU only
+        from neural_audio_spring_reverb.quantize import quantize_model
+
+        model = quantize_model(
+            model,
+            static=loaded_config.get("quantize_static", True),
+            dynamic=loaded_config.get("quantize_dynamic", True),
+        )
     model.load_state_dict(model_state_dict)
 
     return model, optimizer_state_dict, scheduler_state_dict, loaded_config, rf, params
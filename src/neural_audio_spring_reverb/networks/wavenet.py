@@ -5,7 +5,7 @@ import torch.nn.functional as F
 
 from torch import Tensor
 from typing import Dict, List, Optional, Tuple, Union
-from neural_audio_spring_reverb.networks.custom_layers import Conv1dCausal, GatedAF, TanhAF, FiLM
+from neural_audio_spring_reverb.networks.custom_layers import Conv1dCausal, FusedGatedAF, TanhAF, FiLM
 
 
 class Conv1dStack(nn.Module):
@@ -43,20 +43,19 @@ class Conv1dStack(nn.Module):
         # FiLM layer
         self.film = FiLM(cond_dim=cond_dim, n_features=out_ch * 2)
 
-        # Gated activation function
-        self.gated_activation = GatedAF()
+        # Gated activation function, fused with FiLM and the residual connection
+        self.gated_activation = FusedGatedAF()
 
         self.res = nn.Conv1d(
             in_channels=in_ch, out_channels=out_ch, kernel_size=(1,), bias=False
         )
 
     def forward(self, x: Tensor, cond: Tensor) -> Tensor:
-        x_in = x
+        x_res = self.res(x)  # Apply residual convolution
         x = self.conv(x)  # Apply causal convolution
-        x = self.film(x, cond)  # Apply FiLM
-        x = self.gated_activation(x)  # Apply gated activation function
-        x_res = self.res(x_in)  # Apply residual convolution
-        x = x + x_res  # Apply residual connection
+        scale, shift = self.film.coefficients(x, cond)  # FiLM as a per-channel affine
+        # Apply FiLM, gated activation function and residual connection
+        x = self.gated_activation(x, scale, shift, x_res)
         return x
 
 
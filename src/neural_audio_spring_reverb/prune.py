@@ -0,0 +1,267 @@
+import copy
+import time
+import torch
+import torch.nn as nn
+
+from datetime import datetime
+from pathlib import Path
+
+from .data.loaders import load_loaders
+from .networks.custom_layers import FiLM
+from .networks.gcn import GCN, GCNBlock
+from .networks.tcn import TCN, TCNBlock
+from .networks.wavenet import WaveNet, Conv1dStack
+from .networks.model_utils import (
+    load_model_checkpoint,
+    save_model_checkpoint,
+    get_condition,
+)
+
+"""
+Structured channel pruning
+==========================
+The same number of channels is removed from every block of a TCN, GCN or WaveNet,
+so the pruned model is an ordinary (smaller) model of the same type with
+`n_channels` lowered in its config. In each block the channels are ranked by:
+    - activation: mean absolute output of the channel (gated activation plus residual)
+      on the validation set;
+    - magnitude: L1 norm of the weights producing the channel (causal and residual
+      convolutions).
+The lowest ranked channels are removed with the matching rows and columns of the causal
+convolution, FiLM (adaptor and BatchNorm), the residual convolution and the input of the
+next block or of out_net. The pruned model is then fine-tuned with train_model.
+"""
+
+BLOCKS = (TCNBlock, GCNBlock, Conv1dStack)
+
+
+def get_blocks(model):
+    """Blocks in the order of the signal flow."""
+    if isinstance(model, (GCN, TCN)):
+        return list(model.blocks)
+    elif isinstance(model, WaveNet):
+        return [stack for block in model.blocks for stack in block.stacks]
+    raise ValueError(
+        f"Pruning is only supported for TCN, GCN and WaveNet, not {type(model).__name__}"
+    )
+
+
+def block_channels(block) -> int:
+    return block.res.out_channels
+
+
+def output_rows(block, keep):
+    """Rows of the causal convolution that produce the kept channels."""
+    if isinstance(block, TCNBlock):
+        return keep
+    # Gated: tanh half and sigmoid half
+    return torch.cat([keep, keep + block_channels(block)])
+
+
+@torch.no_grad()
+def prune_conv(conv: nn.Conv1d, out_idx=None, in_idx=None) -> nn.Conv1d:
+    weight = conv.weight
+    bias = conv.bias
+    if out_idx is not None:
+        weight = weight[out_idx]
+        bias = bias[out_idx] if bias is not None else None
+    if in_idx is not None:
+        weight = weight[:, in_idx]
+
+    pruned = nn.Conv1d(
+        weight.size(1),
+        weight.size(0),
+        conv.kernel_size,
+        conv.stride,
+        padding=conv.padding,
+        dilation=conv.dilation,
+        bias=bias is not None,
+    ).to(device=weight.device, dtype=weight.dtype)
+    pruned.weight.copy_(weight)
+    if bias is not None:
+        pruned.bias.copy_(bias)
+    return pruned
+
+
+@torch.no_grad()
+def prune_film(film: FiLM, idx) -> None:
+    n_features = film.num_features
+    adaptor = film.adaptor
+    rows = torch.cat([idx, idx + n_features])  # scale rows, then shift rows
+    pruned = nn.Linear(adaptor.in_features, len(rows)).to(adaptor.weight.device)
+    pruned.weight.copy_(adaptor.weight[rows])
+    pruned.bias.copy_(adaptor.bias[rows])
+    film.adaptor = pruned
+
+    if hasattr(film, "bn"):
+        bn = film.bn
+        new_bn = nn.BatchNorm1d(len(idx), eps=bn.eps, momentum=bn.momentum).to(
+            bn.weight.device
+        )
+        new_bn.weight.copy_(bn.weight[idx])
+        new_bn.bias.copy_(bn.bias[idx])
+        new_bn.running_mean.copy_(bn.running_mean[idx])
+        new_bn.running_var.copy_(bn.running_var[idx])
+        new_bn.num_batches_tracked.copy_(bn.num_batches_tracked)
+        film.bn = new_bn
+    film.num_features = len(idx)
+    film.clear_cache()
+
+
+def prune_block(block, keep, in_idx=None) -> None:
+    rows = output_rows(block, keep)
+    block.conv.conv = prune_conv(block.conv.conv, rows, in_idx)
+    block.conv.in_channels = block.conv.conv.in_channels
+    if hasattr(block, "film"):
+        prune_film(block.film, rows)
+    block.res = prune_conv(block.res, keep, in_idx)
+    if hasattr(block, "act") and block.act.num_parameters > 1:
+        with torch.no_grad():
+            block.act.weight = nn.Parameter(block.act.weight[keep].clone())
+            block.act.num_parameters = len(keep)
+    if hasattr(block, "in_ch") and in_idx is not None:
+        block.in_ch = len(in_idx)
+    block.out_ch = len(keep)
+
+
+def magnitude_scores(block):
+    n = block_channels(block)
+    weight = block.conv.conv.weight.abs().sum(dim=(1, 2))
+    scores = weight[:n] if isinstance(block, TCNBlock) else weight[:n] + weight[n:]
+    return scores + block.res.weight.abs().sum(dim=(1, 2))
+
+
+def activation_scores(model, blocks, loader, config, device, max_batches):
+    """Mean absolute output of every channel of every block."""
+    sums = [None] * len(blocks)
+    handles = []
+
+    def make_hook(i):
+        def hook(module, inputs, output):
+            value = output.detach().abs().mean(dim=(0, 2))
+            sums[i] = value if sums[i] is None else sums[i] + value
+
+        return hook
+
+    for i, block in enumerate(blocks):
+        handles.append(block.register_forward_hook(make_hook(i)))
+
+    model.eval()
+    with torch.no_grad():
+        for step, (dry, _) in enumerate(loader):
+            if step >= max_batches:
+                break
+            dry = dry.to(device)
+            model(dry, get_condition(config, dry.size(0), device))
+
+    for handle in handles:
+        handle.remove()
+    return sums
+
+
+def prune_model(model, n_remove, scores):
+    """Remove the `n_remove` lowest scored channels of every block, in place."""
+    blocks = get_blocks(model)
+    in_idx = None
+    for block, score in zip(blocks, scores):
+        n = block_channels(block)
+        keep = torch.sort(torch.topk(score, n - n_remove).indices).values
+        prune_block(block, keep, in_idx)
+        in_idx = keep
+
+    model.out_net = prune_conv(model.out_net, None, in_idx)
+    n_channels = block_channels(blocks[0])
+    if hasattr(model, "channels"):
+        model.channels = [n_channels] * len(model.channels)
+    if isinstance(model, WaveNet):
+        model.n_channels = n_channels
+        for idx, wavenet_block in enumerate(model.blocks):
+            wavenet_block.out_ch = n_channels
+            if idx > 0:
+                wavenet_block.in_ch = n_channels
+    return n_channels
+
+
+def measure_rtf(model, config, device, seconds=5.0, repeats=5):
+    x = torch.randn(1, 1, int(seconds * config["sample_rate"]), device=device)
+    c = get_condition(config, 1, device)
+    model.eval()
+    times = []
+    with torch.no_grad():
+        model(x, c)
+        for _ in range(repeats):
+            start = time.perf_counter()
+            model(x, c)
+            times.append(time.perf_counter() - start)
+    return sorted(times)[len(times) // 2] / seconds
+
+
+def prune_checkpoint(args):
+    """Prune a checkpoint, save it and fine-tune it with train_model."""
+    model, _, _, config, rf, params = load_model_checkpoint(args)
+    blocks = get_blocks(model)
+    n_channels = block_channels(blocks[0])
+    n_remove = int(round(args.prune_ratio * n_channels))
+    if not 0 < n_remove < n_channels:
+        raise ValueError(f"Cannot remove {n_remove} of {n_channels} channels")
+
+    if args.prune_criterion == "activation":
+        _, valid_loader, _ = load_loaders(config, args)
+        scores = activation_scores(
+            model, blocks, valid_loader, config, args.device, args.calib_batches
+        )
+    elif args.prune_criterion == "magnitude":
+        scores = [magnitude_scores(block) for block in blocks]
+    else:
+        raise ValueError(
+            f"Unknown criterion: {args.prune_criterion}, options are: activation or magnitude"
+        )
+
+    rtf = measure_rtf(model, config, args.device)
+    pruned = copy.deepcopy(model)
+    new_channels = prune_model(pruned, n_remove, scores)
+    pruned_params = sum(p.numel() for p in pruned.parameters() if p.requires_grad)
+    pruned_rtf = measure_rtf(pruned, config, args.device)
+    print(
+        f"Channels: {n_channels} -> {new_channels}, parameters: {params} -> {pruned_params}, "
+        f"RTF: {rtf:.4f} -> {pruned_rtf:.4f}"
+    )
+
+    # The pruned model is a regular checkpoint, fine-tuned from a fresh optimizer
+    config = dict(config)
+    config.update(
+        {
+            "name": f"{config['name']}-pruned{new_channels}",
+            "n_channels": new_channels,
+            "params": pruned_params,
+            "min_valid_loss": None,
+            "max_epochs": config["current_epoch"] + args.finetune_epochs,
+        }
+    )
+    optimizer = torch.optim.Adam(pruned.parameters(), lr=config["lr"])
+    scheduler = torch.optim.lr_scheduler.ReduceLROnPlateau(
+        optimizer, "min", patience=config["lr_patience"], verbose=True
+    )
+    timestamp = datetime.now().strftime("%Y%m%d-%H%M%S")
+    sr_tag = str(int(config["sample_rate"] / 1000)) + "kHz"
+    label = f"{config['name']}-{config['dataset']}-{timestamp}-{sr_tag}"
+    save_model_checkpoint(
+        pruned,
+        config,
+        optimizer,
+        scheduler,
+        config["current_epoch"],
+        label,
+        None,
+        args,
+    )
+    print(f"Pruned model saved to {Path(args.models_dir) / f'{label}.pt'}")
+
+    if args.finetune_epochs > 0:
+        from .train import train_model
+
+        finetune_args = copy.copy(args)
+        finetune_args.checkpoint = str(Path(args.models_dir) / f"{label}.pt")
+        finetune_args.init = None
+        print(f"Fine-tuning for {args.finetune_epochs} epochs")
+        train_model(finetune_args)
@@ -0,0 +1,264 @@
+import copy
+import json
+import time
+import torch
+import torch.nn as nn
+import auraloss
+
+from torch.ao.quantization import (
+    QuantStub,
+    DeQuantStub,
+    get_default_qconfig,
+    prepare,
+    convert,
+    quantize_dynamic,
+)
+from datetime import datetime
+from pathlib import Path
+
+from .data.loaders import load_test_loader
+from .networks.custom_layers import Conv1dCausal
+from .networks.model_utils import load_checkpoint, load_model_checkpoint, get_condition
+
+"""
+Post-training int8 quantization for CPU inference
+=================================================
+    - static: the nn.Conv1d layers computed directly (residual and output 1x1
+      convolutions, small-kernel causal convolutions) run on int8 weights (per channel)
+      and int8 inputs, with the input and output ranges calibrated on the test set.
+      The causal convolutions computed with FFTs (kernel_size >= FFT_KERNEL_THRESHOLD)
+      stay in float, there is no int8 FFT path. Everything between the convolutions,
+      BatchNorm and FiLM included, stays in float;
+    - dynamic: nn.LSTM, nn.GRU and nn.Linear (FiLM adaptors) get int8 weights,
+      the activations are quantized on the fly.
+Each applicable combination of the two modes is timed on a
+test batch, and the fastest is kept only if it beats the float model by MIN_SPEEDUP:
+the quant/dequant steps can cost more than the int8 kernels save (e.g. a small RNN,
+quantized step by step), and a slower quantized model is not saved.
+"""
+
+MIN_SPEEDUP = 1.05
+TIMING_ROUNDS = 5
+
+
+class QuantConv1d(nn.Module):
+    """nn.Conv1d with float input and output, quantized by `quantize_model`."""
+
+    def __init__(self, conv: nn.Conv1d) -> None:
+        super().__init__()
+        self.quant = QuantStub()
+        self.conv = conv
+        self.dequant = DeQuantStub()
+
+    def forward(self, x):
+        return self.dequant(self.conv(self.quant(x)))
+
+
+def wrap_convs(module: nn.Module) -> None:
+    """Wrap the nn.Conv1d layers computed directly, FFT convolutions stay in float."""
+    for name, child in module.named_children():
+        if isinstance(child, nn.Conv1d):
+            setattr(module, name, QuantConv1d(child))
+        elif isinstance(child, Conv1dCausal) and child.use_fft:
+            continue
+        elif not isinstance(child, QuantConv1d):
+            wrap_convs(child)
+
+
+def quantization_modes(model: nn.Module) -> list:
+    """(static, dynamic) combinations that quantize at least one layer of the model."""
+    probe = copy.deepcopy(model)
+    wrap_convs(probe)
+    static = any(isinstance(m, QuantConv1d) for m in probe.modules())
+    dynamic = any(isinstance(m, (nn.LSTM, nn.GRU, nn.Linear)) for m in model.modules())
+    modes = [(True, False), (False, True), (True, True)]
+    return [mode for mode in modes if (static or not mode[0]) and (dynamic or not mode[1])]
+
+
+def get_engine() -> str:
+    engines = torch.backends.quantized.supported_engines
+    for engine in ["x86", "fbgemm", "qnnpack"]:
+        if engine in engines:
+            return engine
+    raise RuntimeError("No quantized engine available")
+
+
+def quantize_model(
+    model: nn.Module, calibrate=None, static: bool = True, dynamic: bool = True
+) -> nn.Module:
+    """
+    Quantize a model in place, on the CPU.
+
+    Parameters:
+        model (nn.Module): Float model.
+        calibrate (callable, optional): Called with the prepared model to record the
+            activation ranges. None only to rebuild the structure of a quantized
+            checkpoint before loading it.
+        static (bool, optional): int8 direct convolutions.
+        dynamic (bool, optional): int8 weights of the RNN and linear layers.
+
+    Returns:
+        nn.Module: The quantized model.
+    """
+    engine = get_engine()
+    torch.backends.quantized.engine = engine
+
+    model.to("cpu").eval()
+
+    if static:
+        wrap_convs(model)
+        qconfig = get_default_qconfig(engine)
+        for module in model.modules():
+            if isinstance(module, QuantConv1d):
+                module.qconfig = qconfig
+        prepare(model, inplace=True)
+        if calibrate is not None:
+            with torch.no_grad():
+                calibrate(model)
+        convert(model, inplace=True)
+
+    if dynamic:
+        quantize_dynamic(
+            model, {nn.LSTM, nn.GRU, nn.Linear}, dtype=torch.qint8, inplace=True
+        )
+    return model
+
+
+def time_forward(model, x, c, repeats=5):
+    with torch.no_grad():
+        model(x, c)  # warm-up
+        times = []
+        for _ in range(repeats):
+            start = time.perf_counter()
+            model(x, c)
+            times.append(time.perf_counter() - start)
+    return sorted(times)[len(times) // 2]
+
+
+def time_models(models, x, c, rounds=TIMING_ROUNDS):
+    """Median forward time of each model, measured in interleaved rounds so that the
+    drift of the machine affects all the models alike."""
+    times = [[] for _ in models]
+    for _ in range(rounds):
+        for model_times, model in zip(times, models):
+            model_times.append(time_forward(model, x, c, repeats=3))
+    return [sorted(model_times)[len(model_times) // 2] for model_times in times]
+
+
+def evaluate(model, loader, config):
+    """Mean ESR, MR-STFT and RTF of a model on a loader."""
+    esr = auraloss.time.ESRLoss()
+    mrstft = auraloss.freq.MultiResolutionSTFTLoss()
+    scores = {"esr": 0.0, "mrstft": 0.0, "rtf": 0.0}
+    n_batches = 0
+    with torch.no_grad():
+        for dry, wet in loader:
+            c = get_condition(config, dry.size(0), dry.device)
+            start = time.perf_counter()
+            pred = model(dry, c)
+            duration = time.perf_counter() - start
+            scores["rtf"] += duration / (dry.size(-1) / config["sample_rate"])
+            scores["esr"] += esr(pred, wet).item()
+            scores["mrstft"] += mrstft(pred, wet).item()
+            n_batches += 1
+    return {k: v / max(n_batches, 1) for k, v in scores.items()}
+
+
+def quantize_checkpoint(args):
+    """
+    Quantize a checkpoint with the fastest quantization mode, and save it with a report
+    against the float model. Nothing is saved if no mode beats the float model.
+    """
+    args.device = torch.device("cpu")  # quantized kernels run on the CPU
+    model, _, _, config, rf, params = load_model_checkpoint(args)
+    if config.get("quantized", False):
+        print("The checkpoint is already quantized")
+        return
+    model.eval()
+
+    test_loader = load_test_loader(config, args)
+
+    def calibrate(prepared):
+        for step, (dry, _) in enumerate(test_loader):
+            if step >= args.calib_batches:
+                break
+            prepared(dry, get_condition(config, dry.size(0), dry.device))
+
+    print(f"Calibrating on {args.calib_batches} batches of the test set")
+    candidates = []
+    for static, dynamic in quantization_modes(model):
+        # Each mode is rebuilt from the checkpoint, the float model is kept
+        qmodel, _, _, _, _, _ = load_model_checkpoint(args)
+        qmodel = quantize_model(qmodel, calibrate, static, dynamic)
+        candidates.append((static, dynamic, qmodel))
+    if not candidates:
+        print("Nothing to quantize")
+        return
+
+    # Speed of every mode on the same test batch, against the float model
+    dry, _ = next(iter(test_loader))
+    c = get_condition(config, dry.size(0), dry.device)
+    seconds = dry.size(-1) / config["sample_rate"]
+    times = time_models([model] + [qmodel for _, _, qmodel in candidates], dry, c)
+    rtf_float = times[0] / seconds
+    for (static, dynamic, _), time_int8 in zip(candidates, times[1:]):
+        print(
+            f"static: {static!s:<5} dynamic: {dynamic!s:<5} rtf: {time_int8 / seconds:.4f} (float: {rtf_float:.4f})"
+        )
+
+    best = min(range(len(candidates)), key=lambda i: times[i + 1])
+    static, dynamic, qmodel = candidates[best]
+    rtf_int8 = times[best + 1] / seconds
+    if rtf_int8 * MIN_SPEEDUP > rtf_float:
+        print(
+            f"Not saved: no quantized model is faster than the float model (RTF {rtf_int8:.4f} vs {rtf_float:.4f})"
+        )
+        return
+
+    float_scores = evaluate(model, test_loader, config)
+    int8_scores = evaluate(qmodel, test_loader, config)
+
+    report = {
+        "checkpoint": str(args.checkpoint),
+        "engine": get_engine(),
+        "static": static,
+        "dynamic": dynamic,
+        "rtf_batch_float": rtf_float,
+        "rtf_batch_int8": rtf_int8,
+    }
+    for key in float_scores:
+        report[f"{key}_float"] = float_scores[key]
+        report[f"{key}_int8"] = int8_scores[key]
+        report[f"{key}_delta"] = int8_scores[key] - float_scores[key]
+
+    quantized_config = dict(config)
+    quantized_config.update(
+        {"quantized": True, "quantize_static": static, "quantize_dynamic": dynamic}
+    )
+    save_optimized_checkpoint(qmodel, quantized_config, "int8", report, args)
+
+
+def save_optimized_checkpoint(model, config, suffix, report, args):
+    """
+    Save a model rewritten for inference as `{label}-{suffix}.pt` in the models folder,
+    with its report as `{label}-{suffix}.json`. The checkpoint has no optimizer state.
+    """
+    checkpoint = load_checkpoint(args.checkpoint)
+    label = f"{checkpoint.get('label', Path(args.checkpoint).stem)}-{suffix}"
+    save_path = Path(args.models_dir)
+    save_path.mkdir(parents=True, exist_ok=True)
+    torch.save(
+        {
+            "label": label,
+            "timestamp": datetime.now().strftime("%Y%m%d-%H%M%S"),
+            "model_state_dict": model.state_dict(),
+            "config_state_dict": config,
+        },
+        save_path / f"{label}.pt",
+    )
+    with open(save_path / f"{label}.json", "w") as f:
+        json.dump(report, f, indent=2)
+
+    for key, value in report.items():
+        print(f"{key:>16}: {value}")
+    print(f"Model saved to {save_path / f'{label}.pt'}")
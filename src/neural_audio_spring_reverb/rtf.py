@@ -1,33 +0,0 @@
-import torch
-import os
-from neural_audio_spring_reverb.inference import make_inference
-
-def setup_dummy_args(args):
-    """
-    Setup dummy arguments required for the make_inference function.
-    Adjust these settings based on your model's requirements.
-    """
-    num_channels = 1
-    num_samples = 48000
-    args.input = torch.randn(num_channels, num_samples).to(args.device)
-
-    # Other necessary arguments for your model
-    args.batch_size = 1  # Adjust based on your model's requirements
-    # args.sample_rate = 48000  # Adjust if your model expects a different sample rate
-    # args.checkpoint = "models/GCN-3-egfxset-20240324-160003-48kHz.pt"
-    # Placeholder for additional config parameters required by your model
-    # Adjust these or add more as necessary
-    # args.your_config_param = 'your_value'
-
-    return args
-
-def measure_rtf(args):
-    args = setup_dummy_args(args)
-
-    # Create the audio output directory if it doesn't exist
-    os.makedirs(args.audio_dir, exist_ok=True)
-
-    # Call the make_inference function
-    pred = make_inference(args)
-
-    print("Inference completed. Output tensor shape:", pred.shape)
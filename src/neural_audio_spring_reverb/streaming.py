@@ -0,0 +1,258 @@
+"""
+Block-streaming inference
+=========================
+Stateful processing of fixed-size audio blocks for all the architectures.
+
+The model is copied and its layers are swapped for cached versions that keep
+their state between calls:
+    - Conv1dCausal -> Conv1dCached (TCN, GCN, WaveNet and the LSTM/GRU front-end)
+    - nn.LSTM / nn.GRU -> RecurrentCached (hidden and cell state)
+    - nn.MaxPool1d -> MaxPool1dCached (GRU front-end, centered window)
+
+Concatenating the outputs of consecutive calls gives the same signal as
+rendering the whole file in one pass, delayed by `StreamingProcessor.latency`
+samples (only the GRU has a non-zero latency, due to its centered max pooling).
+"""
+
+import copy
+import torch
+import torch.nn as nn
+import torch.nn.functional as F
+
+from torch import Tensor
+from typing import Optional
+
+from .networks.custom_layers import (
+    Conv1dCausal,
+    Conv1dCached,
+    PaddingCached,
+    precompute_film,
+)
+from .networks.gru import GRU
+from .networks.model_utils import get_condition
+
+MIN_BLOCK_SIZE = 64
+MAX_BLOCK_SIZE = 4096
+
+
+class RecurrentCached(nn.Module):
+    """nn.LSTM or nn.GRU layer (batch_first) that carries its hidden state across calls.
+
+    The first `skip` frames of the stream are not fed to the layer and give zeros:
+    behind the cached max pooling of the GRU, they are the `latency` frames of the
+    padding that the offline render never produces, and would put the hidden state
+    off for the rest of the stream.
+    """
+
+    def __init__(self, rnn: nn.RNNBase, skip: int = 0) -> None:
+        super().__init__()
+        self.rnn = rnn
+        self.skip = skip
+        self.to_skip = skip
+        self.hidden = None
+
+    def forward(self, x: Tensor, hidden=None):
+        if hidden is None:
+            hidden = self.hidden
+        n_skip = min(self.to_skip, x.size(1))
+        if n_skip == 0:
+            out, hidden = self.rnn(x, hidden)
+            self.hidden = hidden
+            return out, hidden
+
+        self.to_skip -= n_skip
+        n_features = self.rnn.hidden_size * (2 if self.rnn.bidirectional else 1)
+        out = x.new_zeros(x.size(0), n_skip, n_features)
+        if n_skip < x.size(1):
+            rnn_out, hidden = self.rnn(x[:, n_skip:], hidden)
+            self.hidden = hidden
+            out = torch.cat([out, rnn_out], dim=1)
+        return out, hidden
+
+    def reset(self) -> None:
+        self.hidden = None
+        self.to_skip = self.skip
+
+
+class MaxPool1dCached(nn.Module):
+    """Max pooling over a centered window, computed on (cached frames + current frames).
+
+    The window looks `padding` frames into the future, so the output is delayed by
+    `latency` frames with respect to the non-cached layer. The first `latency` output
+    frames of a stream have no offline counterpart, `make_streamable` drops them
+    before the recurrent layer.
+    """
+
+    def __init__(self, maxpool: nn.MaxPool1d) -> None:
+        super().__init__()
+        self.kernel_size = int(maxpool.kernel_size)
+        self.latency = self.kernel_size - 1 - int(maxpool.padding)
+        self.pad_buf = None
+
+    def forward(self, x: Tensor) -> Tensor:
+        if self.pad_buf is None or self.pad_buf.size(0) != x.size(0):
+            # Same as the implicit -inf padding of nn.MaxPool1d
+            self.pad_buf = torch.full(
+                (x.size(0), x.size(1), self.kernel_size - 1),
+                float("-inf"),
+                device=x.device,
+                dtype=x.dtype,
+            )
+        x = torch.cat([self.pad_buf, x], dim=-1)
+        self.pad_buf = x[..., x.size(-1) - (self.kernel_size - 1) :]
+        return F.max_pool1d(x, self.kernel_size, stride=1)
+
+    def reset(self) -> None:
+        self.pad_buf = None
+
+
+class DelayCached(nn.Module):
+    """Delay the output of a module by a fixed number of samples."""
+
+    def __init__(self, module: nn.Conv1d, delay: int) -> None:
+        super().__init__()
+        self.module = module
+        self.delay = delay
+        self.pad = PaddingCached(module.out_channels, delay)
+
+    def forward(self, x: Tensor) -> Tensor:
+        x = self.module(x)
+        x = self.pad(x)  # (cached output + current output)
+        return x[..., : -self.delay]
+
+    def reset(self) -> None:
+        self.pad.reset()
+
+
+def replace_streaming_modules(module: nn.Module) -> None:
+    """Recursively swap the stateless layers of a model with their cached version."""
+    for name, child in module.named_children():
+        if isinstance(child, Conv1dCausal):
+            setattr(module, name, Conv1dCached(child))
+        elif isinstance(child, (nn.LSTM, nn.GRU)):
+            setattr(module, name, RecurrentCached(child))
+        elif isinstance(child, nn.MaxPool1d):
+            setattr(module, name, MaxPool1dCached(child))
+        else:
+            replace_streaming_modules(child)
+
+
+def make_streamable(model: nn.Module) -> int:
+    """
+    Convert a model in place for block processing.
+
+    Returns:
+        int: Latency in samples of the streamed output with respect to the offline one.
+    """
+    replace_streaming_modules(model)
+
+    latency = 0
+    if isinstance(model, GRU):
+        latency = model.mp1.latency
+        # The first pooled frames only cover the padding, the GRU starts after them
+        model.gru.skip = model.gru.to_skip = latency
+        # The skip connection bypasses the pooling, align it with the delayed path
+        if model.use_skip and latency > 0:
+            model.res = DelayCached(model.res, latency)
+    return latency
+
+
+class StreamingProcessor:
+    """
+    Process an audio stream block by block, carrying the model state across calls.
+
+    Parameters:
+        model (nn.Module): A model returned by `load_model_checkpoint` or `initialize_model`.
+            It is copied, the original is left untouched.
+        config (dict): The model configuration, used for the conditioning values.
+        block_size (int): Number of samples per block (64 to 4096).
+        batch_size (int): Number of parallel streams.
+        device (torch.device): Device to run the model on.
+
+    Example:
+        processor = StreamingProcessor(model, config, block_size=512)
+        for block in blocks:  # block shape: [batch_size, 1, block_size]
+            out = processor.process(block)
+    """
+
+    def __init__(
+        self,
+        model: nn.Module,
+        config: dict,
+        block_size: int = 512,
+        batch_size: int = 1,
+        device="cpu",
+    ) -> None:
+        if not MIN_BLOCK_SIZE <= block_size <= MAX_BLOCK_SIZE:
+            raise ValueError(
+                f"Block size must be between {MIN_BLOCK_SIZE} and {MAX_BLOCK_SIZE}, got {block_size}"
+            )
+        self.config = config
+        self.block_size = block_size
+        self.batch_size = batch_size
+        self.device = torch.device(device)
+
+        self.model = copy.deepcopy(model)
+        self.model.eval()
+        self.latency = make_streamable(self.model)
+        self.model.to(self.device)
+
+        self.c = get_condition(config, batch_size, self.device)
+        precompute_film(self.model, self.c)
+
+    def reset(self) -> None:
+        """Clear the state of all the cached layers."""
+        for module in self.model.modules():
+            if isinstance(
+                module, (Conv1dCached, RecurrentCached, MaxPool1dCached, DelayCached)
+            ):
+                module.reset()
+
+    def process(self, x: Tensor, c: Optional[Tensor] = None) -> Tensor:
+        """
+        Process one block.
+
+        Parameters:
+            x (Tensor): Input block, shape [batch_size, 1, block_size].
+            c (Tensor, optional): Conditioning tensor [batch_size, cond_dim],
+                defaults to the values stored in the config.
+
+        Returns:
+            Tensor: Output block, shape [batch_size, 1, block_size].
+        """
+        if x.size(-1) != self.block_size:
+            raise ValueError(
+                f"Expected blocks of {self.block_size} samples, got {x.size(-1)}"
+            )
+        if c is None:
+            c = self.c
+
+        with torch.no_grad():
+            return self.model(x.to(self.device), c)
+
+    def process_signal(self, x: Tensor) -> Tensor:
+        """
+        Stream a whole signal through the processor, starting from a clean state.
+
+        Parameters:
+            x (Tensor): Input signal, shape [batch_size, 1, samples].
+
+        Returns:
+            Tensor: Output aligned with the offline render, shape [batch_size, 1, samples].
+            For the GRU, the last `latency` samples see zeros past the end of the signal
+            instead of the -inf padding of the offline max pooling.
+        """
+        self.reset()
+        num_samples = x.size(-1)
+
+        # Zero-pad to a whole number of blocks, plus the latency to compensate for
+        total = num_samples + self.latency
+        n_blocks = -(-total // self.block_size)
+        x = F.pad(x, (0, n_blocks * self.block_size - num_samples))
+
+        out = [
+            self.process(block).cpu()
+            for block in torch.split(x, self.block_size, dim=-1)
+        ]
+        out = torch.cat(out, dim=-1)
+        return out[..., self.latency : self.latency + num_samples]
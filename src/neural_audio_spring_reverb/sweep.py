@@ -0,0 +1,194 @@
+import copy
+import csv
+import itertools
+import multiprocessing
+import os
+import time
+import torch
+import yaml
+
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from datetime import datetime
+from pathlib import Path
+
+from .networks.model_utils import parse_config
+
+"""
+Hyperparameter sweep
+====================
+Train several configurations concurrently on a pool of processes. The sweep is either
+a folder of YAML configurations (e.g. configs/kernel-3) or a grid file:
+
+    base: configs/kernel-3/tcn-3.yaml
+    grid:
+        n_channels: [16, 32, 64]
+        lr: [0.01, 0.001]
+
+Every run gets an equal share of the CPU threads and data loading workers, and one
+device (GPUs are assigned round-robin). The dataset cache is prepared once before the
+runs start and shared by all of them. A summary of the runs is written to the log folder.
+"""
+
+
+def expand_grid(grid_file, out_dir):
+    """Write one YAML configuration per point of the grid, return their paths."""
+    spec = parse_config(grid_file)
+    base_path = Path(spec["base"])
+    if not base_path.is_absolute():
+        # Relative to the working directory first, then to the grid file
+        if not base_path.is_file():
+            base_path = Path(grid_file).parent / base_path
+    base = parse_config(base_path)
+    grid = spec.get("grid", {})
+
+    out_dir = Path(out_dir)
+    out_dir.mkdir(parents=True, exist_ok=True)
+    keys = list(grid)
+    config_paths = []
+    for values in itertools.product(*[grid[k] for k in keys]):
+        config = copy.deepcopy(base)
+        config.update(dict(zip(keys, values)))
+        suffix = "-".join(f"{k}{v}" for k, v in zip(keys, values))
+        config["name"] = f"{base['name']}-{suffix}" if suffix else base["name"]
+        config_path = out_dir / f"{config['name']}.yaml"
+        with open(config_path, "w") as f:
+            yaml.safe_dump(config, f, sort_keys=False)
+        config_paths.append(config_path)
+    return config_paths
+
+
+def list_sweep_configs(sweep_path, out_dir):
+    sweep_path = Path(sweep_path)
+    if sweep_path.is_dir():
+        return sorted(sweep_path.glob("*.yaml"))
+    elif sweep_path.is_file():
+        return expand_grid(sweep_path, out_dir)
+    raise FileNotFoundError(f"The sweep '{sweep_path}' is neither a folder nor a grid file.")
+
+
+def default_jobs(device) -> int:
+    if device.type == "cuda":
+        return max(1, torch.cuda.device_count())
+    return max(1, (os.cpu_count() or 1) // 4)
+
+
+def run_config(config_path, args, threads, device):
+    """Train one configuration in a pool process, return a row of the summary."""
+    from .train import train_model
+
+    torch.set_num_threads(threads)
+    args = copy.copy(args)
+    args.init = str(config_path)
+    args.checkpoint = None
+    args.device = device
+    if device.type == "cuda":
+        torch.cuda.set_device(device)
+
+    row = {
+        "name": parse_config(config_path)["name"],
+        "config": str(config_path),
+        "min_valid_loss": None,
+        "params": None,
+        "wall_time": None,
+        "status": "ok",
+    }
+    start = time.perf_counter()
+    try:
+        result = train_model(args) or {}
+        row["min_valid_loss"] = result.get("min_valid_loss")
+        row["params"] = result.get("params")
+    except Exception as e:
+        # A failed run does not stop the others
+        row["status"] = f"failed: {e!r}"
+    row["wall_time"] = time.perf_counter() - start
+    return row
+
+
+def prepare_shared_cache(args, config_paths):
+    """Prepare the dataset cache once, so that the runs only read it."""
+    from .data.cache import prepare_data
+
+    datasets = {args.dataset} if args.dataset else set()
+    if not datasets:
+        datasets = {parse_config(p).get("dataset") for p in config_paths}
+    datasets &= {"egfxset", "customset"}
+    if not datasets:
+        return
+
+    if args.cache_dir is None:
+        args.cache_dir = str(Path(args.data_dir) / "cache")
+    for dataset in sorted(datasets):
+        prepare_args = copy.copy(args)
+        prepare_args.dataset = dataset
+        prepare_data(prepare_args)
+
+
+def print_summary(rows):
+    header = f"{'name':<32} {'min_valid_loss':>14} {'params':>10} {'wall_time':>10}  status"
+    print(header)
+    print("-" * len(header))
+    for row in rows:
+        loss = "-" if row["min_valid_loss"] is None else f"{row['min_valid_loss']:.4f}"
+        params = "-" if row["params"] is None else str(row["params"])
+        print(
+            f"{row['name']:<32} {loss:>14} {params:>10} {row['wall_time']:>9.1f}s  {row['status']}"
+        )
+
+
+def run_sweep(args):
+    if args.init is None:
+        raise ValueError("Pass the configs folder or the grid file with --init.")
+
+    timestamp = datetime.now().strftime("%Y%m%d-%H%M%S")
+    sweep_dir = Path(args.log_dir) / f"sweep-{timestamp}"
+    config_paths = list_sweep_configs(args.init, sweep_dir / "configs")
+    if not config_paths:
+        raise ValueError(f"No configuration found in {args.init}")
+
+    jobs = min(args.jobs or default_jobs(args.device), len(config_paths))
+    threads = max(1, (os.cpu_count() or 1) // jobs)
+    if args.device.type == "cuda":
+        devices = [
+            torch.device(f"cuda:{i % torch.cuda.device_count()}") for i in range(jobs)
+        ]
+    else:
+        devices = [args.device] * jobs
+
+    prepare_shared_cache(args, config_paths)
+
+    # The data loading workers are shared between the concurrent runs too
+    run_args = copy.copy(args)
+    run_args.num_workers = max(0, args.num_workers // jobs)
+    run_args.distributed = False
+
+    print(
+        f"Sweeping {len(config_paths)} configurations, {jobs} at a time "
+        f"({threads} threads and {run_args.num_workers} loader workers per run)"
+    )
+
+    rows = []
+    # spawn: CUDA and the intra-op thread pools do not survive a fork
+    context = multiprocessing.get_context("spawn")
+    with ProcessPoolExecutor(max_workers=jobs, mp_context=context) as pool:
+        futures = {
+            pool.submit(
+                run_config, config_path, run_args, threads, devices[i % jobs]
+            ): config_path
+            for i, config_path in enumerate(config_paths)
+        }
+        for future in as_completed(futures):
+            row = future.result()
+            print(f"Finished {row['name']} in {row['wall_time']:.1f}s ({row['status']})")
+            rows.append(row)
+
+    rows.sort(key=lambda r: (r["min_valid_loss"] is None, r["min_valid_loss"] or 0.0))
+
+    sweep_dir.mkdir(parents=True, exist_ok=True)
+    summary_path = sweep_dir / "summary.csv"
+    with open(summary_path, "w", newline="") as f:
+        writer = csv.DictWriter(f, fieldnames=list(rows[0]))
+        writer.writeheader()
+        writer.writerows(rows)
+
+    print_summary(rows)
+    print(f"Summary saved to {summary_path}")
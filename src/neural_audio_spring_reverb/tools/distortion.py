@@ -0,0 +1,193 @@
+import copy
+import csv
+import numpy as np
+import torch
+import matplotlib.pyplot as plt
+
+from pathlib import Path
+from scipy import fft
+
+from neural_audio_spring_reverb.networks.custom_layers import precompute_film
+from neural_audio_spring_reverb.networks.model_utils import (
+    load_model_checkpoint,
+    get_condition,
+)
+from neural_audio_spring_reverb.tools.ir_signals import sweep_tone, deconvolve
+from neural_audio_spring_reverb.tools.plotter import apply_decorations, save_plot
+from neural_audio_spring_reverb.tools.signal_cache import configure_signal_cache
+
+"""
+Harmonic distortion profiling
+=============================
+Exponential sweep method (Farina): the response of the model to the sweep of
+`ir_signals.sweep_tone` is deconvolved with the inverse filter in a single FFT
+convolution. The linear IR (H1) arrives at the end of the sweep, and the IR of the
+k-th harmonic (Hk) arrives L * ln(k) seconds earlier, with L = duration / ln(f1 / f0).
+Each harmonic IR is cut out with its own window, and:
+
+    THD(f) = sqrt(sum_k |Hk(k * f)|^2) / |H1(f)|,   k = 2 .. --harmonics
+
+for the fundamentals f where k * f is below the Nyquist frequency. The sweep is played
+at each input level of --gains (dBFS), all levels in one batched forward pass. The
+compression is the linear gain at each level relative to the quietest one.
+"""
+
+FADE = 64  # samples of the half-Hann fades of the harmonic windows
+POINTS_PER_OCTAVE = 12
+
+
+def harmonic_onsets(n_sweep, duration, sample_rate, f0, f1, n_harmonics):
+    """Sample index of the onset of each harmonic IR (k = 1 .. n) in the full deconvolution."""
+    L = duration / np.log(f1 / f0)
+    k = np.arange(1, n_harmonics + 1)
+    return (n_sweep - 1 - np.round(L * np.log(k) * sample_rate)).astype(int)
+
+
+def harmonic_spectra(impulse_responses, onsets, sample_rate):
+    """
+    Magnitude spectra of the harmonic IRs of a batch of deconvolved responses [G, T].
+    The window of Hk starts FADE samples before its onset and ends FADE samples before
+    the onset of H(k-1); H1 is cut at the length of the H2 window.
+
+    Returns:
+        freqs (np.ndarray): [bins] frequencies in Hz.
+        spectra (np.ndarray): [n_harmonics, G, bins] magnitudes.
+    """
+    starts = onsets - FADE
+    ends = np.concatenate([[onsets[0] + (onsets[0] - onsets[1])], onsets[:-1]]) - FADE
+    if np.any(starts < 0):
+        raise ValueError("The sweep is too short for the number of harmonics")
+    length = int((ends - starts).max())
+    n_fft = fft.next_fast_len(length, real=True)
+
+    fade = np.hanning(2 * FADE)
+    spectra = []
+    for start, end in zip(starts, ends):
+        window = np.ones(end - start)
+        window[:FADE] = fade[:FADE]
+        window[-FADE:] = fade[FADE:]
+        segment = impulse_responses[:, start:end] * window
+        spectra.append(np.abs(fft.rfft(segment, n=n_fft, axis=-1)))
+    return fft.rfftfreq(n_fft, 1 / sample_rate), np.stack(spectra)
+
+
+def interpolate(spectra, freqs, at):
+    """Linear interpolation of spectra [..., bins] at frequencies `at`, NaN above Nyquist."""
+    idx = at / freqs[1]
+    i0 = np.clip(np.floor(idx).astype(int), 0, len(freqs) - 2)
+    frac = idx - i0
+    values = spectra[..., i0] * (1 - frac) + spectra[..., i0 + 1] * frac
+    return np.where(at <= freqs[-1], values, np.nan)
+
+
+def distortion_profile(impulse_responses, duration, sample_rate, f0, f1, n_harmonics):
+    """
+    THD and harmonic levels against frequency of a batch of deconvolved responses [G, T].
+
+    Returns:
+        dict: "freqs" [F], "thd" [G, F] (ratio), "harmonics_db" [n_harmonics - 1, G, F]
+        (level of Hk relative to H1), "linear" [G, F] (|H1|).
+    """
+    n_sweep = (impulse_responses.shape[-1] + 1) // 2
+    onsets = harmonic_onsets(n_sweep, duration, sample_rate, f0, f1, n_harmonics)
+    freqs, spectra = harmonic_spectra(impulse_responses, onsets, sample_rate)
+
+    n_octaves = np.log2(min(f1, sample_rate / 2) / 2 / f0)
+    grid = f0 * 2 ** (np.arange(int(n_octaves * POINTS_PER_OCTAVE) + 1) / POINTS_PER_OCTAVE)
+    linear = interpolate(spectra[0], freqs, grid)
+    harmonics = np.stack(
+        [interpolate(spectra[k - 1], freqs, k * grid) for k in range(2, n_harmonics + 1)]
+    )
+    with np.errstate(divide="ignore", invalid="ignore"):
+        # Harmonics above Nyquist do not contribute
+        thd = np.sqrt(np.nansum(harmonics**2, axis=0)) / linear
+        harmonics_db = 20 * np.log10(harmonics / linear)
+    return {"freqs": grid, "thd": thd, "harmonics_db": harmonics_db, "linear": linear}
+
+
+def render_levels(model, config, sweep, gains_db, device):
+    """Model output for the sweep at every input level, in one batched forward pass."""
+    gains = 10 ** (np.asarray(gains_db) / 20)
+    x = torch.from_numpy(gains[:, None] * np.asarray(sweep)[None, :]).float()
+    x = x.unsqueeze(1).to(device)
+    c = get_condition(config, len(gains), device)
+    model.eval()
+    precompute_film(model, c)
+    with torch.no_grad():
+        y = model(x, c)
+    return y[:, 0].double().cpu().numpy()
+
+
+def plot_distortion(profile, gains_db, name, args):
+    fig, ax = plt.subplots(figsize=(8, 5))
+    for i, gain in enumerate(gains_db):
+        ax.semilogx(profile["freqs"], 100 * profile["thd"][i], label=f"{gain:+.0f} dBFS")
+    ax.set_xlabel("Frequency [Hz]")
+    ax.set_ylabel("THD [%]")
+    ax.set_title(f"{name} THD")
+    apply_decorations(ax, legend=True, location="upper left")
+    save_plot(plt, f"{name}_THD", args)
+    plt.close(fig)
+
+
+def profile_distortion(args):
+    """
+    Harmonic distortion profile of the checkpoint -c at every input level of --gains.
+
+    The THD and the harmonic levels against frequency are saved as
+    `{checkpoint}_THD.csv` in the log folder and plotted in the plots folder.
+    """
+    configure_signal_cache(args)
+    model, _, _, config, _, _ = load_model_checkpoint(args)
+    if config.get("quantized", False):
+        args = copy.copy(args)
+        args.device = torch.device("cpu")
+    model.to(args.device)
+
+    sample_rate = config["sample_rate"]
+    f0, f1 = 20.0, sample_rate / 2
+    sweep = sweep_tone(sample_rate, args.duration, 0.0, f0=f0, f1=f1)
+    inverse_filter = sweep_tone(sample_rate, args.duration, 0.0, f0=f0, f1=f1, inverse=True)
+
+    gains_db = sorted(args.gains)
+    responses = render_levels(model, config, sweep, gains_db, args.device)
+    impulse_responses = deconvolve(responses, np.asarray(inverse_filter))
+    profile = distortion_profile(
+        impulse_responses, args.duration, sample_rate, f0, f1, args.harmonics
+    )
+
+    # Linear gain at each level, relative to the quietest level
+    gain_db = 20 * np.log10(np.nanmean(profile["linear"], axis=-1)) - np.asarray(gains_db)
+    compression_db = gain_db - gain_db[0]
+
+    name = Path(args.checkpoint).stem
+    rows = []
+    for i, gain in enumerate(gains_db):
+        for j, freq in enumerate(profile["freqs"]):
+            row = {
+                "gain_db": gain,
+                "frequency": round(float(freq), 2),
+                "thd_percent": 100 * profile["thd"][i, j],
+            }
+            for k in range(2, args.harmonics + 1):
+                row[f"h{k}_db"] = profile["harmonics_db"][k - 2, i, j]
+            rows.append(row)
+
+    csv_path = Path(args.log_dir) / f"{name}_THD.csv"
+    csv_path.parent.mkdir(parents=True, exist_ok=True)
+    with open(csv_path, "w", newline="") as f:
+        writer = csv.DictWriter(f, fieldnames=list(rows[0]))
+        writer.writeheader()
+        writer.writerows(rows)
+    plot_distortion(profile, gains_db, name, args)
+
+    header = f"{'input dBFS':>10} {'mean THD %':>10} {'max THD %':>10} {'compression dB':>15}"
+    print(header)
+    print("-" * len(header))
+    for i, gain in enumerate(gains_db):
+        thd = 100 * profile["thd"][i]
+        print(
+            f"{gain:>10.1f} {np.nanmean(thd):>10.3f} {np.nanmax(thd):>10.3f} {compression_db[i]:>15.2f}"
+        )
+    print(f"Results saved to {csv_path}")
+    return profile
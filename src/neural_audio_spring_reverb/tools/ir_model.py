@@ -1,176 +1,150 @@
-from logging import config
+import copy
 import numpy as np
 import torch
 import torchaudio
 from pathlib import Path
-import matplotlib.pyplot as plt
-from scipy import signal
 
-from neural_audio_spring_reverb.tools.ir_signals import generate_reference
-from neural_audio_spring_reverb.networks.model_utils import load_model_checkpoint
+from neural_audio_spring_reverb.tools.ir_signals import generate_reference, deconvolve
+from neural_audio_spring_reverb.tools.plotter import ir_report_jobs, render_plots
+from neural_audio_spring_reverb.tools.signal_cache import configure_signal_cache
+from neural_audio_spring_reverb.networks.model_utils import (
+    load_checkpoint,
+    load_model_checkpoint,
+)
 from neural_audio_spring_reverb.inference import make_inference
 
-# from src.tools.plotter import plot_ir_spectrogram, plot_waterfall
-
-
-def plot_waterfall(waveform, title, sample_rate, args, stride=1):
-    frequencies, times, Sxx = signal.spectrogram(
-        waveform,
-        fs=sample_rate,
-        window="blackmanharris",
-        nperseg=32,
-        noverlap=16,
-        scaling="spectrum",
-        mode="magnitude",
-    )
+def sweep_response(args, sweep):
+    """Render the sweep tone with the model of args.checkpoint, normalized."""
+    args.input = sweep.reshape(1, -1)
+    sweep_output = make_inference(args)
+    sweep_output = sweep_output.reshape(-1).numpy()
 
-    # Sxx_dBFS = 10 * np.log10(np.fmax(Sxx, 1e-9))
-    # Convert magnitude to dB
-    Sxx_dBFS = 10 * np.log10(
-        Sxx / 1.0 + np.finfo(float).eps
-    )
+    # Normalize the sweep tone
+    sweep_output = sweep_output - np.mean(sweep_output)
+    sweep_output /= np.max(np.abs(sweep_output))
+    return sweep_output
 
-    fig = plt.figure(figsize=(10, 10))
 
-    ax = fig.add_subplot(111, projection="3d")
+def normalize_ir(impulse_response):
+    impulse_response = impulse_response - np.mean(impulse_response, axis=-1, keepdims=True)
+    return impulse_response / np.max(np.abs(impulse_response), axis=-1, keepdims=True)
 
-    X, Y = np.meshgrid(frequencies, times[::stride])
-    Z = Sxx_dBFS.T[::stride]
 
-    surf = ax.plot_surface(
-        X,
-        Y,
-        Z,
-        cmap="inferno",
-        edgecolor="none",
-        alpha=0.8,
-        linewidth=0,
-        antialiased=False,
+def plot_model_irs(impulse_responses, configs, checkpoints, args):
+    """Spectrogram and waterfall jobs of normalized IRs [N, samples] with the same sample rate."""
+    return ir_report_jobs(
+        impulse_responses,
+        configs[0]["sample_rate"],
+        [f"Model: {config['name']} Spectrogram" for config in configs],
+        [Path(args.plots_dir) / f"IR_{Path(c).stem}.png" for c in checkpoints],
     )
 
-    # Autoscale and add colorbar
-    ax.autoscale()
-    cbar = fig.colorbar(surf, ax=ax, pad=0.01, aspect=35, shrink=0.5)
-    cbar.set_label("Magnitude (dB)")
-
-    # Set labels and title
-    ax.set_xlabel("Frequency (Hz)")
-    ax.set_ylabel("Time (seconds)")
-    ax.set_zlabel("Magnitude (dB)")
-
-    ax.set_xlim([frequencies[-1], frequencies[0]])
-    ax.view_init(
-        elev=10, azim=45, vertical_axis="z"
-    )  # Adjusts the viewing angle for better visualization
-    plt.tight_layout()
-    plt.savefig(title)
-
-
-def plot_ir_spectrogram(signal, sample_rate, title, save_path):
-    fig, ax = plt.subplots(figsize=(5, 5))
-    duration_seconds = len(signal) / sample_rate
-
-    cax = ax.specgram(
-        signal,
-        NFFT=512,
-        Fs=sample_rate,
-        noverlap=256,
-        cmap="hot",
-        scale="dB",
-        mode="magnitude",
-        vmin=-100,
-        vmax=0,
-    )
-    ax.set_ylabel("Frequency [Hz]")
-    ax.set_xlabel(f"Time [sec] ({duration_seconds:.2f} s)")  # Label in seconds
-    ax.grid(True)
-    ax.set_title(title)
 
-    cbar = fig.colorbar(mappable=cax[3], ax=ax, format="%+2.0f dB")
-    cbar.set_label("Intensity [dB]")
+def save_model_ir(impulse_response, config, checkpoint, args):
+    """Save the normalized impulse response of a model as a .wav file."""
+    ir_tensor = torch.from_numpy(impulse_response).unsqueeze(0).float()
 
-    plt.tight_layout()
-    plt.savefig(save_path)
-    print(f"Saved spectrogram plot to {save_path}")
+    # Create the directory if it does not exist
+    save_directory = Path(args.audio_dir) / "IR_models"
+    Path(save_directory).mkdir(parents=True, exist_ok=True)
+    save_as = f"{save_directory}/{Path(checkpoint).stem}_IR.wav"
+    torchaudio.save(
+        save_as, ir_tensor, config["sample_rate"], bits_per_sample=config["bit_depth"]
+    )
+    print(
+        f"Saved measured impulse response to {save_as}, sample rate: {config['sample_rate']}, bit depth: {config['bit_depth']}"
+    )
+    print("----------------------------------")
 
 
 def measure_model_ir(args):
     """
     Impulse response measurement of a trained model
     =========================================================
-    1. Generate the analysis signals
+    1. Generate the analysis signals (measurement signal cache)
     2. Make inference with the model on the sweep tone
-    3. Convolve the sweep tone with the inverse filter
+    3. Convolve the sweep tone with the inverse filter (FFT)
     4. Normalize the impulse response
-    5. Plot the spectrogram
-    6. Save the impulse response as a .wav file
+    5. Save the impulse response as a .wav file
+    6. Plot the spectrogram and the waterfall (process pool, Agg backend)
+
+    Without a checkpoint, or with a folder, every checkpoint of the folder
+    (default: the models folder) is measured by `measure_models_ir`.
     """
+    configure_signal_cache(args)
+    if args.checkpoint is None or Path(args.checkpoint).is_dir():
+        return measure_models_ir(args)
+
     print("Measure the impulse response of a trained model")
 
     model, _, _, config, _, _ = load_model_checkpoint(args)
+    del model
 
     # Generate the reference signals
     sweep, inverse_filter, _ = generate_reference(
         duration=args.duration, sample_rate=config["sample_rate"]
     )
-    # sweep:(240000,) || inverse_filter:(240000,)
-    sweep = sweep.reshape(1, -1)
+    inverse_filter = inverse_filter / np.max(np.abs(inverse_filter))
 
     # Make inference with the model on the sweep tone
-    # args.input = torch.from_numpy(sweep).float()
-    # print(f'input waveform: {input.shape}')
-    args.input = sweep
-
-    sweep_output = make_inference(args)
-
-    # print(f"sweep_output:{sweep_output.shape} || inverse_filter:{inverse_filter.shape}")
-    sweep_output = sweep_output.reshape(-1).numpy()
-
-    # Normalize the sweep tone and the inverse filter
-    sweep_output = sweep_output - np.mean(sweep_output)
-    sweep_output /= np.max(np.abs(sweep_output))
-    inverse_filter /= np.max(np.abs(inverse_filter))
-
-    # print("post squeeze")
-    # print(f"sweep_output:{sweep_output.shape} || inverse_filter:{inverse_filter.shape}")
+    sweep_output = sweep_response(args, sweep)
 
     # Convolve the sweep tone with the inverse filter
-    impulse_response = signal.convolve(
-        sweep_output, inverse_filter, mode="full", method="direct"
-    )
-    # print(f"IR: {impulse_response.shape}")
-
-    # Normalize the impulse response
-    impulse_response = impulse_response - np.mean(impulse_response)
-    impulse_response /= np.max(np.abs(impulse_response))
-    # print(f"ir:{impulse_response.max(), impulse_response.min()}")
-
-    # Plot spectrogram
-    spectra_file = Path(args.plots_dir) / f"IR_{Path(args.checkpoint).stem}.png"
-    plot_ir_spectrogram(
-        impulse_response,
-        config["sample_rate"],
-        f"Model: {config['name']} Spectrogram",
-        spectra_file,
+    impulse_response = normalize_ir(deconvolve(sweep_output, inverse_filter))
+    save_model_ir(impulse_response, config, args.checkpoint, args)
+    render_plots(
+        plot_model_irs(impulse_response, [config], [args.checkpoint], args),
+        args.plot_workers,
     )
 
-    # Plot the waterfall spectrogram
-    waterfall_file = (
-        Path(args.plots_dir) / f"IR_{Path(args.checkpoint).stem}_waterfall.png"
-    )
-    plot_waterfall(impulse_response, waterfall_file, config["sample_rate"], args, 1)
-
-    ir_tensor = torch.from_numpy(impulse_response).unsqueeze(0).float()
-    # print(f"tensor:{ir_tensor.max(),ir_tensor.min()}")
 
-    # Create the directory if it does not exist
-    save_directory = Path(args.audio_dir) / "IR_models"
-    Path(save_directory).mkdir(parents=True, exist_ok=True)
-    save_as = f"{save_directory}/{Path(args.checkpoint).stem}_IR.wav"
-    torchaudio.save(
-        save_as, ir_tensor, config["sample_rate"], bits_per_sample=config["bit_depth"]
-    )
-    print(
-        f"Saved measured impulse response to {save_as}, sample rate: {config['sample_rate']}, bit depth: {config['bit_depth']}"
-    )
-    print("----------------------------------")
\ No newline at end of file
+def measure_models_ir(args):
+    """
+    Measure the impulse responses of all the checkpoints of a folder in one process.
+    The sweep responses of the models with the same sample rate are deconvolved as
+    one batch, sharing the transform of the inverse filter, and the plots of all the
+    models are rendered together in a process pool.
+    """
+    models_dir = Path(args.checkpoint or args.models_dir)
+    checkpoints = sorted(models_dir.glob("*.pt"))
+    if not checkpoints:
+        raise ValueError(f"No checkpoint found in {models_dir}")
+    print(f"Measure the impulse responses of {len(checkpoints)} models in {models_dir}")
+
+    # Sweep responses grouped by sample rate
+    groups = {}
+    for checkpoint in checkpoints:
+        config = load_checkpoint(checkpoint)["config_state_dict"]
+        sweep, _, _ = generate_reference(
+            duration=args.duration, sample_rate=config["sample_rate"]
+        )
+        model_args = copy.copy(args)
+        model_args.checkpoint = str(checkpoint)
+        if config.get("quantized", False):
+            model_args.device = torch.device("cpu")  # int8 modules, CPU only
+        print(f"Rendering the sweep tone with {checkpoint.stem}")
+        groups.setdefault(config["sample_rate"], []).append(
+            (checkpoint, config, sweep_response(model_args, sweep))
+        )
+
+    plot_jobs = []
+    for sample_rate, items in groups.items():
+        _, inverse_filter, _ = generate_reference(
+            duration=args.duration, sample_rate=sample_rate
+        )
+        inverse_filter = inverse_filter / np.max(np.abs(inverse_filter))
+        impulse_responses = normalize_ir(
+            deconvolve(
+                np.stack([sweep_output for _, _, sweep_output in items]), inverse_filter
+            )
+        )
+        for (checkpoint, config, _), impulse_response in zip(items, impulse_responses):
+            save_model_ir(impulse_response, config, checkpoint, args)
+        plot_jobs += plot_model_irs(
+            impulse_responses,
+            [config for _, config, _ in items],
+            [checkpoint for checkpoint, _, _ in items],
+            args,
+        )
+
+    render_plots(plot_jobs, args.plot_workers)
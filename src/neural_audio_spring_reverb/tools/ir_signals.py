@@ -1,5 +1,8 @@
 import numpy as np
-from typing import Tuple
+from scipy import signal
+from typing import Optional, Tuple
+
+from neural_audio_spring_reverb.tools.signal_cache import cached_signal
 
 """ 
 Signal Generators for Measurements
@@ -8,12 +11,18 @@ This module contains functions to generate the signals used in the measurements:
     - Impulse
     - Sine wave
     - Sweep tone
+    - White noise
     - Reference impulse response
+and the FFT deconvolution of a sweep response.
+
+The generated signals are stored in the measurement signal cache (see signal_cache.py)
+once it is configured, and returned as writable copies.
 
 Modified version from the original written by Xavier Lizarraga
 """
 
 
+@cached_signal
 def impulse(sample_rate: int, duration: float, decibels: float = -1.0) -> np.ndarray:
     """
     Generate an impulse
@@ -32,6 +41,7 @@ def impulse(sample_rate: int, duration: float, decibels: float = -1.0) -> np.nda
     return impulse
 
 
+@cached_signal
 def sine(
     sample_rate: int, duration: float, amplitude: float, frequency: float = 440.0
 ) -> np.ndarray:
@@ -50,6 +60,7 @@ def sine(
     return sine
 
 
+@cached_signal
 def sweep_tone(
     sample_rate: int,
     duration: float,
@@ -81,9 +92,72 @@ def sweep_tone(
     return sweep_tone
 
 
-def generate_reference(
+@cached_signal
+def noise(
+    sample_rate: int, duration: float, amplitude: float = 0.5, seed: int = 0
+) -> np.ndarray:
+    """
+    Generate white gaussian noise
+
+    Arguments:
+    ----------
+        sample_rate (int): Sample rate.
+        duration (float): Duration of the noise.
+        amplitude (float, optional): Standard deviation. Defaults to 0.5.
+        seed (int, optional): Seed of the generator. Defaults to 0.
+    """
+    rng = np.random.default_rng(seed)
+    return (amplitude * rng.standard_normal(int(duration * sample_rate))).astype(np.float32)
+
+
+def sweep_pair(
     duration: float, sample_rate: int, decibels: float = -1.0, f0: float = 20
-) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+) -> Tuple[np.ndarray, np.ndarray]:
+    """Sweep tone and inverse filter up to the Nyquist frequency, cached."""
+    amplitude = 10 ** (decibels / 20)
+    f1 = sample_rate / 2
+
+    # Generate the sweep tone and inverse filter
+    sweep = sweep_tone(sample_rate, duration, amplitude, f0=f0, f1=f1)
+    inverse_filter = sweep_tone(
+        sample_rate, duration, amplitude, f0=f0, f1=f1, inverse=True
+    )
+    return sweep, inverse_filter
+
+
+def deconvolve(response: np.ndarray, inverse_filter: np.ndarray) -> np.ndarray:
+    """
+    Impulse response(s) of a sweep response, by FFT convolution with the inverse filter.
+
+    Arguments:
+    ----------
+        response (np.ndarray): Sweep response [samples] or batch of responses [N, samples].
+        inverse_filter (np.ndarray): Inverse filter of the sweep [samples].
+
+    Returns:
+    --------
+        np.ndarray: Full convolution, [samples + len(inverse_filter) - 1] or batched.
+    """
+    inverse_filter = inverse_filter.reshape((1,) * (response.ndim - 1) + (-1,))
+    return signal.fftconvolve(response, inverse_filter, mode="full", axes=-1)
+
+
+@cached_signal
+def reference_ir(
+    duration: float, sample_rate: int, decibels: float = -1.0, f0: float = 20
+) -> np.ndarray:
+    """Reference impulse response (sweep deconvolved by its own inverse filter), cached."""
+    sweep, inverse_filter = sweep_pair(duration, sample_rate, decibels, f0)
+    return deconvolve(sweep, inverse_filter)
+
+
+def generate_reference(
+    duration: float,
+    sample_rate: int,
+    decibels: float = -1.0,
+    f0: float = 20,
+    reference: bool = False,
+) -> Tuple[np.ndarray, np.ndarray, Optional[np.ndarray]]:
     """
     Generate the reference impulse response
 
@@ -93,24 +167,20 @@ def generate_reference(
         sample_rate (int): Sample rate.
         decibels (float): The decibel level of the signal. Defaults to -18 dB.
         f0 (float): The start frequency of the sweep. Defaults to 20Hz.
+        reference (bool): Also compute the reference impulse response. Defaults to False.
 
     Returns:
     --------
         sweep (np.ndarray): The sweep tone.
         inverse_filter (np.ndarray): The inverse filter.
-        reference (np.ndarray): The reference impulse response.
-    """
-    amplitude = 10 ** (decibels / 20)
-    f1 = sample_rate / 2
-
-    # Generate the sweep tone and inverse filter
-    sweep = sweep_tone(sample_rate, duration, amplitude, f0=f0, f1=f1)
-    inverse_filter = sweep_tone(
-        sample_rate, duration, amplitude, f0=f0, f1=f1, inverse=True
-    )
+        reference (np.ndarray or None): The reference impulse response, None unless requested.
 
+    The signals are cached per (duration, sample rate, decibels, f0).
+    """
+    sweep, inverse_filter = sweep_pair(duration, sample_rate, decibels, f0)
     # Convolves the sweep tone with the inverse filter in order to obtain the impulse response x(t)
-    N = len(sweep)
-    impulse_response = np.convolve(inverse_filter, sweep)
+    impulse_response = (
+        reference_ir(duration, sample_rate, decibels, f0) if reference else None
+    )
 
     return sweep, inverse_filter, impulse_response
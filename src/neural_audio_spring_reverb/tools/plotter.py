@@ -1,9 +1,27 @@
+import multiprocessing
+import os
 import numpy as np
+import matplotlib
 import matplotlib.pyplot as plt
 import matplotlib.ticker as ticker
+from concurrent.futures import ProcessPoolExecutor
 from scipy.signal import spectrogram
 from pathlib import Path
 
+"""
+Impulse response reports
+========================
+The spectrogram and the waterfall of a batch of impulse responses are computed
+with one vectorised STFT each by `ir_report_jobs`. The waterfall surface is reduced
+to at most WATERFALL_SHAPE (time, frequency) cells by taking the maximum of each
+block, which keeps the peaks of the decay: the full mesh at nperseg=32 has tens of
+thousands of rows and dominated the rendering time.
+
+The figures are drawn by `render_plots` in a pool of processes with the Agg
+backend, so no display is needed and the reports of several models are rendered
+in parallel.
+"""
+
 
 def save_plot(plt, file_name, args):
     plot_dir = Path(args.plots_dir)
@@ -46,98 +64,185 @@ def get_time_stamps_np(signal_length, sample_rate):
     return np.linspace(0, (signal_length - 1) / sample_rate, signal_length)
 
 
-def generate_spectrogram(waveform, sample_rate):
+def generate_spectrogram(
+    waveform, sample_rate, window="hann", nperseg=32, noverlap=16, power=10
+):
+    """
+    Magnitude spectrogram in dB of a signal, or of a batch of signals [..., samples]
+    in a single vectorised STFT.
+
+    Returns:
+        frequencies [bins], times [frames], Sxx_dB [..., bins, frames]
+    """
     frequencies, times, Sxx = spectrogram(
         waveform,
         fs=sample_rate,
-        window="hann",
-        nperseg=32,
-        noverlap=16,
+        window=window,
+        nperseg=nperseg,
+        noverlap=noverlap,
+        detrend=False,
         scaling="spectrum",
         mode="magnitude",
+        axis=-1,
     )
 
     # Convert magnitude to dB
-    Sxx_dB = 10 * np.log10(Sxx + 1e-10)
+    Sxx_dB = power * np.log10(Sxx + 1e-10)
 
     return frequencies, times, Sxx_dB
 
 
-# def plot_waterfall(waveform, title, sample_rate, args, stride=1):
-#     frequencies, times, Sxx = generate_spectrogram(waveform, sample_rate)
-
-#     fig = plt.figure(figsize=(10, 10))
-#     ax = fig.add_subplot(111, projection="3d")
-
-#     # Compute logarithm of the frequencies (avoid log(0) by adding a small value)
-#     # log_freq = np.log10(frequencies + 1e-10)
-
-#     # X, Y = np.meshgrid(frequencies, times[::stride])
-#     X, Y = np.meshgrid(frequencies, times[::stride])
-#     Z = Sxx.T[::stride]
-
-#     surf = ax.plot_surface(
-#         X,
-#         Y,
-#         Z,
-#         cmap="inferno",
-#         edgecolor="none",
-#         alpha=0.8,
-#         linewidth=0,
-#         antialiased=False,
-#     )
-
-#     # Add a color bar which maps values to colors
-#     ax.autoscale()  # Adjusts the viewing limits for better visualization
-#     cbar = fig.colorbar(surf, ax=ax, pad=0.01, aspect=35, shrink=0.5)
-#     cbar.set_label("Magnitude (dB)")
-
-#     # Set labels and title
-#     ax.set_xlabel("Frequency (Hz)")
-#     ax.set_ylabel("Time (seconds)")
-#     ax.set_zlabel("Magnitude (dB)")
-
-#     ax.set_xlim([frequencies[-1], frequencies[0]])
-#     # ax.set_xscale('symlog', linthreshx=0.01)
-#     # ax.set_xscale('log')
-#     # ax.set_xlim([20000, 20])  # Set the x-axis limit to be between 20 and 20,000 Hz in log scale
-#     ax.view_init(
-#         elev=10, azim=45, roll=None, vertical_axis="z"
-#     )  # Adjusts the viewing angle for better visualization
-#     save_plot(fig, title, args)
-
-
-# def plot_ir_spectrogram(signal, sample_rate, title, save_path):
-#     fig, ax = plt.subplots(figsize=(5, 5))
-
-#     # Calculate the duration of the signal in seconds
-#     duration_seconds = len(signal) / sample_rate
-
-#     ax.set_title(title)
-
-#     # Plot the spectrogram
-#     cax = ax.specgram(
-#         signal,
-#         NFFT=512,
-#         Fs=sample_rate,
-#         noverlap=256,
-#         cmap="hot",
-#         scale="dB",
-#         mode="magnitude",
-#         vmin=-100,
-#         vmax=0,
-#     )
-#     ax.set_ylabel("Frequency [Hz]")
-#     ax.set_xlabel(f"Time [sec] ({duration_seconds:.2f} s)")  # Label in seconds
-#     ax.grid(True)
-
-#     # Add the colorbar
-#     cbar = fig.colorbar(mappable=cax[3], ax=ax, format="%+2.0f dB")
-#     cbar.set_label("Intensity [dB]")
-
-#     plt.tight_layout()
-#     plt.savefig(save_path)
-#     print(f"Saved spectrogram plot to {save_path}")
+WATERFALL_SHAPE = (128, 64)
+
+
+def decimate_mesh(frequencies, times, Z, shape=WATERFALL_SHAPE):
+    """Reduce a [times, frequencies] surface to at most `shape` cells (block maximum)."""
+
+    def block_starts(n, k):
+        return np.unique(np.linspace(0, n, min(n, k), endpoint=False).astype(int))
+
+    def block_centers(x, starts):
+        return np.add.reduceat(x, starts) / np.diff(np.append(starts, len(x)))
+
+    t_idx = block_starts(len(times), shape[0])
+    f_idx = block_starts(len(frequencies), shape[1])
+    Z = np.maximum.reduceat(np.maximum.reduceat(Z, t_idx, axis=0), f_idx, axis=1)
+    return block_centers(frequencies, f_idx), block_centers(times, t_idx), Z
+
+
+def plot_waterfall(frequencies, times, Sxx_dB, save_path):
+    """3D waterfall of a [times, frequencies] surface, already decimated."""
+    fig = plt.figure(figsize=(10, 10))
+    ax = fig.add_subplot(111, projection="3d")
+
+    X, Y = np.meshgrid(frequencies, times)
+    # Every cell of the decimated mesh, instead of plot_surface's default 50 x 50 strides
+    surf = ax.plot_surface(
+        X,
+        Y,
+        Sxx_dB,
+        rcount=Sxx_dB.shape[0],
+        ccount=Sxx_dB.shape[1],
+        cmap="inferno",
+        edgecolor="none",
+        alpha=0.8,
+        linewidth=0,
+        antialiased=False,
+    )
+
+    # Autoscale and add colorbar
+    ax.autoscale()
+    cbar = fig.colorbar(surf, ax=ax, pad=0.01, aspect=35, shrink=0.5)
+    cbar.set_label("Magnitude (dB)")
+
+    ax.set_xlabel("Frequency (Hz)")
+    ax.set_ylabel("Time (seconds)")
+    ax.set_zlabel("Magnitude (dB)")
+
+    ax.set_xlim([frequencies[-1], frequencies[0]])
+    ax.view_init(elev=10, azim=45, vertical_axis="z")
+    fig.tight_layout()
+    fig.savefig(save_path)
+    plt.close(fig)
+    print(f"Saved waterfall plot to {save_path}")
+
+
+def plot_ir_spectrogram(frequencies, times, Sxx_dB, duration, title, save_path):
+    """Spectrogram image of a [frequencies, times] magnitude in dB."""
+    fig, ax = plt.subplots(figsize=(5, 5))
+    half_step = (times[1] - times[0]) / 2 if len(times) > 1 else times[0]
+
+    image = ax.imshow(
+        Sxx_dB,
+        origin="lower",
+        aspect="auto",
+        cmap="hot",
+        vmin=-100,
+        vmax=0,
+        extent=(times[0] - half_step, times[-1] + half_step, 0, frequencies[-1]),
+    )
+    ax.set_ylabel("Frequency [Hz]")
+    ax.set_xlabel(f"Time [sec] ({duration:.2f} s)")  # Label in seconds
+    ax.grid(True)
+    ax.set_title(title)
+
+    cbar = fig.colorbar(mappable=image, ax=ax, format="%+2.0f dB")
+    cbar.set_label("Intensity [dB]")
+
+    fig.tight_layout()
+    fig.savefig(save_path)
+    plt.close(fig)
+    print(f"Saved spectrogram plot to {save_path}")
+
+
+def ir_report_jobs(impulse_responses, sample_rate, titles, save_paths):
+    """
+    Spectrogram and waterfall plot jobs of a batch of impulse responses [N, samples].
+    Each save path gets a spectrogram (`{path}.png`) and a waterfall (`{path}_waterfall.png`).
+    """
+    impulse_responses = np.atleast_2d(impulse_responses)
+    duration = impulse_responses.shape[-1] / sample_rate
+
+    # Same analysis as matplotlib's specgram(NFFT=512, noverlap=256, mode="magnitude")
+    spec_f, spec_t, spectra = generate_spectrogram(
+        impulse_responses, sample_rate, np.hanning(512), 512, 256, power=20
+    )
+    fall_f, fall_t, falls = generate_spectrogram(
+        impulse_responses, sample_rate, "blackmanharris", 32, 16
+    )
+
+    jobs = []
+    for spectrum, fall, title, save_path in zip(spectra, falls, titles, save_paths):
+        save_path = Path(save_path)
+        jobs.append(
+            (
+                plot_ir_spectrogram,
+                (spec_f, spec_t, spectrum, duration, title, save_path.with_suffix(".png")),
+            )
+        )
+        jobs.append(
+            (
+                plot_waterfall,
+                (
+                    *decimate_mesh(fall_f, fall_t, fall.T),
+                    save_path.with_name(save_path.stem + "_waterfall.png"),
+                ),
+            )
+        )
+    return jobs
+
+
+def _use_agg():
+    matplotlib.use("Agg", force=True)
+
+
+def _render(job):
+    plot, plot_args = job
+    plot(*plot_args)
+
+
+def render_plots(jobs, workers=None):
+    """
+    Draw (function, args) plot jobs in a pool of `workers` processes with the Agg
+    backend (default: one per CPU, at most one per job), or in this process if 0 or 1.
+    """
+    jobs = list(jobs)
+    if not jobs:
+        return
+    for save_path in {Path(job[1][-1]).parent for job in jobs}:
+        save_path.mkdir(parents=True, exist_ok=True)
+
+    workers = min(len(jobs), os.cpu_count() or 1) if workers is None else workers
+    if workers <= 1:
+        for job in jobs:
+            _render(job)
+        return
+
+    # Spawned workers do not inherit the state of the models (threads, CUDA) of this process
+    context = multiprocessing.get_context("spawn")
+    with ProcessPoolExecutor(workers, mp_context=context, initializer=_use_agg) as pool:
+        for _ in pool.map(_render, jobs):
+            pass
 
 
 def plot_rt60(T, energy_db, e_5db, est_rt60, rt60_tgt, file_name, args):
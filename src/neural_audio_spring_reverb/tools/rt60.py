@@ -1,14 +1,27 @@
+import csv
 import numpy as np
 
+from datetime import datetime
 from pathlib import Path
+from scipy import fft, signal
+from scipy.io import wavfile
 from neural_audio_spring_reverb.tools.plotter import plot_rt60
+from neural_audio_spring_reverb.tools.signal_cache import (
+    cached_signal,
+    configure_signal_cache,
+)
 
 eps = 1e-15
 
+# Decay ranges (start dB, end dB) of the least-squares fits, extrapolated to 60 dB
+DECAY_RANGES = {"edt": (0.0, -10.0), "t20": (-5.0, -25.0), "t30": (-5.0, -35.0)}
+
 
 def measure_rt60(args):
     """
     RT 60 measurement using Schroeder's method.
+    If the input is a folder (default: AUDIO_DIR/IR_models), all its IRs are analysed
+    with `analyse_rt60_dir` instead.
 
     Arguments
     ----------
@@ -33,6 +46,9 @@ def measure_rt60(args):
     .. [1] M. R. Schroeder, "New Method of Measuring Reverberation Time,"
         J. Acoust. Soc. Am., vol. 37, no. 3, pp. 409-412, Mar. 1968.
     """
+    if args.input is None or Path(args.input).is_dir():
+        return analyse_rt60_dir(args)
+
     print("RT60 measurement and plotting")
 
     fs, data = wavfile.read(args.input)
@@ -89,3 +105,199 @@ def measure_rt60(args):
         print(f"The RT60 is {est_rt60 * 1000:.0f} ms")
 
     return est_rt60
+
+
+def schroeder_decay(h: np.ndarray) -> np.ndarray:
+    """
+    Energy decay curves in dB (0 dB at the start) of a batch of IRs, by backward
+    integration along the last axis.
+    """
+    power = h.astype(np.float64) ** 2
+    energy = np.cumsum(power[..., ::-1], axis=-1)[..., ::-1]
+    energy /= np.maximum(energy[..., :1], eps)
+    return 10 * np.log10(np.maximum(energy, eps))
+
+
+def fit_decay_times(edc_db: np.ndarray, sample_rate: int) -> dict:
+    """
+    EDT, T20 and T30 of a batch of decay curves, by least-squares line fits of the
+    samples in each decay range. NaN where the curve does not cover the range.
+
+    The curves are non-increasing, so each range is a contiguous run of samples and the
+    sums of the normal equations come from the same two prefix sums for all ranges.
+
+    Returns:
+        dict: name -> array of decay times in seconds, shape edc_db.shape[:-1].
+    """
+    length = edc_db.shape[-1]
+    t = np.arange(length) / sample_rate
+    zero = np.zeros(edc_db.shape[:-1] + (1,))
+    cum_y = np.concatenate([zero, np.cumsum(edc_db, axis=-1)], axis=-1)
+    cum_ty = np.concatenate([zero, np.cumsum(edc_db * t, axis=-1)], axis=-1)
+
+    def range_sum(cum, i0, i1):
+        return (
+            np.take_along_axis(cum, i1[..., None], axis=-1)
+            - np.take_along_axis(cum, i0[..., None], axis=-1)
+        )[..., 0]
+
+    results = {}
+    for name, (start_db, end_db) in DECAY_RANGES.items():
+        # Samples [i0, i1) are in the range
+        i0 = (edc_db > start_db).sum(axis=-1)
+        i1 = (edc_db >= end_db).sum(axis=-1)
+        n = i1 - i0
+        sum_y = range_sum(cum_y, i0, i1)
+        sum_ty = range_sum(cum_ty, i0, i1)
+        # Closed forms of the sums of t and t^2 over the samples i0 .. i1 - 1
+        k = np.arange(length + 1, dtype=np.float64)
+        sum_t = (k[i1] * (k[i1] - 1) - k[i0] * (k[i0] - 1)) / 2 / sample_rate
+        sum_tt = (
+            (k[i1] - 1) * k[i1] * (2 * k[i1] - 1) - (k[i0] - 1) * k[i0] * (2 * k[i0] - 1)
+        ) / 6 / sample_rate**2
+
+        denom = n * sum_tt - sum_t**2
+        with np.errstate(divide="ignore", invalid="ignore"):
+            slope = (n * sum_ty - sum_t * sum_y) / denom
+            decay_time = -60.0 / slope
+        # The curve must reach the end of the range
+        valid = (n > 2) & (i1 < length) & (slope < 0)
+        results[name] = np.where(valid, decay_time, np.nan)
+    return results
+
+
+def band_centers(sample_rate: int, fraction: int = 1) -> np.ndarray:
+    """Center frequencies (base 2, 1 kHz reference) of the 1/fraction octave bands
+    between 31.5 Hz and the Nyquist frequency."""
+    k = np.arange(-5 * fraction, 5 * fraction + 1)
+    centers = 1000.0 * 2.0 ** (k / fraction)
+    upper = centers * 2 ** (1 / (2 * fraction))
+    return centers[(centers >= 31.5 * 2 ** (-1 / (2 * fraction))) & (upper < sample_rate / 2)]
+
+
+@cached_signal
+def band_responses(sample_rate: int, fraction: int, n_bins: int, order: int = 3):
+    """Magnitude responses [B, n_bins] of the Butterworth band-pass filters of each band
+    (see band_centers), stored in the measurement signal cache."""
+    centers = band_centers(sample_rate, fraction)
+    responses = np.empty((len(centers), n_bins), dtype=np.float32)
+    for i, fc in enumerate(centers):
+        edges = fc * 2 ** (np.array([-1, 1]) / (2 * fraction))
+        sos = signal.butter(order, edges, btype="bandpass", fs=sample_rate, output="sos")
+        _, response = signal.sosfreqz(sos, worN=n_bins, fs=sample_rate)
+        responses[i] = np.abs(response)
+    return responses
+
+
+def filterbank(h: np.ndarray, sample_rate: int, fraction: int = 1):
+    """
+    Split a batch of IRs [N, T] into 1/fraction octave bands [N, B, T] in a single pass:
+    the IRs are transformed once and multiplied by the magnitude responses of all the
+    Butterworth band-pass filters (zero phase), then transformed back.
+    """
+    n_fft = fft.next_fast_len(2 * h.shape[-1], real=True)  # no circular wrap of the tails
+    spectrum = fft.rfft(h.astype(np.float32), n=n_fft, axis=-1, workers=-1)
+    centers = band_centers(sample_rate, fraction)
+    responses = band_responses(sample_rate, fraction, spectrum.shape[-1])
+    bands = fft.irfft(spectrum[:, None, :] * responses, n=n_fft, axis=-1, workers=-1)
+    return centers, bands[..., : h.shape[-1]]
+
+
+def load_irs(paths):
+    """IRs grouped by sample rate: sample_rate -> (names, [N, T] array zero-padded to the longest)."""
+    groups = {}
+    for path in paths:
+        sample_rate, data = wavfile.read(path)
+        if data.ndim > 1:
+            data = data[:, 0]
+        if np.issubdtype(data.dtype, np.integer):
+            data = data / np.iinfo(data.dtype).max
+        groups.setdefault(sample_rate, []).append((Path(path).stem, data.astype(np.float32)))
+
+    batches = {}
+    for sample_rate, items in groups.items():
+        length = max(len(data) for _, data in items)
+        h = np.zeros((len(items), length), dtype=np.float32)
+        for i, (_, data) in enumerate(items):
+            h[i, : len(data)] = data
+        batches[sample_rate] = ([name for name, _ in items], h)
+    return batches
+
+
+def align_onsets(h: np.ndarray) -> np.ndarray:
+    """Shift each IR of a batch [N, T] to start at its peak (the measured IRs of the
+    models are centered in the deconvolution output), zero-padded at the end."""
+    onsets = np.abs(h).argmax(axis=-1)
+    idx = np.arange(h.shape[-1]) + onsets[:, None]
+    valid = idx < h.shape[-1]
+    aligned = np.take_along_axis(h, np.minimum(idx, h.shape[-1] - 1), axis=-1)
+    return np.where(valid, aligned, 0.0).astype(h.dtype)
+
+
+def analyse_rt60(h: np.ndarray, sample_rate: int, fraction: int = 1, max_bytes: float = 2**28):
+    """
+    Broadband and per-band EDT, T20 and T30 of a batch of IRs [N, T], from their peak.
+
+    Returns:
+        list: one dict per IR and band ("broadband" or the center frequency).
+    """
+    h = align_onsets(h)
+    broadband = fit_decay_times(schroeder_decay(h), sample_rate)
+    rows = [
+        [{"band": "broadband", **{k: v[i] for k, v in broadband.items()}}]
+        for i in range(len(h))
+    ]
+    # The band signals are large ([N, B, 2T]), the IRs are filtered by chunks of max_bytes
+    band_bytes = len(band_centers(sample_rate, fraction)) * 2 * h.shape[-1] * 8
+    chunk = max(1, int(max_bytes // band_bytes))
+    for start in range(0, len(h), chunk):
+        centers, bands = filterbank(h[start : start + chunk], sample_rate, fraction)
+        times = fit_decay_times(schroeder_decay(bands), sample_rate)
+        for i in range(bands.shape[0]):
+            for b, fc in enumerate(centers):
+                rows[start + i].append(
+                    {"band": f"{fc:.0f}", **{k: v[i, b] for k, v in times.items()}}
+                )
+    return rows
+
+
+def analyse_rt60_dir(args):
+    """
+    RT60 analysis of every .wav IR of a folder (-i, default: AUDIO_DIR/IR_models).
+
+    The IRs of the same sample rate are processed as one batch: broadband and octave
+    (--bands octave) or third-octave (--bands third) EDT, T20 and T30. The results are
+    saved as `rt60-TIMESTAMP.csv` in the log folder.
+    """
+    ir_dir = Path(args.input) if args.input is not None else Path(args.audio_dir) / "IR_models"
+    paths = sorted(ir_dir.glob("*.wav"))
+    configure_signal_cache(args)
+    if not paths:
+        raise ValueError(f"No .wav file found in {ir_dir}")
+    fraction = 3 if getattr(args, "bands", "octave") == "third" else 1
+    print(f"RT60 analysis of {len(paths)} impulse responses in {ir_dir}")
+
+    rows = []
+    for sample_rate, (names, h) in load_irs(paths).items():
+        for name, ir_rows in zip(names, analyse_rt60(h, sample_rate, fraction)):
+            for row in ir_rows:
+                rows.append({"file": name, "sample_rate": sample_rate, **row})
+
+    timestamp = datetime.now().strftime("%Y%m%d-%H%M%S")
+    csv_path = Path(args.log_dir) / f"rt60-{timestamp}.csv"
+    csv_path.parent.mkdir(parents=True, exist_ok=True)
+    with open(csv_path, "w", newline="") as f:
+        writer = csv.DictWriter(f, fieldnames=list(rows[0]))
+        writer.writeheader()
+        writer.writerows(rows)
+
+    header = f"{'file':<48} {'EDT':>7} {'T20':>7} {'T30':>7}"
+    print(header)
+    print("-" * len(header))
+    for row in rows:
+        if row["band"] == "broadband":
+            print(
+                f"{row['file']:<48} {row['edt']:>7.3f} {row['t20']:>7.3f} {row['t30']:>7.3f}"
+            )
+    print(f"Results saved to {csv_path}")
+    return rows
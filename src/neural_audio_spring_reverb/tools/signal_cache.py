@@ -0,0 +1,149 @@
+import functools
+import hashlib
+import inspect
+import json
+import os
+import tempfile
+import numpy as np
+from pathlib import Path
+from typing import Optional
+
+"""
+Measurement signal cache
+========================
+Generated measurement signals (sweeps, inverse filters, test tones, filterbank
+responses) are stored as .npy files named by the generator and a hash of its
+parameters, and read back memory-mapped and read-only.
+
+The folder is bounded in size: when a new signal is written, the least recently
+used files (by modification time, refreshed when a file is opened) are removed
+until the total size is below `max_bytes`.
+
+The cache is shared by the ir, rt60, distortion and benchmark actions, which configure
+its folder with `configure_signal_cache(args)`: CACHE_DIR/signals, or DATA_DIR/cache/signals.
+Until it is configured, the generators are called directly and nothing is written.
+
+The generators decorated with `cached_signal` return writable copies of the cached
+arrays, the memory maps are never handed out.
+"""
+
+DEFAULT_MAX_BYTES = 512 * 2**20
+
+
+class SignalCache:
+    """
+    Parameters:
+        cache_dir (str or Path): Folder of the .npy files.
+        max_bytes (int): Size bound of the folder.
+    """
+
+    def __init__(self, cache_dir, max_bytes=DEFAULT_MAX_BYTES):
+        self.cache_dir = Path(cache_dir)
+        self.max_bytes = int(max_bytes)
+        self._open = {}
+
+    def path(self, name, params) -> Path:
+        spec = json.dumps(params, sort_keys=True, default=repr)
+        key = hashlib.sha1(f"{name}|{spec}".encode()).hexdigest()[:16]
+        return self.cache_dir / f"{name}-{key}.npy"
+
+    def get(self, name, params, generate) -> np.ndarray:
+        """
+        The signal of a generator for the given parameters, generated and written on the
+        first call.
+
+        Parameters:
+            name (str): Generator name, prefix of the file.
+            params (dict): Parameters of the generator, hashed into the file name.
+            generate (callable): Called without arguments to build the array.
+
+        Returns:
+            np.ndarray: Read-only memory-mapped array.
+        """
+        path = self.path(name, params)
+        if path in self._open:
+            return self._open[path]
+
+        try:
+            array = np.load(path, mmap_mode="r")
+            os.utime(path)  # most recently used
+        except (FileNotFoundError, ValueError):
+            array = self._write(path, np.asarray(generate()))
+
+        self._open[path] = array
+        return array
+
+    def _write(self, path, array) -> np.ndarray:
+        self.cache_dir.mkdir(parents=True, exist_ok=True)
+        # Written next to the cache and renamed, a partial file is never read
+        fd, tmp_path = tempfile.mkstemp(suffix=".npy", dir=self.cache_dir)
+        with os.fdopen(fd, "wb") as f:
+            np.save(f, array)
+        os.replace(tmp_path, path)
+        self.evict(keep=path)
+        return np.load(path, mmap_mode="r")
+
+    def evict(self, keep=None) -> None:
+        """Remove the least recently used files until the folder fits in max_bytes."""
+        files = []
+        for path in self.cache_dir.glob("*.npy"):
+            try:
+                stat = path.stat()
+            except FileNotFoundError:  # removed by another process
+                continue
+            files.append((stat.st_mtime, stat.st_size, path))
+
+        total = sum(size for _, size, _ in files)
+        for _, size, path in sorted(files):
+            if total <= self.max_bytes:
+                break
+            if path == keep:
+                continue
+            path.unlink(missing_ok=True)
+            self._open.pop(path, None)
+            total -= size
+
+    def clear(self) -> None:
+        for path in self.cache_dir.glob("*.npy"):
+            path.unlink(missing_ok=True)
+        self._open = {}
+
+
+_cache = None
+
+
+def get_signal_cache() -> Optional[SignalCache]:
+    """The shared cache, None until `configure_signal_cache` is called."""
+    return _cache
+
+
+def configure_signal_cache(args) -> SignalCache:
+    """Point the shared cache to the folder and size bound of the CLI arguments."""
+    global _cache
+    cache_dir = getattr(args, "cache_dir", None)
+    cache_root = Path(cache_dir or Path(getattr(args, "data_dir", "data")) / "cache")
+    max_bytes = getattr(args, "signal_cache_mb", None)
+    max_bytes = DEFAULT_MAX_BYTES if max_bytes is None else max_bytes * 2**20
+    _cache = SignalCache(cache_root / "signals", max_bytes)
+    return _cache
+
+
+def cached_signal(generate):
+    """Decorator: the results of a signal generator go through the shared cache, if
+    configured. The result is a writable array owned by the caller."""
+    signature = inspect.signature(generate)
+
+    @functools.wraps(generate)
+    def wrapper(*args, **kwargs):
+        cache = get_signal_cache()
+        if cache is None:
+            return generate(*args, **kwargs)
+        # Same key for positional, keyword and default arguments
+        bound = signature.bind(*args, **kwargs)
+        bound.apply_defaults()
+        array = cache.get(
+            generate.__name__, dict(bound.arguments), lambda: generate(*args, **kwargs)
+        )
+        return np.array(array, copy=True)
+
+    return wrapper
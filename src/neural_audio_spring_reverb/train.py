@@ -1,10 +1,10 @@
 import os
+import contextlib
 import torch
 import torchaudio
 import torchaudio.functional as F
 import auraloss
 import numpy as np
-import wandb
 
 from datetime import datetime
 from pathlib import Path
@@ -12,17 +12,61 @@ from pathlib import Path
 from .data.egfxset import load_egfxset
 from .data.springset import load_springset
 from .data.customset import load_customset
+from .data.cache import dataset_cache_dir
+from .data.segments import make_segment_loader
 from .networks.model_utils import (
     initialize_model,
     save_model_checkpoint,
     load_model_checkpoint,
     parse_config,
 )
+from .utils.telemetry import MetricsAccumulator, make_sink
+from .distributed import (
+    is_distributed,
+    get_rank,
+    launch,
+    make_distributed_loader,
+    all_reduce_mean,
+)
+
+
+def get_amp_settings(config, device):
+    """
+    Mixed precision settings from the config key `amp`:
+        null / false: full precision
+        true: bf16 on CPU, fp16 on CUDA
+        "bf16" or "fp16": the given dtype (fp16 is only used on CUDA, bf16 otherwise)
+
+    Returns:
+        amp_dtype (torch.dtype or None): autocast dtype, None if disabled
+        use_scaler (bool): whether the loss must be scaled (fp16 only)
+    """
+    amp = config.get("amp", None)
+    if amp is None or amp is False:
+        return None, False
+
+    if amp is True:
+        amp = "fp16" if device.type == "cuda" else "bf16"
+    if amp not in ["bf16", "fp16"]:
+        raise ValueError(f"Unknown amp mode: {amp}, options are: bf16 or fp16")
+    if amp == "fp16" and device.type != "cuda":
+        print("fp16 autocast needs CUDA, using bf16")
+        amp = "bf16"
+
+    amp_dtype = torch.float16 if amp == "fp16" else torch.bfloat16
+    return amp_dtype, amp_dtype == torch.float16
 
 
 def train_model(args):
+    # Spawn the workers, each one runs train_model inside the process group
+    if getattr(args, "distributed", False) and not is_distributed():
+        launch(train_model, args, args.world_size)
+        return
+
+    distributed = is_distributed()
+    main_process = get_rank() == 0
+
     torch.cuda.empty_cache()
-    torch.autograd.set_detect_anomaly(True)
 
     # If there's a checkpoint, resume training and load it first
     if args.checkpoint is not None:
@@ -82,6 +126,20 @@ def train_model(args):
     
 
 
+    # Anomaly detection slows down every backward pass, only for debugging
+    torch.autograd.set_detect_anomaly(bool(config.get("detect_anomaly", False)))
+
+    # Mixed precision and gradient accumulation
+    amp_dtype, use_scaler = get_amp_settings(config, args.device)
+    scaler = torch.cuda.amp.GradScaler(enabled=use_scaler)
+    grad_accum_steps = int(config.get("grad_accum_steps", 1) or 1)
+    if amp_dtype is not None:
+        print(f"Using mixed precision: {amp_dtype}")
+    if grad_accum_steps > 1:
+        print(
+            f"Accumulating gradients over {grad_accum_steps} batches (effective batch size: {grad_accum_steps * config['batch_size']})"
+        )
+
     # Get the timestamp and label for the run
     timestamp = datetime.now().strftime("%Y%m%d-%H%M%S")
     sr_tag = str(int(config["sample_rate"] / 1000)) + "kHz"
@@ -114,12 +172,19 @@ def train_model(args):
         f"Using losses: {criterion1.__class__.__name__} and {criterion2.__class__.__name__}"
     )
 
+    # Every worker must draw the same train/valid split
+    split_seed = config.get("split_seed", 42) if distributed else None
+    if split_seed is not None:
+        config["split_seed"] = split_seed  # saved with the checkpoint for the evaluation
+
     # Load data
     if config["dataset"] == "egfxset":
         train_loader, valid_loader, _ = load_egfxset(
             args.data_dir,
             batch_size=config["batch_size"],
             num_workers=config["num_workers"],
+            cache_dir=dataset_cache_dir(args),
+            split_seed=split_seed,
         )
 
     elif config["dataset"] == "springset":
@@ -127,16 +192,61 @@ def train_model(args):
             args.data_dir,
             batch_size=config["batch_size"],
             num_workers=config["num_workers"],
+            lazy=args.lazy_load,
+            read_ahead=args.read_ahead,
+            split_seed=split_seed,
         )
     elif config["dataset"] == "customset":
         train_loader, valid_loader, _ = load_customset(
             args.data_dir,
             batch_size=config["batch_size"],
             num_workers=config["num_workers"],
+            cache_dir=dataset_cache_dir(args),
+            split_seed=split_seed,
         )
     else:
         raise ValueError("Dataset not found, options are: egfxset or springset")
 
+    # Distillation: the training targets include the cached teacher outputs
+    segment_length = config.get("segment_length", None)
+    distill_alpha = None
+    if getattr(args, "teacher", None) is not None:
+        if segment_length is not None:
+            raise ValueError("segment_length is not supported with distillation")
+        from .distill import make_distill_loader
+
+        train_loader = make_distill_loader(train_loader, args, config)
+        distill_alpha = float(config.get("distill_alpha", 1.0))
+        print(f"Distillation target: {distill_alpha} teacher + {1 - distill_alpha} wet")
+
+    # Random segments instead of the fixed prefix of each file
+    warmup = 0
+    if segment_length is not None:
+        # The receptive field primes the model and is left out of the loss,
+        # as much of it as fits in the shortest item
+        warmup = config.get("segment_warmup", None)
+        cap_warmup = warmup is None
+        if warmup is None:
+            warmup = rf or 0
+        train_loader = make_segment_loader(
+            train_loader,
+            segment_length,
+            segments_per_epoch=config.get("segments_per_epoch", None),
+            warmup=warmup,
+            cap_warmup=cap_warmup,
+        )
+        warmup = train_loader.dataset.warmup
+
+    # Each worker gets its own shard of the batches, gradients are averaged by DDP
+    net = model
+    if distributed:
+        train_loader = make_distributed_loader(train_loader, shuffle=True)
+        valid_loader = make_distributed_loader(valid_loader, shuffle=False)
+        net = torch.nn.parallel.DistributedDataParallel(
+            model,
+            device_ids=[args.device] if args.device.type == "cuda" else None,
+        )
+
     # Initialize minimum validation loss with infinity
     if config["min_valid_loss"] is None:
         min_valid_loss = np.inf
@@ -162,62 +272,110 @@ def train_model(args):
     avg_train_loss = np.inf
     avg_valid_loss = np.inf
 
-    # Initialize WandB logger
-    run = wandb.init(
-        project="neural-audio-spring-reverb",
-        name=label,
-        job_type="train",
-        config=config,
+    # Initialize the logger (wandb, jsonl, csv or none), flushed in the background
+    # With --distributed only the first worker logs
+    sink = make_sink(
+        config.get("metrics_sink", "wandb") if main_process else "none",
+        label,
+        "train",
+        config,
+        args.log_dir,
     )
+    metrics = MetricsAccumulator(sink, interval=config.get("metrics_interval", 50))
 
     try:
 
         for epoch in range(current_epoch, max_epochs):
-            train_loss = 0.0
+            # Kept on the device, synchronized once per epoch
+            train_loss = torch.zeros((), device=args.device)
 
             model.train()
-            for batch_idx, (dry, wet) in enumerate(train_loader):
+            if distributed:
+                train_loader.sampler.set_epoch(epoch)
+            optimizer.zero_grad()
+            for batch_idx, (dry, wet, *teacher) in enumerate(train_loader):
                 # print(f"Epoch {epoch}: Batch {batch_idx}/{len(train_loader)}", end="\r")
                 # input shape: [batch, channel, lenght]
                 input = dry.to(args.device)
                 target = wet.to(args.device)
+                if distill_alpha is not None:
+                    target = (
+                        distill_alpha * teacher[0].to(args.device)
+                        + (1 - distill_alpha) * target
+                    )
+
+                # Update every grad_accum_steps batches and at the end of the epoch
+                update = (batch_idx + 1) % grad_accum_steps == 0 or batch_idx + 1 == len(
+                    train_loader
+                )
+                # Gradients are only all-reduced between workers before an update
+                sync = (
+                    net.no_sync()
+                    if distributed and not update
+                    else contextlib.nullcontext()
+                )
 
-                pred = model(input, c)
+                with sync:
+                    with torch.autocast(
+                        device_type=args.device.type,
+                        dtype=amp_dtype,
+                        enabled=amp_dtype is not None,
+                    ):
+                        pred = net(input, c)
+                    # Losses (STFT included) are computed in full precision
+                    pred = pred.float()
+
+                    # Drop the warm-up region of the segments
+                    if warmup > 0:
+                        pred = pred[..., warmup:]
+                        target = target[..., warmup:]
 
-                # Pre-emphasis filter
-                pre_emphasis = config.get("pre_emphasis", None)
-                if pre_emphasis is not None:
-                    pred = F.preemphasis(pred, float(pre_emphasis))
+                    # Pre-emphasis filter
+                    pre_emphasis = config.get("pre_emphasis", None)
+                    if pre_emphasis is not None:
+                        pred = F.preemphasis(pred, float(pre_emphasis))
 
-                loss1 = criterion1(pred, target)
+                    loss1 = criterion1(pred, target)
 
-                if config["criterion2"] is not None:
-                    loss2 = criterion2(pred, target)
-                else:
-                    loss2 = 0.0
+                    if config["criterion2"] is not None:
+                        loss2 = criterion2(pred, target)
+                    else:
+                        loss2 = 0.0
 
-                loss = loss1 + loss2
+                    loss = loss1 + loss2
+
+                    scaler.scale(loss / grad_accum_steps).backward()
 
-                loss.backward()
-                optimizer.step()
-                optimizer.zero_grad()
+                if update:
+                    scaler.step(optimizer)
+                    scaler.update()
+                    optimizer.zero_grad()
 
-                train_loss += loss.item()
+                train_loss += loss.detach()
 
-                lr = optimizer.param_groups[0]["lr"]
-                wandb.log({"train/learning_rate": lr}, step=current_epoch)
+                metrics.add("train/loss_batch", loss)
+                metrics.add("train/learning_rate", optimizer.param_groups[0]["lr"])
+                metrics.step(current_epoch)
 
-            avg_train_loss = train_loss / len(train_loader)
-            wandb.log({"train/loss_train": avg_train_loss}, step=current_epoch)
+            avg_train_loss = all_reduce_mean(
+                train_loss.item() / len(train_loader), args.device
+            )
+            metrics.log({"train/loss_train": avg_train_loss}, current_epoch)
 
             model.eval()
-            valid_loss = 0.0
+            valid_loss = torch.zeros((), device=args.device)
             with torch.no_grad():
                 for step, (dry, wet) in enumerate(valid_loader):
                     input = dry.to(args.device)
                     target = wet.to(args.device)
 
-                    pred = model(input, c)
+                    with torch.autocast(
+                        device_type=args.device.type,
+                        dtype=amp_dtype,
+                        enabled=amp_dtype is not None,
+                    ):
+                        pred = model(input, c)
+                    pred = pred.float()
 
                     # Pre-emphasis filter
                     pre_emphasis = config.get("pre_emphasis", None)
@@ -233,10 +391,13 @@ def train_model(args):
 
                     loss = loss1 + loss2
 
-                    valid_loss += loss.item()
-                avg_valid_loss = valid_loss / len(valid_loader)
+                    valid_loss += loss
+                # Same value on every worker: scheduler and early stopping stay in sync
+                avg_valid_loss = all_reduce_mean(
+                    valid_loss.item() / len(valid_loader), args.device
+                )
 
-            wandb.log({"train/loss_valid": avg_valid_loss}, step=current_epoch)
+            metrics.log({"train/loss_valid": avg_valid_loss}, current_epoch)
 
             scheduler.step(avg_valid_loss)
 
@@ -247,16 +408,17 @@ def train_model(args):
                 )
                 min_valid_loss = avg_valid_loss
                 patience_count = 0
-                save_model_checkpoint(
-                    model,
-                    config,
-                    optimizer,
-                    scheduler,
-                    current_epoch,
-                    label,
-                    min_valid_loss,
-                    args,
-                )
+                if main_process:
+                    save_model_checkpoint(
+                        model,
+                        config,
+                        optimizer,
+                        scheduler,
+                        current_epoch,
+                        label,
+                        min_valid_loss,
+                        args,
+                    )
             else:
                 patience_count += 1
                 # if config['early_stop_patience'] is not None and patience_count >= config['early_stop_patience']:
@@ -267,7 +429,7 @@ def train_model(args):
                     break
 
             current_epoch += 1
-            wandb.config.update({"current_epoch": current_epoch}, allow_val_change=True)
+            metrics.update_config({"current_epoch": current_epoch})
 
     except KeyboardInterrupt:
         print("\nTraining manually stopped by user. Processing the results...")
@@ -275,8 +437,10 @@ def train_model(args):
     finally:
         final_train_loss = float(avg_train_loss)
         final_valid_loss = float(avg_valid_loss)
-        wandb.log({"train/final": final_train_loss}, step=current_epoch)
-        wandb.log({"train/final_valid": final_valid_loss}, step=current_epoch)
+        metrics.log(
+            {"train/final": final_train_loss, "train/final_valid": final_valid_loss},
+            current_epoch,
+        )
 
         # if pre_emphasis is not None:
         #     pred = F.deemphasis(pred, float(pre_emphasis))
@@ -298,4 +462,11 @@ def train_model(args):
         # save_target = f"{args.audio_dir}/train/targ-{label}.wav"
         # torchaudio.save(save_target, target, sample_rate=config["sample_rate"], bits_per_sample=config["bit_depth"])
 
-        wandb.finish()
+        metrics.close(current_epoch)
+
+    return {
+        "label": label,
+        "min_valid_loss": float(min_valid_loss),
+        "params": params,
+        "epochs": current_epoch,
+    }
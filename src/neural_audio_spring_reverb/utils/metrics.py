@@ -0,0 +1,248 @@
+import torch
+import torch.nn.functional as F
+
+from collections import OrderedDict
+
+"""
+Evaluation metrics
+==================
+All the metrics of a batch are computed in one pass:
+    - mae, esr, dc: time domain, same definitions as torch.nn.L1Loss and
+      auraloss.time.ESRLoss / DCLoss;
+    - mrstft: perceptually weighted mel multi-resolution STFT loss, same definition as
+      auraloss.freq.MultiResolutionSTFTLoss(scale="mel", perceptual_weighting=True).
+      The A-weighting filter is applied once to the prediction and the target, and each
+      resolution computes a single STFT shared by the spectral convergence and the log
+      magnitude terms.
+The scores are accumulated on the device and copied to the host once, by `compute()`.
+The mel spectra of the targets are cached by batch key: evaluating several models (or
+the same model again) on the same test set computes the target STFTs only once. The
+cache is kept on the CPU, bounded in size, and drops the least recently used batches.
+"""
+
+METRICS = ["mae", "esr", "dc", "mrstft"]
+
+
+class MetricEngine:
+    """
+    Parameters:
+        sample_rate (int): Sample rate of the evaluated audio.
+        metrics (list, optional): Names of the metrics, from METRICS.
+        fft_sizes, hop_sizes, win_lengths (list, optional): STFT resolutions of mrstft.
+        n_mels (int, optional): Mel bands of mrstft.
+        perceptual_weighting (bool, optional): A-weighting before the STFTs.
+        cache_targets (bool, optional): Keep the target spectra of the batch keys.
+        max_cache_mb (float, optional): Size bound of the target spectra cache.
+        eps (float, optional): Same epsilon as auraloss.
+    """
+
+    def __init__(
+        self,
+        sample_rate,
+        metrics=None,
+        fft_sizes=(1024, 2048, 8192),
+        hop_sizes=(256, 512, 2048),
+        win_lengths=(1024, 2048, 8192),
+        n_mels=128,
+        perceptual_weighting=True,
+        cache_targets=True,
+        max_cache_mb=512,
+        eps=1e-8,
+    ):
+        self.metrics = list(metrics) if metrics is not None else list(METRICS)
+        unknown = set(self.metrics) - set(METRICS)
+        if unknown:
+            raise ValueError(f"Unknown metrics: {sorted(unknown)}, options are: {METRICS}")
+
+        self.sample_rate = sample_rate
+        self.resolutions = list(zip(fft_sizes, hop_sizes, win_lengths))
+        self.n_mels = n_mels
+        self.perceptual_weighting = perceptual_weighting
+        self.cache_targets = cache_targets
+        self.max_cache_bytes = int(max_cache_mb * 2**20)
+        self.eps = eps
+
+        self._fir = None
+        self._windows = {}
+        self._filterbanks = {}
+        self._target_cache = OrderedDict()
+        self._cache_bytes = 0
+        self.reset()
+
+    def reset(self, group=None):
+        """Clear the accumulated scores (of one group, or all)."""
+        if group is None:
+            self.sums = {}
+            self.counts = {}
+        else:
+            self.sums.pop(group, None)
+            self.counts.pop(group, None)
+
+    def clear_cache(self):
+        self._target_cache = OrderedDict()
+        self._cache_bytes = 0
+
+    def _cache_get(self, cache_key, device):
+        """Target spectra of a cached batch, moved to the device, or None."""
+        if cache_key not in self._target_cache:
+            return None
+        self._target_cache.move_to_end(cache_key)
+        spectra = []
+        for mag, norm in self._target_cache[cache_key]:
+            mag = mag.to(device, non_blocking=True)
+            spectra.append((mag, torch.log(mag), norm.to(device)))
+        return spectra
+
+    def _cache_put(self, cache_key, target_spectra):
+        """Keep the magnitudes and norms on the CPU, the log magnitudes are recomputed."""
+        entry = [(mag.cpu(), norm.cpu()) for mag, _, norm in target_spectra]
+        size = sum(mag.numel() * mag.element_size() for mag, _ in entry)
+        if size > self.max_cache_bytes:
+            return
+        self._target_cache[cache_key] = entry
+        self._cache_bytes += size
+        while self._cache_bytes > self.max_cache_bytes:
+            _, dropped = self._target_cache.popitem(last=False)
+            self._cache_bytes -= sum(mag.numel() * mag.element_size() for mag, _ in dropped)
+
+    # Constants, built once per device
+
+    def _aweighting(self, device):
+        if self._fir is None or self._fir.device != device:
+            from auraloss.perceptual import FIRFilter
+
+            taps = FIRFilter(filter_type="aw", fs=self.sample_rate).fir.weight.data
+            self._fir = taps.to(device)
+        return self._fir
+
+    def _window(self, win_length, device):
+        key = (win_length, device)
+        if key not in self._windows:
+            self._windows[key] = torch.hann_window(win_length, device=device)
+        return self._windows[key]
+
+    def _filterbank(self, fft_size, device):
+        key = (fft_size, device)
+        if key not in self._filterbanks:
+            import librosa
+
+            fb = librosa.filters.mel(
+                sr=self.sample_rate, n_fft=fft_size, n_mels=self.n_mels
+            )
+            self._filterbanks[key] = torch.tensor(fb, device=device)
+        return self._filterbanks[key]
+
+    # Spectra
+
+    def _weight(self, x):
+        """A-weighting of a [N, T] batch, as auraloss.perceptual.FIRFilter."""
+        if not self.perceptual_weighting:
+            return x
+        fir = self._aweighting(x.device)
+        return F.conv1d(x.unsqueeze(1), fir, padding=fir.size(-1) // 2).squeeze(1)
+
+    def _mel_spectra(self, x):
+        """Mel magnitude spectra [N, n_mels, frames] of a weighted [N, T] batch, per resolution."""
+        spectra = []
+        for fft_size, hop_size, win_length in self.resolutions:
+            spec = torch.stft(
+                x,
+                fft_size,
+                hop_size,
+                win_length,
+                self._window(win_length, x.device),
+                return_complex=True,
+            )
+            mag = torch.sqrt(torch.clamp(spec.real**2 + spec.imag**2, min=self.eps))
+            spectra.append(torch.matmul(self._filterbank(fft_size, x.device), mag))
+        return spectra
+
+    def _spectra(self, pred, target, key):
+        """Mel spectra of the prediction and of the target (cached by key)."""
+        pred = pred.reshape(-1, pred.size(-1))
+        target = target.reshape(-1, target.size(-1))
+
+        cache_key = None
+        if key is not None and self.cache_targets:
+            cache_key = (key, tuple(target.shape))
+            target_spectra = self._cache_get(cache_key, target.device)
+            if target_spectra is not None:
+                return self._mel_spectra(self._weight(pred)), target_spectra
+
+        # Prediction and target in a single filter and STFT call
+        both = self._mel_spectra(self._weight(torch.cat([pred, target])))
+        n = pred.size(0)
+        pred_spectra = [s[:n] for s in both]
+        # Everything the loss needs from the target: magnitude, log magnitude and norm
+        target_spectra = [
+            (s, torch.log(s), torch.linalg.vector_norm(s))
+            for s in (s[n:].clone() for s in both)
+        ]
+        if cache_key is not None:
+            self._cache_put(cache_key, target_spectra)
+        return pred_spectra, target_spectra
+
+    # Scores
+
+    @torch.no_grad()
+    def scores(self, pred, target, key=None):
+        """
+        Metrics of a batch, as 0-dim tensors on the device of the inputs.
+
+        Parameters:
+            pred, target (Tensor): [batch, channels, samples].
+            key (hashable, optional): Identifies the target batch (e.g. the test set and
+                the step in a loader without shuffling), used to cache its spectra.
+        """
+        pred = pred.float()
+        target = target.float()
+        results = {}
+
+        if "mae" in self.metrics:
+            results["mae"] = (pred - target).abs().mean()
+        if "esr" in self.metrics:
+            num = (target - pred).pow(2).sum(dim=-1)
+            denom = target.pow(2).sum(dim=-1) + self.eps
+            results["esr"] = (num / denom).mean()
+        if "dc" in self.metrics:
+            num = (target - pred).mean(dim=-1).pow(2)
+            denom = target.pow(2).mean(dim=-1) + self.eps
+            results["dc"] = (num / denom).mean()
+
+        if "mrstft" in self.metrics:
+            pred_spectra, target_spectra = self._spectra(pred, target, key)
+            total = torch.zeros((), device=pred.device)
+            for x_mag, (y_mag, y_log, y_norm) in zip(pred_spectra, target_spectra):
+                sc = torch.linalg.vector_norm(y_mag - x_mag) / y_norm
+                log_mag = F.l1_loss(torch.log(x_mag), y_log)
+                total = total + sc + log_mag
+            results["mrstft"] = total / len(self.resolutions)
+
+        return results
+
+    def update(self, pred, target, key=None, group=""):
+        """Add the metrics of a batch to the running sums of a group (e.g. a model)."""
+        sums = self.sums.setdefault(group, {})
+        for name, value in self.scores(pred, target, key).items():
+            sums[name] = sums[name] + value if name in sums else value
+        self.counts[group] = self.counts.get(group, 0) + 1
+
+    def compute(self, group=""):
+        """Mean of every metric over the batches of a group, with a single device sync."""
+        sums = self.sums.get(group, {})
+        if not sums:
+            return {}
+        names = list(sums)
+        values = torch.stack([sums[name] for name in names]).tolist()
+        return {name: value / self.counts[group] for name, value in zip(names, values)}
+
+
+_engines = {}
+
+
+def get_metric_engine(sample_rate, **kwargs):
+    """Engine shared by the evaluations of a process, so the target spectra are reused."""
+    key = (sample_rate, tuple(sorted(kwargs.items())))
+    if key not in _engines:
+        _engines[key] = MetricEngine(sample_rate, **kwargs)
+    return _engines[key]
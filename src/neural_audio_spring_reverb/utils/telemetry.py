@@ -0,0 +1,201 @@
+import csv
+import json
+import queue
+import threading
+import torch
+
+from pathlib import Path
+
+"""
+Training telemetry
+==================
+Metrics are accumulated as running sums on the device of the model, so the training
+loop never waits for a device sync or a logger call. Every `interval` steps the means
+are copied to the host without blocking and handed to a background thread, which
+writes them to the selected sink:
+    - wandb: Weights & Biases run
+    - jsonl: one JSON object per line in the log folder
+    - csv: one row per flush in the log folder
+    - none: discard
+"""
+
+
+class NullSink:
+    def log(self, metrics, step):
+        pass
+
+    def update_config(self, values):
+        pass
+
+    def finish(self):
+        pass
+
+
+class WandbSink(NullSink):
+    def __init__(self, name, job_type, config):
+        import wandb
+
+        self.wandb = wandb
+        self.run = wandb.init(
+            project="neural-audio-spring-reverb",
+            name=name,
+            job_type=job_type,
+            config=config,
+        )
+
+    def log(self, metrics, step):
+        self.wandb.log(metrics, step=step)
+
+    def update_config(self, values):
+        self.wandb.config.update(values, allow_val_change=True)
+
+    def finish(self):
+        self.wandb.finish()
+
+
+class JsonlSink(NullSink):
+    def __init__(self, file_path, config):
+        Path(file_path).parent.mkdir(parents=True, exist_ok=True)
+        self.file = open(file_path, "a")
+        self.write({"config": config})
+
+    def write(self, record):
+        self.file.write(json.dumps(record, default=str) + "\n")
+        self.file.flush()
+
+    def log(self, metrics, step):
+        self.write({"step": step, **metrics})
+
+    def update_config(self, values):
+        self.write({"config": values})
+
+    def finish(self):
+        self.file.close()
+
+
+class CsvSink(NullSink):
+    """Long format (step, metric, value): metrics can change between flushes."""
+
+    def __init__(self, file_path):
+        Path(file_path).parent.mkdir(parents=True, exist_ok=True)
+        self.file = open(file_path, "a", newline="")
+        self.writer = csv.writer(self.file)
+        if self.file.tell() == 0:
+            self.writer.writerow(["step", "metric", "value"])
+
+    def log(self, metrics, step):
+        for name, value in metrics.items():
+            self.writer.writerow([step, name, value])
+        self.file.flush()
+
+    def finish(self):
+        self.file.close()
+
+
+def make_sink(kind, label, job_type, config, log_dir):
+    if kind == "wandb":
+        return WandbSink(label, job_type, config)
+    elif kind == "jsonl":
+        return JsonlSink(Path(log_dir) / f"{label}.jsonl", config)
+    elif kind == "csv":
+        return CsvSink(Path(log_dir) / f"{label}.csv")
+    elif kind in [None, "none"]:
+        return NullSink()
+    else:
+        raise ValueError(f"Unknown metrics sink: {kind}, options are: wandb, jsonl, csv, none")
+
+
+class MetricsAccumulator:
+    """
+    Running sums of metrics kept on the device, flushed asynchronously to a sink.
+
+    Parameters:
+        sink: NullSink, WandbSink, JsonlSink or CsvSink.
+        interval (int): Number of calls to `step()` between two flushes.
+    """
+
+    def __init__(self, sink, interval=50):
+        self.sink = sink
+        self.interval = max(1, int(interval))
+        self.sums = {}
+        self.counts = {}
+        self.n_steps = 0
+
+        self.queue = queue.Queue()
+        self.worker = threading.Thread(target=self._run, daemon=True)
+        self.worker.start()
+
+    def add(self, name, value):
+        """Add a value (tensor or number) to the running sum of a metric."""
+        if isinstance(value, torch.Tensor):
+            value = value.detach()
+        if name in self.sums:
+            self.sums[name] = self.sums[name] + value
+            self.counts[name] += 1
+        else:
+            self.sums[name] = value
+            self.counts[name] = 1
+
+    def step(self, log_step):
+        """Count one training step, flush the means every `interval` steps."""
+        self.n_steps += 1
+        if self.n_steps % self.interval == 0:
+            self.flush(log_step)
+
+    def flush(self, log_step):
+        """Hand the current means to the sink without waiting for the device."""
+        if not self.sums:
+            return
+        names = list(self.sums)
+        tensors = [v for v in self.sums.values() if isinstance(v, torch.Tensor)]
+        device = tensors[0].device if tensors else torch.device("cpu")
+        values = torch.stack(
+            [
+                torch.as_tensor(
+                    self.sums[name] / self.counts[name],
+                    dtype=torch.float32,
+                    device=device,
+                ).reshape(())
+                for name in names
+            ]
+        )
+
+        event = None
+        if values.is_cuda:
+            values = values.to("cpu", non_blocking=True)
+            event = torch.cuda.Event()
+            event.record()
+
+        self.queue.put((names, values, event, log_step))
+        self.sums = {}
+        self.counts = {}
+
+    def log(self, metrics, log_step):
+        """Log already computed values (e.g. epoch means) through the background thread."""
+        self.queue.put((list(metrics), list(metrics.values()), None, log_step))
+
+    def update_config(self, values):
+        self.queue.put(("config", values, None, None))
+
+    def close(self, log_step=None):
+        """Flush what is left, wait for the sink and close it."""
+        if log_step is not None:
+            self.flush(log_step)
+        self.queue.put(None)
+        self.worker.join()
+        self.sink.finish()
+
+    def _run(self):
+        while True:
+            item = self.queue.get()
+            if item is None:
+                break
+            names, values, event, log_step = item
+            if names == "config":
+                self.sink.update_config(values)
+                continue
+            if event is not None:
+                event.synchronize()
+            if isinstance(values, torch.Tensor):
+                values = values.tolist()
+            self.sink.log(dict(zip(names, [float(v) for v in values])), log_step)
@@ -8,41 +8,7 @@ from neutone_sdk.utils import save_neutone_model
 from torch import Tensor
 from typing import Dict, List
 from .networks.model_utils import load_model_checkpoint
-from .networks.custom_layers import Conv1dCausal
-
-
-class PaddingCached(nn.Module):
-    """Cached padding for cached convolutions."""
-
-    def __init__(self, n_ch: int, padding: int) -> None:
-        super().__init__()
-        self.n_ch = n_ch
-        self.padding = padding
-        self.register_buffer("pad_buf", torch.zeros((1, n_ch, padding)))
-
-    def forward(self, x: Tensor) -> Tensor:
-        assert x.ndim == 3  # (batch_size, in_ch, samples)
-        bs = x.size(0)
-        if bs > self.pad_buf.size(0):  # Perform resizing once if batch size is not 1
-            self.pad_buf = self.pad_buf.repeat(bs, 1, 1)
-        x = torch.cat([self.pad_buf, x], dim=-1)  # concat input signal to the cache
-        self.pad_buf = x[..., -self.padding :]  # discard old cache
-        return x
-
-
-class Conv1dCached(nn.Module):  # Conv1d with cache
-    """Cached causal convolution for streaming."""
-
-    def __init__(self, convcausal: Conv1dCausal) -> None:
-        super().__init__()
-        padding = convcausal.padding  # input_len == output_len when stride=1
-        self.pad = PaddingCached(convcausal.in_channels, convcausal.padding)
-        self.conv = convcausal.conv
-
-    def forward(self, x: Tensor) -> Tensor:
-        x = self.pad(x)  # get (cached input + current input)
-        x = self.conv(x)
-        return x
+from .networks.custom_layers import Conv1dCausal, Conv1dCached, precompute_film
 
 
 def replace_modules(module):
@@ -57,6 +23,23 @@ def replace_modules(module):
             replace_modules(child)
 
 
+def script_model(model: nn.Module) -> torch.jit.ScriptModule:
+    """
+    Script a model for the plugin, on the CPU. The host does not run it under
+    torch.no_grad(): without gradients, the scripted blocks take their in-place
+    inference path.
+    """
+    model.eval().requires_grad_(False)
+
+    # FiLM coefficients are only recomputed when the knobs move
+    precompute_film(model)
+
+    # Replace all instances of Conv1dCausal with Conv1dCached
+    replace_modules(model)
+
+    return torch.jit.script(model.to("cpu"))
+
+
 class GCNModelWrapper(WaveformToWaveformBase):
     def get_model_name(self) -> str:
         return "GCN.NeuralSpringReverb"  # <- EDIT THIS
@@ -138,10 +121,7 @@ def wrap_model(args):
         raise FileNotFoundError("Checkpoint file not found")
 
     model, _, _, config, rf, params = load_model_checkpoint(args)
-    model.eval()
-
-    # Replace all instances of Conv1dCausal with Conv1dCached
-    replace_modules(model)
+    model = script_model(model)
 
     model_name = config["name"]
     destination_dir = Path(f"neutone_models/{model_name}")
@@ -150,7 +130,6 @@ def wrap_model(args):
         os.makedirs(destination_dir)
 
     # Export model to Neutone
-    model = torch.jit.script(model.to("cpu"))
     model_wrapper = GCNModelWrapper(model)
 
     # Call the export function
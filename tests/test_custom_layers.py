@@ -0,0 +1,78 @@
+import pytest
+import torch
+
+from pathlib import Path
+
+from neural_audio_spring_reverb.networks.custom_layers import (
+    FusedGatedAF,
+    precompute_film,
+)
+from neural_audio_spring_reverb.networks.model_utils import (
+    parse_config,
+    initialize_model,
+    get_condition,
+)
+
+CONFIGS = Path(__file__).resolve().parents[1] / "configs"
+
+
+def reference_gate(x, scale, shift, res):
+    z = x * scale + shift
+    n = x.size(1) // 2
+    return torch.tanh(z[:, :n]) * torch.sigmoid(z[:, n:]) + res
+
+
+@pytest.mark.parametrize("requires_grad", [False, True])
+def test_scripted_fused_gate(requires_grad):
+    gate = torch.jit.script(FusedGatedAF())
+    x = torch.randn(2, 8, 32, requires_grad=requires_grad)
+    scale = torch.randn(2, 8, 1)
+    shift = torch.randn(2, 8, 1)
+    res = torch.randn(2, 4, 32)
+
+    expected = reference_gate(x, scale, shift, res)
+    out = gate(x.clone() if not requires_grad else x, scale, shift, res)
+    torch.testing.assert_close(out, expected)
+    if requires_grad:
+        out.sum().backward()
+        assert x.grad is not None
+
+
+@pytest.mark.parametrize("config_path", ["kernel-3/gcn-3.yaml", "kernel-3/wavenet-3.yaml"])
+def test_scripted_model_with_grad(config_path):
+    torch.manual_seed(0)
+    config = parse_config(CONFIGS / config_path)
+    config["sample_rate"] = 16000  # set from the dataset in training
+    model, _, _ = initialize_model(torch.device("cpu"), config)
+    model.eval()
+    precompute_film(model)
+
+    c = get_condition(config, 1, "cpu")
+    x = torch.randn(1, 1, 1024) * 0.3
+    with torch.no_grad():
+        expected = model(x, c)
+    # Parameters still require grad, the scripted model must not reach the autograd path
+    scripted = torch.jit.script(model)
+    torch.testing.assert_close(scripted(x, c), expected, atol=1e-5, rtol=0)
+
+
+@pytest.mark.parametrize("config_path", ["kernel-3/gcn-3.yaml", "kernel-3/wavenet-3.yaml"])
+def test_film_training_step_under_autocast(config_path):
+    torch.manual_seed(0)
+    config = parse_config(CONFIGS / config_path)
+    config["sample_rate"] = 16000  # set from the dataset in training
+    model, _, _ = initialize_model(torch.device("cpu"), config)
+    model.train()
+
+    c = get_condition(config, 2, "cpu")
+    x = torch.randn(2, 1, 1024) * 0.3
+    with torch.autocast("cpu", dtype=torch.bfloat16):
+        y = model(x, c)
+    y.float().abs().mean().backward()
+
+    bns = [m for m in model.modules() if isinstance(m, torch.nn.BatchNorm1d)]
+    assert bns
+    for bn in bns:
+        assert bn.running_mean.dtype == torch.float32
+        assert torch.isfinite(bn.running_mean).all()
+        assert torch.isfinite(bn.running_var).all()
@@ -0,0 +1,47 @@
+import pytest
+import torch
+
+from pathlib import Path
+
+from neural_audio_spring_reverb.inference import render_chunked
+from neural_audio_spring_reverb.networks.model_utils import (
+    parse_config,
+    initialize_model,
+    get_condition,
+)
+
+CONFIGS = Path(__file__).resolve().parents[1] / "configs"
+
+
+def build_model(config_path):
+    torch.manual_seed(0)
+    config = parse_config(CONFIGS / config_path)
+    config["sample_rate"] = 16000  # set from the dataset in training
+    model, rf, _ = initialize_model(torch.device("cpu"), config)
+    return model.eval(), config, rf
+
+
+@pytest.mark.parametrize(
+    "config_path",
+    [
+        "kernel-3/gru-3.yaml",
+        "kernel-99/gru-99.yaml",
+        "kernel-3/lstm-3.yaml",
+        "kernel-3/tcn-3.yaml",
+        "kernel-99/gcn-99.yaml",
+    ],
+)
+@pytest.mark.parametrize("chunk_size", [32, 1000])
+def test_chunked_matches_single_pass(config_path, chunk_size):
+    model, config, rf = build_model(config_path)
+    recurrent = config["model_type"] in ["GRU", "LSTM"]
+    x = torch.randn(1, 1, 3000) * 0.3
+    c = get_condition(config, 1, "cpu")
+
+    with torch.no_grad():
+        full = model(x, c)
+        chunked = render_chunked(model, x, c, chunk_size, None if recurrent else rf)
+
+    # The GRU pooling sees zeros past the end of the chunked render instead of -inf
+    n = x.size(-1) - (config["kernel_size"] // 2 if config["model_type"] == "GRU" else 0)
+    torch.testing.assert_close(chunked[..., :n], full[..., :n], atol=1e-5, rtol=0)
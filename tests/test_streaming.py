@@ -0,0 +1,76 @@
+import pytest
+import torch
+
+from pathlib import Path
+
+from neural_audio_spring_reverb.networks.custom_layers import PaddingCached, set_conv_mode
+from neural_audio_spring_reverb.networks.model_utils import (
+    parse_config,
+    initialize_model,
+    get_condition,
+)
+from neural_audio_spring_reverb.streaming import StreamingProcessor
+
+CONFIGS = Path(__file__).resolve().parents[1] / "configs"
+
+
+def build_model(config_path):
+    torch.manual_seed(0)
+    config = parse_config(CONFIGS / config_path)
+    config["sample_rate"] = 16000  # set from the dataset in training
+    model, _, _ = initialize_model(torch.device("cpu"), config)
+    return model.eval(), config
+
+
+@pytest.mark.parametrize(
+    "config_path",
+    ["kernel-3/gru-3.yaml", "kernel-99/gru-99.yaml", "kernel-3/lstm-3.yaml"],
+)
+@pytest.mark.parametrize("block_size", [64, 512])
+def test_streaming_matches_offline(config_path, block_size):
+    model, config = build_model(config_path)
+    processor = StreamingProcessor(model, config, block_size=block_size)
+    x = torch.randn(1, 1, 4000) * 0.3
+    c = get_condition(config, 1, "cpu")
+
+    with torch.no_grad():
+        offline = model(x, c)
+    streamed = processor.process_signal(x)
+
+    # The last `latency` samples see zeros past the end instead of the -inf padding
+    n = x.size(-1) - processor.latency
+    torch.testing.assert_close(streamed[..., :n], offline[..., :n], atol=1e-5, rtol=0)
+
+
+@pytest.mark.parametrize(
+    "config_path",
+    [
+        "kernel-3/tcn-3.yaml",
+        "kernel-99/tcn-99.yaml",
+        "kernel-3/gcn-3.yaml",
+        "kernel-99/gcn-99.yaml",
+        "kernel-3/wavenet-3.yaml",
+        "kernel-99/wavenet-99.yaml",
+    ],
+)
+@pytest.mark.parametrize("conv_mode", ["direct", "fft"])
+def test_streaming_conv_matches_offline(config_path, conv_mode):
+    model, config = build_model(config_path)
+    set_conv_mode(model, conv_mode)
+    processor = StreamingProcessor(model, config, block_size=512)
+    x = torch.randn(1, 1, 3000) * 0.3  # the last block is partial
+    c = get_condition(config, 1, "cpu")
+
+    with torch.no_grad():
+        offline = model(x, c)
+    streamed = processor.process_signal(x)
+
+    assert processor.latency == 0
+    torch.testing.assert_close(streamed, offline, atol=1e-5, rtol=0)
+
+
+def test_padding_cached_without_padding():
+    pad = PaddingCached(n_ch=2, padding=0)
+    x = torch.randn(1, 2, 16)
+    assert torch.equal(pad(x), x)
+    assert torch.equal(pad(x), x)
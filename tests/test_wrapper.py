@@ -0,0 +1,37 @@
+import pytest
+import torch
+
+from pathlib import Path
+
+from neural_audio_spring_reverb.networks.model_utils import (
+    parse_config,
+    initialize_model,
+    get_condition,
+)
+
+pytest.importorskip("neutone_sdk")
+
+from neural_audio_spring_reverb.wrapper import script_model  # noqa: E402
+
+CONFIGS = Path(__file__).resolve().parents[1] / "configs"
+
+
+@pytest.mark.parametrize("config_path", ["kernel-3/gcn-3.yaml", "kernel-3/wavenet-3.yaml"])
+def test_scripted_model_runs_without_no_grad(config_path):
+    torch.manual_seed(0)
+    config = parse_config(CONFIGS / config_path)
+    config["sample_rate"] = 16000  # set from the dataset in training
+    model, _, _ = initialize_model(torch.device("cpu"), config)
+    model.eval()
+
+    c = get_condition(config, 1, "cpu")
+    x = torch.randn(1, 1, 1024) * 0.3
+    with torch.no_grad():
+        expected = model(x, c)
+
+    scripted = script_model(model)
+    assert not any(p.requires_grad for p in scripted.parameters())
+    # As a host calls it: grad mode on, cached convolutions starting from silence
+    out = scripted(x, c)
+    assert not out.requires_grad
+    torch.testing.assert_close(out, expected, atol=1e-5, rtol=0)